@@ -28,6 +28,7 @@ from nova import compute
 from nova import db
 from nova import exception
 from nova import flags
+from nova import heartbeat
 from nova import log as logging
 from nova import utils
 from nova.api.ec2 import ec2utils
@@ -62,21 +63,17 @@ def project_dict(project):
         return {}
 
 
-def host_dict(host, compute_service, instances, volume_service, volumes, now):
+def host_dict(host, compute_service, instances, volume_service, volumes):
     """Convert a host model object to a result dict"""
     rv = {'hostname': host, 'instance_count': len(instances),
           'volume_count': len(volumes)}
     if compute_service:
-        latest = compute_service['updated_at'] or compute_service['created_at']
-        delta = now - latest
-        if delta.seconds <= FLAGS.service_down_time:
+        if heartbeat.is_up(compute_service):
             rv['compute'] = 'up'
         else:
             rv['compute'] = 'down'
     if volume_service:
-        latest = volume_service['updated_at'] or volume_service['created_at']
-        delta = now - latest
-        if delta.seconds <= FLAGS.service_down_time:
+        if heartbeat.is_up(volume_service):
             rv['volume'] = 'up'
         else:
             rv['volume'] = 'down'
@@ -312,7 +309,6 @@ class AdminController(object):
             * Volume Count
         """
         services = db.service_get_all(context, False)
-        now = utils.utcnow()
         hosts = []
         rv = []
         for host in [service['host'] for service in services]:
@@ -329,8 +325,7 @@ class AdminController(object):
             if volume:
                 volume = volume[0]
             volumes = db.volume_get_all_by_host(context, host)
-            rv.append(host_dict(host, compute, instances, volume, volumes,
-                                now))
+            rv.append(host_dict(host, compute, instances, volume, volumes))
         return {'hosts': rv}
 
     def _provider_fw_rule_exists(self, context, rule):
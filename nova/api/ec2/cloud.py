@@ -39,6 +39,7 @@ from nova import crypto
 from nova import db
 from nova import exception
 from nova import flags
+from nova import heartbeat
 from nova import ipv6
 from nova import log as logging
 from nova import network
@@ -52,7 +53,6 @@ from nova.image import s3
 
 
 FLAGS = flags.FLAGS
-flags.DECLARE('service_down_time', 'nova.scheduler.driver')
 
 LOG = logging.getLogger("nova.api.cloud")
 
@@ -412,7 +412,6 @@ class CloudController(object):
                                         'zoneState': 'available'}]}
 
         services = db.service_get_all(context, False)
-        now = utils.utcnow()
         hosts = []
         for host in [service['host'] for service in services]:
             if not host in hosts:
@@ -423,8 +422,7 @@ class CloudController(object):
             hsvcs = [service for service in services \
                      if service['host'] == host]
             for svc in hsvcs:
-                delta = now - (svc['updated_at'] or svc['created_at'])
-                alive = (delta.seconds <= FLAGS.service_down_time)
+                alive = heartbeat.is_up(svc)
                 art = (alive and ":-)") or "XXX"
                 active = 'enabled'
                 if svc['disabled']:
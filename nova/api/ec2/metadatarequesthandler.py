@@ -23,14 +23,124 @@ import webob.exc
 
 from nova import log as logging
 from nova import flags
+from nova import rpc
 from nova import utils
 from nova import wsgi
 from nova.api.ec2 import cloud
+from nova.api.ec2 import ec2utils
 
 
 LOG = logging.getLogger('nova.api.ec2.metadata')
 FLAGS = flags.FLAGS
 flags.DECLARE('use_forwarded_for', 'nova.api.auth')
+flags.DEFINE_integer('metadata_cache_expiration', 15,
+                     'Number of seconds to cache the metadata of an instance,'
+                     ' 0 disables the cache')
+flags.DEFINE_integer('metadata_cache_max_size', 10000,
+                     'Maximum number of addresses to cache metadata for')
+
+
+class MetadataCache(object):
+    """In-process cache of instance metadata keyed by fixed ip.
+
+    Entries expire after metadata_cache_expiration seconds.  They are
+    dropped earlier when an invalidate_metadata cast arrives on the
+    metadata fanout topic, which happens whenever the fixed ip, floating
+    ips or security groups of an instance change.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._addresses = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, address):
+        """Returns the cached metadata for address or None."""
+        entry = self._entries.get(address)
+        if entry is None:
+            return None
+        expires, _instance_id, data = entry
+        if utils.utcnow_ts() >= expires:
+            self._remove(address)
+            return None
+        return data
+
+    def set(self, address, instance_id, data):
+        """Caches data for address, evicting the oldest entries if full."""
+        if FLAGS.metadata_cache_expiration <= 0:
+            return
+        self._remove(address)
+        if len(self._entries) >= FLAGS.metadata_cache_max_size:
+            self._evict()
+        expires = utils.utcnow_ts() + FLAGS.metadata_cache_expiration
+        self._entries[address] = (expires, instance_id, data)
+        self._addresses.setdefault(instance_id, set()).add(address)
+
+    def invalidate(self, address=None, instance_id=None):
+        """Drops the entries for address and/or instance_id."""
+        if address is not None:
+            self._remove(address)
+        if instance_id is not None:
+            for cached_address in list(self._addresses.get(instance_id, ())):
+                self._remove(cached_address)
+
+    def clear(self):
+        self._entries.clear()
+        self._addresses.clear()
+
+    def invalidate_metadata(self, context, address=None, instance_id=None):
+        """Called via rpc fanout when metadata for an instance changes."""
+        LOG.debug(_('Invalidating cached metadata for address %(address)s '
+                    'instance %(instance_id)s'), locals())
+        self.invalidate(address=address, instance_id=instance_id)
+
+    def _remove(self, address):
+        entry = self._entries.pop(address, None)
+        if entry is None:
+            return
+        instance_id = entry[1]
+        addresses = self._addresses.get(instance_id)
+        if addresses is not None:
+            addresses.discard(address)
+            if not addresses:
+                del self._addresses[instance_id]
+
+    def _evict(self):
+        """Drops expired entries, or the oldest tenth if none expired."""
+        now = utils.utcnow_ts()
+        expired = [address for address, (expires, _i, _d)
+                   in self._entries.iteritems() if expires <= now]
+        if not expired:
+            by_age = sorted(self._entries.iteritems(),
+                            key=lambda item: item[1][0])
+            count = max(1, len(by_age) / 10)
+            expired = [address for address, _entry in by_age[:count]]
+        for address in expired:
+            self._remove(address)
+
+
+# NOTE(vish): there is one MetadataRequestHandler per api version in the
+#             paste config, so the cache and its listener are shared by
+#             every handler in the worker.
+_CACHE = MetadataCache()
+_CACHE_LISTENER = None
+
+
+def get_cache():
+    return _CACHE
+
+
+def _start_cache_listener():
+    """Consume invalidate_metadata casts on the metadata fanout topic."""
+    global _CACHE_LISTENER
+    if _CACHE_LISTENER is not None:
+        return
+    _CACHE_LISTENER = rpc.create_connection(new=True)
+    _CACHE_LISTENER.create_consumer(FLAGS.metadata_topic, _CACHE,
+                                    fanout=True)
+    _CACHE_LISTENER.consume_in_thread()
 
 
 class MetadataRequestHandler(wsgi.Application):
@@ -38,6 +148,25 @@ class MetadataRequestHandler(wsgi.Application):
 
     def __init__(self):
         self.cc = cloud.CloudController()
+        self.cache = get_cache()
+
+    @classmethod
+    def factory(cls, global_config, **local_config):
+        if FLAGS.metadata_cache_expiration > 0:
+            _start_cache_listener()
+        return super(MetadataRequestHandler, cls).factory(global_config,
+                                                          **local_config)
+
+    def get_metadata(self, address):
+        """Returns the metadata for address, from the cache if possible."""
+        meta_data = self.cache.get(address)
+        if meta_data is not None:
+            return meta_data
+        meta_data = self.cc.get_metadata(address)
+        if meta_data is not None:
+            ec2_id = meta_data['meta-data']['instance-id']
+            self.cache.set(address, ec2utils.ec2_id_to_id(ec2_id), meta_data)
+        return meta_data
 
     def print_data(self, data):
         if isinstance(data, dict):
@@ -76,7 +205,7 @@ class MetadataRequestHandler(wsgi.Application):
         if FLAGS.use_forwarded_for:
             remote_address = req.headers.get('X-Forwarded-For', remote_address)
         try:
-            meta_data = self.cc.get_metadata(remote_address)
+            meta_data = self.get_metadata(remote_address)
         except Exception:
             LOG.exception(_('Failed to get metadata for ip: %s'),
                           remote_address)
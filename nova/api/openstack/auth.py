@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
 import hashlib
 import time
 
@@ -34,6 +35,15 @@ from nova.api.openstack import faults
 LOG = logging.getLogger('nova.api.openstack')
 FLAGS = flags.FLAGS
 flags.DECLARE('use_forwarded_for', 'nova.api.auth')
+flags.DEFINE_integer('auth_token_cache_ttl', 60,
+                     'Seconds the user and projects a token belongs to are '
+                     'cached for. Uses memcached_servers if set, otherwise '
+                     'an in-process cache. 0 disables the cache.')
+flags.DEFINE_integer('auth_token_negative_cache_ttl', 5,
+                     'Seconds tokens that are not known are remembered for')
+
+# Tokens are destroyed once they are this old
+TOKEN_LIFETIME = datetime.timedelta(days=2)
 
 
 class NoAuthMiddleware(wsgi.Middleware):
@@ -83,22 +93,28 @@ class AuthMiddleware(wsgi.Middleware):
             db_driver = FLAGS.db_driver
         self.db = utils.import_object(db_driver)
         self.auth = auth.manager.AuthManager()
+        if FLAGS.memcached_servers:
+            import memcache
+        else:
+            from nova import fakememcache as memcache
+        self.mc = memcache.Client(FLAGS.memcached_servers, debug=0)
         super(AuthMiddleware, self).__init__(application)
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
         if not self.has_authentication(req):
             return self.authenticate(req)
-        user_id = self.get_user_by_authentication(req)
-        if not user_id:
+        auth_info = self.get_auth_info(req.headers["X-Auth-Token"])
+        if not auth_info:
             token = req.headers["X-Auth-Token"]
-            msg = _("%(user_id)s could not be found with token '%(token)s'")
+            msg = _("No user could be found with token '%(token)s'")
             LOG.warn(msg % locals())
             return faults.Fault(webob.exc.HTTPUnauthorized())
+        user_id = auth_info['user_id']
 
-        # Get all valid projects for the user
-        projects = self.auth.get_projects(user_id)
-        if not projects:
+        # All valid projects for the user
+        project_ids = auth_info['project_ids']
+        if not project_ids:
             return faults.Fault(webob.exc.HTTPUnauthorized())
 
         project_id = ""
@@ -107,13 +123,8 @@ class AuthMiddleware(wsgi.Middleware):
         # keystone should be taking this over at some point
         if len(path_parts) > 1 and path_parts[1] == 'v1.1':
             project_id = path_parts[2]
-            # Check that the project for project_id exists, and that user
-            # is authorized to use it
-            try:
-                project = self.auth.get_project(project_id)
-            except exception.ProjectNotFound:
-                return faults.Fault(webob.exc.HTTPUnauthorized())
-            if project_id not in [p.id for p in projects]:
+            # Check that the user is authorized to use project_id
+            if project_id not in project_ids:
                 return faults.Fault(webob.exc.HTTPUnauthorized())
         else:
             # As a fallback, set project_id from the headers, which is the v1.0
@@ -122,9 +133,9 @@ class AuthMiddleware(wsgi.Middleware):
             try:
                 project_id = req.headers["X-Auth-Project-Id"]
             except KeyError:
-                project_id = projects[0].id
+                project_id = project_ids[0]
 
-        is_admin = self.auth.is_admin(user_id)
+        is_admin = auth_info['is_admin']
         remote_address = getattr(req, 'remote_address', '127.0.0.1')
         if FLAGS.use_forwarded_for:
             remote_address = req.headers.get('X-Forwarded-For', remote_address)
@@ -134,8 +145,7 @@ class AuthMiddleware(wsgi.Middleware):
                                      remote_address=remote_address)
         req.environ['nova.context'] = ctx
 
-        if not is_admin and not self.auth.is_project_member(user_id,
-                                                            project_id):
+        if not is_admin and project_id not in project_ids:
             msg = _("%(user_id)s must be an admin or a "
                     "member of %(project_id)s")
             LOG.warn(msg % locals())
@@ -149,6 +159,48 @@ class AuthMiddleware(wsgi.Middleware):
     def get_user_by_authentication(self, req):
         return self.authorize_token(req.headers["X-Auth-Token"])
 
+    def get_auth_info(self, token_hash):
+        """Returns what the request context for token_hash is built from.
+
+        This is a dict with the user_id the token belongs to, whether
+        that user is_admin and the project_ids of their projects, or None
+        if the token is not valid.  It is cached for auth_token_cache_ttl
+        seconds, but never beyond the expiry of the token or a change to
+        the user through the AuthManager.
+
+        """
+        key = 'authtoken-%s' % hashlib.sha1(token_hash).hexdigest()
+        auth_info = self.mc.get(key)
+        if auth_info is not None:
+            if auth_info['user_id'] is None:
+                return None
+            generation = self.auth.get_user_generation(auth_info['user_id'])
+            if auth_info['generation'] == generation:
+                return auth_info
+
+        token = self._get_token(token_hash)
+        if not token:
+            if FLAGS.auth_token_negative_cache_ttl:
+                self.mc.set(key, {'user_id': None},
+                            time=FLAGS.auth_token_negative_cache_ttl)
+            return None
+
+        user_id = token['user_id']
+        auth_info = {'user_id': user_id,
+                     'generation': self.auth.get_user_generation(user_id),
+                     'is_admin': False,
+                     'project_ids': [p.id for p in
+                                     self.auth.get_projects(user_id)]}
+        if auth_info['project_ids']:
+            auth_info['is_admin'] = self.auth.is_admin(user_id)
+
+        expires_in = token['created_at'] + TOKEN_LIFETIME - utils.utcnow()
+        ttl = min(FLAGS.auth_token_cache_ttl,
+                  expires_in.days * 24 * 60 * 60 + expires_in.seconds)
+        if ttl > 0:
+            self.mc.set(key, auth_info, time=ttl)
+        return auth_info
+
     def authenticate(self, req):
         # Unless the request is explicitly made against /<version>/ don't
         # honor it
@@ -198,6 +250,16 @@ class AuthMiddleware(wsgi.Middleware):
         This method will also remove the token if the timestamp is older than
         2 days ago.
         """
+        token = self._get_token(token_hash)
+        if token:
+            return token['user_id']
+        return None
+
+    def _get_token(self, token_hash):
+        """Returns the token for token_hash unless it is unknown or expired.
+
+        Expired tokens are removed.
+        """
         ctxt = context.get_admin_context()
         try:
             token = self.db.auth_token_get(ctxt, token_hash)
@@ -205,10 +267,10 @@ class AuthMiddleware(wsgi.Middleware):
             return None
         if token:
             delta = utils.utcnow() - token['created_at']
-            if delta.days >= 2:
+            if delta >= TOKEN_LIFETIME:
                 self.db.auth_token_destroy(ctxt, token['token_hash'])
             else:
-                return token['user_id']
+                return token
         return None
 
     def _authorize_user(self, username, key, req):
@@ -126,18 +126,13 @@ def get_pagination_params(request):
     return params
 
 
-def limited(items, request, max_limit=FLAGS.osapi_max_limit):
-    """
-    Return a slice of items according to requested offset and limit.
+def get_offset_and_limit(request, max_limit=FLAGS.osapi_max_limit):
+    """Return offset, limit tuple from request.
+
+    :param request: `wsgi.Request` possibly containing 'offset' and 'limit'
+                    GET variables, see `limited`.
+    :param max_limit: The maximum number of items to return.
 
-    @param items: A sliceable entity
-    @param request: `wsgi.Request` possibly containing 'offset' and 'limit'
-                    GET variables. 'offset' is where to start in the list,
-                    and 'limit' is the maximum number of items to return. If
-                    'limit' is not specified, 0, or > max_limit, we default
-                    to max_limit. Negative values for either offset or limit
-                    will cause exc.HTTPBadRequest() exceptions to be raised.
-    @kwarg max_limit: The maximum number of items to return from 'items'
     """
     try:
         offset = int(request.GET.get('offset', 0))
@@ -159,19 +154,43 @@ def limited(items, request, max_limit=FLAGS.osapi_max_limit):
         msg = _('offset param must be positive')
         raise webob.exc.HTTPBadRequest(explanation=msg)
 
-    limit = min(max_limit, limit or max_limit)
+    return offset, min(max_limit, limit or max_limit)
+
+
+def limited(items, request, max_limit=FLAGS.osapi_max_limit):
+    """
+    Return a slice of items according to requested offset and limit.
+
+    @param items: A sliceable entity
+    @param request: `wsgi.Request` possibly containing 'offset' and 'limit'
+                    GET variables. 'offset' is where to start in the list,
+                    and 'limit' is the maximum number of items to return. If
+                    'limit' is not specified, 0, or > max_limit, we default
+                    to max_limit. Negative values for either offset or limit
+                    will cause exc.HTTPBadRequest() exceptions to be raised.
+    @kwarg max_limit: The maximum number of items to return from 'items'
+    """
+    offset, limit = get_offset_and_limit(request, max_limit)
     range_end = offset + limit
     return items[offset:range_end]
 
 
-def limited_by_marker(items, request, max_limit=FLAGS.osapi_max_limit):
-    """Return a slice of items according to the requested marker and limit."""
+def get_limit_and_marker(request, max_limit=FLAGS.osapi_max_limit):
+    """Return limit, marker tuple from request.
+
+    limit is capped at max_limit and marker is None if not given.
+    """
     params = get_pagination_params(request)
 
-    limit = params.get('limit', max_limit)
-    marker = params.get('marker')
+    limit = min(max_limit, params.get('limit', max_limit))
+    marker = params.get('marker') or None
+    return limit, marker
+
+
+def limited_by_marker(items, request, max_limit=FLAGS.osapi_max_limit):
+    """Return a slice of items according to the requested marker and limit."""
+    limit, marker = get_limit_and_marker(request, max_limit)
 
-    limit = min(max_limit, limit)
     start_index = 0
     if marker:
         start_index = -1
@@ -20,6 +20,7 @@ from lxml import etree
 
 from nova import db
 from nova import exception
+from nova.api.openstack import common
 from nova.api.openstack import views
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
@@ -41,13 +42,18 @@ class Controller(object):
     def _get_view_builder(self, req):
         raise NotImplementedError()
 
+    def _get_pagination_params(self, req):
+        return {}
+
     def _get_flavors(self, req, is_detail=True):
         """Helper function that returns a list of flavor dicts."""
         ctxt = req.environ['nova.context']
-        flavors = db.api.instance_type_get_all(ctxt)
+        page_params = self._get_pagination_params(req)
+        flavors = db.api.instance_type_get_all(ctxt, **page_params)
+        flavors = sorted(flavors.values(), key=lambda f: f['flavorid'])
         builder = self._get_view_builder(req)
         items = [builder.build(flavor, is_detail=is_detail)
-                 for flavor in flavors.values()]
+                 for flavor in flavors]
         return items
 
     def show(self, req, id):
@@ -76,6 +82,10 @@ class ControllerV11(Controller):
         project_id = getattr(req.environ['nova.context'], 'project_id', '')
         return views.flavors.ViewBuilderV11(base_url, project_id)
 
+    def _get_pagination_params(self, req):
+        limit, marker = common.get_limit_and_marker(req)
+        return {'limit': limit, 'marker': marker}
+
 
 class FlavorXMLSerializer(wsgi.XMLDictSerializer):
 
@@ -145,8 +145,10 @@ class ControllerV10(Controller):
         """
         context = req.environ['nova.context']
         filters = self._get_filters(req)
-        images = self._image_service.index(context, filters=filters)
-        images = common.limited(images, req)
+        offset, limit = common.get_offset_and_limit(req)
+        images = self._image_service.index(context, filters=filters,
+                                           limit=offset + limit)
+        images = images[offset:offset + limit]
         builder = self.get_builder(req).build
         return dict(images=[builder(image, detail=False) for image in images])
 
@@ -158,8 +160,10 @@ class ControllerV10(Controller):
         """
         context = req.environ['nova.context']
         filters = self._get_filters(req)
-        images = self._image_service.detail(context, filters=filters)
-        images = common.limited(images, req)
+        offset, limit = common.get_offset_and_limit(req)
+        images = self._image_service.detail(context, filters=filters,
+                                            limit=offset + limit)
+        images = images[offset:offset + limit]
         builder = self.get_builder(req).build
         return dict(images=[builder(image, detail=True) for image in images])
 
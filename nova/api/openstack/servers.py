@@ -78,6 +78,9 @@ class Controller(object):
     def _limit_items(self, items, req):
         raise NotImplementedError()
 
+    def _get_limited_instances(self, context, search_opts, req):
+        raise NotImplementedError()
+
     def _action_rebuild(self, info, request, instance_id):
         raise NotImplementedError()
 
@@ -126,10 +129,15 @@ class Controller(object):
                 # No 'changes-since', so we only want non-deleted servers
                 search_opts['deleted'] = False
 
-        instance_list = self.compute_api.get_all(context,
-                                                 search_opts=search_opts)
-
-        limited_list = self._limit_items(instance_list, req)
+        if search_opts['recurse_zones'] or 'reservation_id' in search_opts:
+            # Servers from child zones are added to the list, so page
+            # through all of them here.
+            instance_list = self.compute_api.get_all(context,
+                                                     search_opts=search_opts)
+            limited_list = self._limit_items(instance_list, req)
+        else:
+            limited_list = self._get_limited_instances(context, search_opts,
+                                                       req)
         servers = [self._build_view(req, inst, is_detail)['server']
                     for inst in limited_list]
 
@@ -598,6 +606,13 @@ class ControllerV10(Controller):
     def _limit_items(self, items, req):
         return common.limited(items, req)
 
+    def _get_limited_instances(self, context, search_opts, req):
+        offset, limit = common.get_offset_and_limit(req)
+        instance_list = self.compute_api.get_all(context,
+                                                 search_opts=search_opts,
+                                                 limit=offset + limit)
+        return instance_list[offset:offset + limit]
+
     def _update(self, context, req, id, inst_dict):
         if 'adminPass' in inst_dict['server']:
             self.compute_api.set_admin_password(context, id,
@@ -708,6 +723,18 @@ class ControllerV11(Controller):
     def _limit_items(self, items, req):
         return common.limited_by_marker(items, req)
 
+    def _get_limited_instances(self, context, search_opts, req):
+        limit, marker = common.get_limit_and_marker(req)
+        try:
+            instance_list = self.compute_api.get_all(context,
+                                                     search_opts=search_opts,
+                                                     limit=limit,
+                                                     marker=marker)
+        except exception.MarkerNotFound:
+            msg = _('marker [%s] not found') % marker
+            raise exc.HTTPBadRequest(explanation=msg)
+        return instance_list[:limit]
+
     def _validate_metadata(self, metadata):
         """Ensure that we can work with the metadata given."""
         try:
@@ -395,6 +395,25 @@ class AuthManager(object):
         # NOTE(anthony): it would be better to delete the key
         self.mc.set(self._build_mc_key(user, role, project), None)
 
+    def _build_user_mc_key(self, user):
+        return 'usergeneration-%s' % User.safe_id(user)
+
+    def get_user_generation(self, user):
+        """Returns a value that changes whenever user or its roles or
+        projects are changed through the AuthManager.
+
+        Lets data cached about a user be checked for staleness.
+        """
+        mc_key = self._build_user_mc_key(user)
+        generation = self.mc.get(mc_key)
+        if generation is None:
+            self.mc.add(mc_key, str(uuid.uuid4()))
+            generation = self.mc.get(mc_key)
+        return generation
+
+    def _user_changed(self, user):
+        self.mc.set(self._build_user_mc_key(user), str(uuid.uuid4()))
+
     def _has_role(self, user, role, project=None):
         mc_key = self._build_mc_key(user, role, project)
         rslt = self.mc.get(mc_key)
@@ -480,6 +499,7 @@ class AuthManager(object):
         with self.driver() as drv:
             self._clear_mc_key(uid, role, pid)
             drv.add_role(uid, role, pid)
+        self._user_changed(uid)
 
     def remove_role(self, user, role, project=None):
         """Removes role for user
@@ -509,6 +529,7 @@ class AuthManager(object):
         with self.driver() as drv:
             self._clear_mc_key(uid, role, pid)
             drv.remove_role(uid, role, pid)
+        self._user_changed(uid)
 
     @staticmethod
     def get_roles(project_roles=True):
@@ -580,6 +601,8 @@ class AuthManager(object):
                 LOG.audit(_("Created project %(name)s with"
                         " manager %(manager_user)s") % locals())
                 project = Project(**project_dict)
+                for member_id in project.member_ids:
+                    self._user_changed(member_id)
                 return project
 
     def modify_project(self, project, manager_user=None, description=None):
@@ -609,8 +632,10 @@ class AuthManager(object):
         pid = Project.safe_id(project)
         LOG.audit(_("Adding user %(uid)s to project %(pid)s") % locals())
         with self.driver() as drv:
-            return drv.add_to_project(User.safe_id(user),
-                                      Project.safe_id(project))
+            result = drv.add_to_project(User.safe_id(user),
+                                        Project.safe_id(project))
+        self._user_changed(uid)
+        return result
 
     def is_project_manager(self, user, project):
         """Checks if user is project manager"""
@@ -630,7 +655,9 @@ class AuthManager(object):
         pid = Project.safe_id(project)
         LOG.audit(_("Remove user %(uid)s from project %(pid)s") % locals())
         with self.driver() as drv:
-            return drv.remove_from_project(uid, pid)
+            result = drv.remove_from_project(uid, pid)
+        self._user_changed(uid)
+        return result
 
     @staticmethod
     def get_project_vpn_data(project):
@@ -659,8 +686,13 @@ class AuthManager(object):
     def delete_project(self, project):
         """Deletes a project"""
         LOG.audit(_("Deleting project %s"), Project.safe_id(project))
+        if not isinstance(project, Project):
+            project = self.get_project(project)
         with self.driver() as drv:
             drv.delete_project(Project.safe_id(project))
+        if project:
+            for member_id in project.member_ids:
+                self._user_changed(member_id)
 
     def get_user(self, uid):
         """Retrieves a user by id"""
@@ -730,6 +762,7 @@ class AuthManager(object):
                                         uid)
         with self.driver() as drv:
             drv.delete_user(uid)
+        self._user_changed(uid)
 
     def modify_user(self, user, access_key=None, secret_key=None, admin=None):
         """Modify credentials for a user"""
@@ -743,6 +776,7 @@ class AuthManager(object):
                     " for user %(uid)s") % locals())
         with self.driver() as drv:
             drv.modify_user(uid, access_key, secret_key, admin)
+        self._user_changed(uid)
 
     def get_credentials(self, user, project=None, use_dmz=True):
         """Get credential zip for user in project"""
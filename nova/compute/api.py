@@ -37,6 +37,7 @@ from nova.compute import instance_types
 from nova.compute import power_state
 from nova.compute import task_states
 from nova.compute import vm_states
+from nova.compute import utils as compute_utils
 from nova.compute.utils import terminate_volumes
 from nova.scheduler import api as scheduler_api
 from nova.db import base
@@ -49,6 +50,10 @@ FLAGS = flags.FLAGS
 flags.DECLARE('vncproxy_topic', 'nova.vnc')
 flags.DEFINE_integer('find_host_timeout', 30,
                      'Timeout after NN seconds when looking for a host.')
+flags.DEFINE_boolean('security_group_refresh_fanout', True,
+                     'Send security group refreshes to all compute hosts in'
+                     ' one fanout cast naming the hosts that should act on'
+                     ' it, instead of one cast per host.')
 
 
 def generate_default_hostname(instance):
@@ -597,11 +602,9 @@ class API(base.Base):
             if instance['host'] is not None:
                 hosts.add(instance['host'])
 
-        for host in hosts:
-            rpc.cast(context,
-                     self.db.queue_get_for(context, FLAGS.compute_topic, host),
-                     {"method": "refresh_security_group_rules",
-                      "args": {"security_group_id": security_group.id}})
+        self._cast_to_compute_hosts(context, hosts,
+                {"method": "refresh_security_group_rules",
+                 "args": {"security_group_id": security_group.id}})
 
     def trigger_security_group_members_refresh(self, context, group_ids):
         """Called when a security group gains a new or loses a member.
@@ -638,23 +641,48 @@ class API(base.Base):
             if instance['host']:
                 hosts.add(instance['host'])
 
-        # ...and finally we tell these nodes to refresh their view of this
-        # particular security group.
-        for host in hosts:
-            rpc.cast(context,
-                     self.db.queue_get_for(context, FLAGS.compute_topic, host),
-                     {"method": "refresh_security_group_members",
-                      "args": {"security_group_id": group_id}})
+        if not hosts:
+            return
+
+        # ...and finally we tell these nodes to refresh their view of these
+        # security groups.
+        for group_id in group_ids:
+            self._cast_to_compute_hosts(context, hosts,
+                    {"method": "refresh_security_group_members",
+                     "args": {"security_group_id": group_id}})
 
     def trigger_provider_fw_rules_refresh(self, context):
         """Called when a rule is added to or removed from a security_group"""
 
         hosts = [x['host'] for (x, idx)
                            in self.db.service_get_all_compute_sorted(context)]
+        self._cast_to_compute_hosts(context, hosts,
+                {'method': 'refresh_provider_fw_rules', 'args': {}})
+
+    def prefetch_image(self, context, image_id):
+        """Ask every compute host to download image_id ahead of time."""
+        rpc.fanout_cast(context, FLAGS.compute_topic,
+                        {'method': 'prefetch_image',
+                         'args': {'image_id': image_id}})
+
+    def _cast_to_compute_hosts(self, context, hosts, msg):
+        """Casts msg to the compute service of each of hosts.
+
+        With security_group_refresh_fanout the hosts are added to the args
+        and msg goes out once to every compute service, which ignores it
+        if it is not one of them.
+
+        """
+        if not hosts:
+            return
+        if FLAGS.security_group_refresh_fanout:
+            msg['args']['hosts'] = sorted(hosts)
+            rpc.fanout_cast(context, FLAGS.compute_topic, msg)
+            return
         for host in hosts:
             rpc.cast(context,
                      self.db.queue_get_for(context, FLAGS.compute_topic, host),
-                     {'method': 'refresh_provider_fw_rules', 'args': {}})
+                     msg)
 
     def _is_security_group_associated_with_server(self, security_group,
                                                 instance_id):
@@ -701,6 +729,7 @@ class API(base.Base):
              self.db.queue_get_for(context, FLAGS.compute_topic, inst['host']),
              {"method": "refresh_security_group_rules",
               "args": {"security_group_id": security_group['id']}})
+        compute_utils.invalidate_metadata(context, instance_id=instance_id)
 
     def remove_security_group(self, context, instance_id, security_group_name):
         """Remove the security group associated with the instance"""
@@ -727,6 +756,7 @@ class API(base.Base):
              self.db.queue_get_for(context, FLAGS.compute_topic, inst['host']),
              {"method": "refresh_security_group_rules",
               "args": {"security_group_id": security_group['id']}})
+        compute_utils.invalidate_metadata(context, instance_id=instance_id)
 
     @scheduler_api.reroute_compute("update")
     def update(self, context, instance_id, **kwargs):
@@ -849,11 +879,14 @@ class API(base.Base):
         """
         return self.get(context, instance_id)
 
-    def get_all(self, context, search_opts=None):
+    def get_all(self, context, search_opts=None, limit=None, marker=None):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retreive
         all instances in the system.
+
+        limit and marker page through the instances of this zone, newest
+        first.  Instances found in child zones are appended unpaged.
         """
 
         if search_opts is None:
@@ -905,7 +938,8 @@ class API(base.Base):
         if 'reservation_id' in filters:
             recurse_zones = True
 
-        instances = self._get_instances_by_filters(context, filters)
+        instances = self._get_instances_by_filters(context, filters,
+                                                   limit=limit, marker=marker)
 
         if not recurse_zones:
             return instances
@@ -930,7 +964,8 @@ class API(base.Base):
 
         return instances
 
-    def _get_instances_by_filters(self, context, filters):
+    def _get_instances_by_filters(self, context, filters, limit=None,
+                                  marker=None):
         ids = None
         if 'ip6' in filters or 'ip' in filters:
             res = self.network_api.get_instance_uuids_by_ip_filter(context,
@@ -940,7 +975,8 @@ class API(base.Base):
             uuids = set([r['instance_uuid'] for r in res])
             filters['uuid'] = uuids
 
-        return self.db.instance_get_all_by_filters(context, filters)
+        return self.db.instance_get_all_by_filters(context, filters,
+                                                   limit=limit, marker=marker)
 
     def _cast_compute_message(self, method, context, instance_id, host=None,
                               params=None):
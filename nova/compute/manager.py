@@ -36,6 +36,7 @@ terminating it.
 """
 
 import os
+import random
 import socket
 import sys
 import tempfile
@@ -59,7 +60,9 @@ from nova.compute import power_state
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova.notifier import api as notifier
+from nova.compute import utils as compute_utils
 from nova.compute.utils import terminate_volumes
+from nova.scheduler import api as scheduler_api
 from nova.virt import driver
 
 
@@ -84,6 +87,20 @@ flags.DEFINE_integer("resize_confirm_window", 0,
                      " Set to 0 to disable.")
 flags.DEFINE_integer('host_state_interval', 120,
                      'Interval in seconds for querying the host status')
+flags.DEFINE_integer('power_state_sync_interval', 300,
+                     'Interval in seconds for syncing instance power states'
+                     ' between the database and the hypervisor')
+flags.DEFINE_integer('power_state_sync_jitter', 60,
+                     'Up to this many random seconds are added to each'
+                     ' power_state_sync_interval to spread the syncs of'
+                     ' different hosts')
+flags.DEFINE_integer('image_cache_manager_interval', 3600,
+                     'Interval in seconds for removing unused base images'
+                     ' from the image cache of the driver')
+flags.DEFINE_float('security_group_refresh_window', 1.0,
+                   'Seconds to collect security group refreshes before'
+                   ' applying them, so repeated refreshes of the same group'
+                   ' rebuild the firewall once. Set to 0 to refresh at once.')
 
 LOG = logging.getLogger('nova.compute.manager')
 
@@ -146,6 +163,10 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.network_manager = utils.import_object(FLAGS.network_manager)
         self.volume_manager = utils.import_object(FLAGS.volume_manager)
         self._last_host_check = 0
+        self._next_power_state_sync = 0
+        self._last_image_cache_check = 0
+        self._pending_refreshes = []
+        self._refresh_timer = None
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
 
@@ -208,28 +229,74 @@ class ComputeManager(manager.SchedulerDependentManager):
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     def refresh_security_group_rules(self, context, security_group_id,
-                                     **kwargs):
+                                     hosts=None, **kwargs):
         """Tell the virtualization driver to refresh security group rules.
 
-        Passes straight through to the virtualization driver.
+        Passes through to the virtualization driver once the refresh
+        window is over. Ignored if hosts is given and does not include
+        this host.
 
         """
-        return self.driver.refresh_security_group_rules(security_group_id)
+        if hosts is not None and self.host not in hosts:
+            return
+        self._queue_refresh('refresh_security_group_rules', security_group_id)
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     def refresh_security_group_members(self, context,
-                                       security_group_id, **kwargs):
+                                       security_group_id, hosts=None,
+                                       **kwargs):
         """Tell the virtualization driver to refresh security group members.
 
-        Passes straight through to the virtualization driver.
+        Passes through to the virtualization driver once the refresh
+        window is over. Ignored if hosts is given and does not include
+        this host.
 
         """
-        return self.driver.refresh_security_group_members(security_group_id)
+        if hosts is not None and self.host not in hosts:
+            return
+        self._queue_refresh('refresh_security_group_members',
+                            security_group_id)
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
-    def refresh_provider_fw_rules(self, context, **_kwargs):
-        """This call passes straight through to the virtualization driver."""
-        return self.driver.refresh_provider_fw_rules()
+    def refresh_provider_fw_rules(self, context, hosts=None, **_kwargs):
+        """This call passes through to the virtualization driver."""
+        if hosts is not None and self.host not in hosts:
+            return
+        self._queue_refresh('refresh_provider_fw_rules')
+
+    def prefetch_image(self, context, image_id, **kwargs):
+        """Download image_id so instances booted from it start faster."""
+        self.driver.prefetch_image(context, image_id)
+
+    def _queue_refresh(self, method, *args):
+        """Calls method of the driver when the refresh window is over.
+
+        Identical refreshes requested in the same window are only made
+        once.
+
+        """
+        if not FLAGS.security_group_refresh_window:
+            return getattr(self.driver, method)(*args)
+        refresh = (method, args)
+        if refresh in self._pending_refreshes:
+            LOG.debug(_('%(method)s%(args)s is already pending'), locals())
+            return
+        self._pending_refreshes.append(refresh)
+        if self._refresh_timer is None:
+            self._refresh_timer = greenthread.spawn_after(
+                    FLAGS.security_group_refresh_window,
+                    self._apply_pending_refreshes)
+
+    def _apply_pending_refreshes(self):
+        """Makes the refreshes collected by _queue_refresh."""
+        pending = self._pending_refreshes
+        self._pending_refreshes = []
+        self._refresh_timer = None
+        for method, args in pending:
+            try:
+                getattr(self.driver, method)(*args)
+            except Exception:
+                LOG.exception(_('Error during %(method)s%(args)s'), locals())
 
     def _get_instance_nw_info(self, context, instance):
         """Get a list of dictionaries of network data of an instance.
@@ -500,11 +567,14 @@ class ComputeManager(manager.SchedulerDependentManager):
                               terminated_at=utils.utcnow())
 
         self.db.instance_destroy(context, instance_id)
+        scheduler_api.release_resources(context, 'compute', self.host,
+                                        instance['vcpus'])
 
         usage_info = utils.usage_from_instance(instance)
         notifier.notify('compute.%s' % self.host,
                         'compute.instance.delete',
                         notifier.INFO, usage_info)
+        compute_utils.invalidate_metadata(context, instance_id=instance_id)
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @checks_instance_lock
@@ -578,6 +648,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                             'compute.instance.rebuild',
                             notifier.INFO,
                             usage_info)
+        compute_utils.invalidate_metadata(context,
+                                          instance_id=instance_ref['id'])
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @checks_instance_lock
@@ -857,6 +929,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                             'compute.instance.resize.confirm',
                             notifier.INFO,
                             usage_info)
+        compute_utils.invalidate_metadata(context,
+                                          instance_id=instance_ref['id'])
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @checks_instance_lock
@@ -914,6 +988,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                             'compute.instance.resize.revert',
                             notifier.INFO,
                             usage_info)
+        compute_utils.invalidate_metadata(context,
+                                          instance_id=instance_ref['id'])
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @checks_instance_lock
@@ -1671,11 +1747,18 @@ class ComputeManager(manager.SchedulerDependentManager):
             error_list.append(ex)
 
         try:
-            self._sync_power_states(context)
+            self._poll_power_states(context)
         except Exception as ex:
             LOG.warning(_("Error during power_state sync: %s"), unicode(ex))
             error_list.append(ex)
 
+        try:
+            self._manage_image_cache(context)
+        except Exception as ex:
+            LOG.warning(_("Error during image cache management: %s"),
+                        unicode(ex))
+            error_list.append(ex)
+
         return error_list
 
     def _report_driver_status(self):
@@ -1688,6 +1771,21 @@ class ComputeManager(manager.SchedulerDependentManager):
             self.update_service_capabilities(
                 self.driver.get_host_stats(refresh=True))
 
+    def _manage_image_cache(self, context):
+        curr_time = time.time()
+        if (curr_time - self._last_image_cache_check >
+            FLAGS.image_cache_manager_interval):
+            self._last_image_cache_check = curr_time
+            self.driver.manage_image_cache(context)
+
+    def _poll_power_states(self, context):
+        curr_time = time.time()
+        if curr_time >= self._next_power_state_sync:
+            jitter = random.uniform(0, FLAGS.power_state_sync_jitter)
+            self._next_power_state_sync = (curr_time + jitter +
+                                           FLAGS.power_state_sync_interval)
+            self._sync_power_states(context)
+
     def _sync_power_states(self, context):
         """Align power states between the database and the hypervisor.
 
@@ -1699,29 +1797,26 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         """
         vm_instances = self.driver.list_instances_detail()
-        vm_instances = dict((vm.name, vm) for vm in vm_instances)
-        db_instances = self.db.instance_get_all_by_host(context, self.host)
+        vm_power_states = dict((vm.name, vm.state) for vm in vm_instances)
+        db_instances = self.db.instance_get_power_states_by_host(context,
+                                                                 self.host)
 
-        num_vm_instances = len(vm_instances)
+        num_vm_instances = len(vm_power_states)
         num_db_instances = len(db_instances)
 
         if num_vm_instances != num_db_instances:
             LOG.info(_("Found %(num_db_instances)s in the database and "
                        "%(num_vm_instances)s on the hypervisor.") % locals())
 
+        # Group the drifted instances by their new power state so they
+        # can be updated with one statement per state.
+        updates = {}
         for db_instance in db_instances:
-            name = db_instance["name"]
-            db_power_state = db_instance['power_state']
-            vm_instance = vm_instances.get(name)
-
-            if vm_instance is None:
-                vm_power_state = power_state.NOSTATE
-            else:
-                vm_power_state = vm_instance.state
-
-            if vm_power_state == db_power_state:
+            vm_power_state = vm_power_states.get(db_instance['name'],
+                                                 power_state.NOSTATE)
+            if vm_power_state == db_instance['power_state']:
                 continue
+            updates.setdefault(vm_power_state, []).append(db_instance['id'])
 
-            self._instance_update(context,
-                                  db_instance["id"],
-                                  power_state=vm_power_state)
+        if updates:
+            self.db.instance_update_power_states(context, updates)
@@ -15,9 +15,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from nova import flags
+from nova import rpc
 from nova import volume
 
 
+FLAGS = flags.FLAGS
+
+
 def terminate_volumes(db, context, instance_id):
     """delete volumes of delete_on_termination=True in block device mapping"""
     volume_api = volume.API()
@@ -27,3 +32,11 @@ def terminate_volumes(db, context, instance_id):
         if bdm['volume_id'] and bdm['delete_on_termination']:
             volume_api.delete(context, bdm['volume_id'])
         db.block_device_mapping_destroy(context, bdm['id'])
+
+
+def invalidate_metadata(context, address=None, instance_id=None):
+    """Tell the metadata api workers to drop their cached metadata for
+    a fixed ip address and/or an instance."""
+    kwargs = dict(method='invalidate_metadata',
+                  args=dict(address=address, instance_id=instance_id))
+    rpc.fanout_cast(context, FLAGS.metadata_topic, kwargs)
@@ -155,6 +155,15 @@ def service_update(context, service_id, values):
     return IMPL.service_update(context, service_id, values)
 
 
+def service_heartbeat(context, service_ids):
+    """Bump report_count and updated_at of the given services.
+
+    Returns the number of services that were found.
+
+    """
+    return IMPL.service_heartbeat(context, service_ids)
+
+
 ###################
 
 
@@ -285,6 +294,11 @@ def floating_ip_get_all_by_project(context, project_id):
     return IMPL.floating_ip_get_all_by_project(context, project_id)
 
 
+def floating_ip_get_all_by_address_pattern(context, pattern):
+    """Get associated floating ips whose address matches a LIKE pattern."""
+    return IMPL.floating_ip_get_all_by_address_pattern(context, pattern)
+
+
 def floating_ip_get_by_address(context, address):
     """Get a floating ip by address or raise if it doesn't exist."""
     return IMPL.floating_ip_get_by_address(context, address)
@@ -382,6 +396,11 @@ def fixed_ip_get_by_address(context, address):
     return IMPL.fixed_ip_get_by_address(context, address)
 
 
+def fixed_ip_get_all_by_address_pattern(context, pattern):
+    """Get allocated fixed ips whose address matches a LIKE pattern."""
+    return IMPL.fixed_ip_get_all_by_address_pattern(context, pattern)
+
+
 def fixed_ip_get_by_instance(context, instance_id):
     """Get fixed ips by instance or raise if none exist."""
     return IMPL.fixed_ip_get_by_instance(context, instance_id)
@@ -510,9 +529,14 @@ def instance_get_all(context):
     return IMPL.instance_get_all(context)
 
 
-def instance_get_all_by_filters(context, filters):
-    """Get all instances that match all filters."""
-    return IMPL.instance_get_all_by_filters(context, filters)
+def instance_get_all_by_filters(context, filters, limit=None, marker=None):
+    """Get all instances that match all filters, newest first.
+
+    If marker is an instance id or uuid only instances after it are
+    returned, at most limit of them.
+    """
+    return IMPL.instance_get_all_by_filters(context, filters, limit=limit,
+                                            marker=marker)
 
 
 def instance_get_active_by_window(context, begin, end=None, project_id=None):
@@ -546,6 +570,11 @@ def instance_get_all_by_host(context, host):
     return IMPL.instance_get_all_by_host(context, host)
 
 
+def instance_get_power_states_by_host(context, host):
+    """Get the id, name and power_state of all instances on a host."""
+    return IMPL.instance_get_power_states_by_host(context, host)
+
+
 def instance_get_all_by_reservation(context, reservation_id):
     """Get all instances belonging to a reservation."""
     return IMPL.instance_get_all_by_reservation(context, reservation_id)
@@ -594,6 +623,16 @@ def instance_update(context, instance_id, values):
     return IMPL.instance_update(context, instance_id, values)
 
 
+def instance_update_power_states(context, power_states):
+    """Set the power_state of many instances at once.
+
+    power_states maps each power state to the ids of the instances that
+    should be set to it.
+
+    """
+    return IMPL.instance_update_power_states(context, power_states)
+
+
 def instance_add_security_group(context, instance_id, security_group_id):
     """Associate the given security group with the given instance."""
     return IMPL.instance_add_security_group(context, instance_id,
@@ -1088,6 +1127,20 @@ def security_group_get_by_instance(context, instance_id):
     return IMPL.security_group_get_by_instance(context, instance_id)
 
 
+def security_group_get_by_instances(context, instance_ids):
+    """Get a dict of instance id to the security groups it is assigned to.
+
+    The rules of the groups and their grantee groups are loaded as well.
+    """
+    return IMPL.security_group_get_by_instances(context, instance_ids)
+
+
+def security_group_get_member_addresses(context, security_group_ids):
+    """Get a dict of security group id to the fixed ips of its instances."""
+    return IMPL.security_group_get_member_addresses(context,
+                                                    security_group_ids)
+
+
 def security_group_exists(context, project_id, group_name):
     """Indicates if a group name exists in a project."""
     return IMPL.security_group_exists(context, project_id, group_name)
@@ -1349,9 +1402,14 @@ def instance_type_create(context, values):
     return IMPL.instance_type_create(context, values)
 
 
-def instance_type_get_all(context, inactive=False):
-    """Get all instance types."""
-    return IMPL.instance_type_get_all(context, inactive)
+def instance_type_get_all(context, inactive=False, limit=None, marker=None):
+    """Get all instance types.
+
+    If marker is a flavorid only instance types with a higher flavorid
+    are returned, at most limit of them.
+    """
+    return IMPL.instance_type_get_all(context, inactive, limit=limit,
+                                      marker=marker)
 
 
 def instance_type_get(context, id):
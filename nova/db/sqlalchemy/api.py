@@ -32,13 +32,16 @@ from nova import log as logging
 from nova.compute import vm_states
 from nova.db.sqlalchemy import models
 from nova.db.sqlalchemy.session import get_session
+from sqlalchemy import and_
 from sqlalchemy import or_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql import func
+from sqlalchemy.sql import select
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql.expression import literal_column
+from sqlalchemy.types import String
 
 FLAGS = flags.FLAGS
 LOG = logging.getLogger("nova.db.sqlalchemy")
@@ -347,6 +350,18 @@ def service_update(context, service_id, values):
         service_ref.save(session=session)
 
 
+@require_admin_context
+def service_heartbeat(context, service_ids):
+    session = get_session()
+    with session.begin():
+        return session.query(models.Service).\
+                       filter(models.Service.id.in_(service_ids)).\
+                       filter_by(deleted=False).\
+                       update({'report_count': models.Service.report_count + 1,
+                               'updated_at': utils.utcnow()},
+                              synchronize_session=False)
+
+
 ###################
 
 
@@ -659,6 +674,23 @@ def floating_ip_get_by_address(context, address, session=None):
     return result
 
 
+@require_context
+def floating_ip_get_all_by_address_pattern(context, pattern):
+    """Floating ips matching the LIKE pattern that forward to an allocated
+    fixed ip, ordered by the virtual interface of the fixed ip."""
+    session = get_session()
+    return session.query(models.FloatingIp).\
+                   options(joinedload('fixed_ip')).\
+                   join(models.FloatingIp.fixed_ip).\
+                   filter(models.FloatingIp.address.like(pattern)).\
+                   filter(models.FloatingIp.deleted == False).\
+                   filter(models.FixedIp.deleted == False).\
+                   filter(models.FixedIp.virtual_interface_id != None).\
+                   filter(models.FixedIp.instance_id != None).\
+                   order_by(models.FixedIp.virtual_interface_id).\
+                   all()
+
+
 @require_context
 def floating_ip_update(context, address, values):
     session = get_session()
@@ -828,6 +860,20 @@ def fixed_ip_get_by_address(context, address, session=None):
     return result
 
 
+@require_context
+def fixed_ip_get_all_by_address_pattern(context, pattern):
+    """Allocated fixed ips matching the LIKE pattern, ordered by virtual
+    interface."""
+    session = get_session()
+    return session.query(models.FixedIp).\
+                   filter(models.FixedIp.address.like(pattern)).\
+                   filter_by(deleted=False).\
+                   filter(models.FixedIp.virtual_interface_id != None).\
+                   filter(models.FixedIp.instance_id != None).\
+                   order_by(models.FixedIp.virtual_interface_id).\
+                   all()
+
+
 @require_context
 def fixed_ip_get_by_instance(context, instance_id):
     session = get_session()
@@ -1203,24 +1249,148 @@ def instance_get_all(context):
                    all()
 
 
+# Python regexes that translate into a LIKE pattern: literals, escaped
+# punctuation, single character classes and quantifiers.
+_LIKE_ESCAPE = '!'
+_REGEX_CLASSES = 'dDwWsS'
+_REGEX_QUANTIFIERS = '*+?{'
+
+
+def _regex_to_like(regex):
+    """Translate a regex applied with re.match into a LIKE pattern.
+
+    The pattern matches every string the regex matches (it may match
+    more, e.g. LIKE ignores case on MySQL), so results still have to be
+    checked with the regex.  Returns None if no useful pattern exists.
+    """
+    if regex.startswith('^'):
+        regex = regex[1:]
+    pattern = []
+    anchored = False
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            if i + 1 == len(regex):
+                return None
+            char = regex[i + 1]
+            if char in _REGEX_CLASSES:
+                atom = None
+            elif char.isalnum():
+                return None
+            else:
+                atom = char
+            i += 2
+        elif char == '.':
+            atom = None
+            i += 1
+        elif char == '[':
+            # a class opening with ^] or holding escapes ends further on
+            # than the first ] after it, so don't try to find its end
+            end = regex.find(']', i + 2)
+            if (end < 0 or regex[i + 1:i + 3] == '^]' or
+                '\\' in regex[i:end]):
+                return None
+            atom = None
+            i = end + 1
+        elif char == '$' and i == len(regex) - 1:
+            anchored = True
+            break
+        elif char in '()|^$' + _REGEX_QUANTIFIERS:
+            return None
+        else:
+            atom = char
+            i += 1
+
+        quantifier = regex[i:i + 1]
+        if quantifier and quantifier in _REGEX_QUANTIFIERS:
+            if quantifier == '{':
+                end = regex.find('}', i)
+                if end < 0:
+                    return None
+                i = end
+            i += 1
+            if regex[i:i + 1] == '?':
+                i += 1
+            if quantifier == '+':
+                pattern.append('_')
+            if pattern[-1:] != ['%']:
+                pattern.append('%')
+        elif atom is None:
+            # any single character
+            pattern.append('_')
+        elif atom in ('%', '_', _LIKE_ESCAPE):
+            pattern.append(_LIKE_ESCAPE + atom)
+        else:
+            pattern.append(atom)
+    if not anchored and pattern[-1:] != ['%']:
+        pattern.append('%')
+    return ''.join(pattern)
+
+
+# Python regex syntax MySQL's POSIX REGEXP doesn't share: escapes,
+# extensions, lazy quantifiers, {,n}, bracket classes like [:alpha:] and
+# empty alternatives
+_NON_POSIX_REGEX_RE = re.compile(r'\\|\(\?|[*+?}]\?|\{,|\[[:=.]|'
+                                 r'\(\)|\(\||\|\)|\|\||^\||\|$')
+
+
+def _regex_filter(session, column, regex):
+    """SQL criterion selecting a superset of the rows where regex matches
+    the column, or None if the regex can't be pushed down.
+
+    Only string columns are pushed down, other columns are matched on
+    their str() in Python, which the database would render differently.
+    """
+    if not isinstance(column.type, String):
+        return None
+    like = _regex_to_like(regex)
+    if like is not None:
+        return column.like(like, escape=_LIKE_ESCAPE)
+    if session.bind.dialect.name == 'mysql' and \
+       not _NON_POSIX_REGEX_RE.search(regex):
+        # REGEXP searches anywhere, re.match is anchored at the start
+        return column.op('REGEXP')('^(%s)' % regex)
+    return None
+
+
+def _instance_marker_filter(query, session, marker, scope):
+    """Only keep instances that sort after marker on (created_at, id).
+
+    The marker is only looked for among the instances matching the
+    column: value (or list of values) pairs in scope, so a caller can't
+    tell whether instances it can't see exist.
+    """
+    marker_query = session.query(models.Instance.created_at,
+                                 models.Instance.id)
+    for column, value in scope.iteritems():
+        column_attr = getattr(models.Instance, column)
+        if isinstance(value, (list, set)):
+            marker_query = marker_query.filter(column_attr.in_(value))
+        else:
+            marker_query = marker_query.filter(column_attr == value)
+    if utils.is_uuid_like(marker):
+        marker_query = marker_query.filter_by(uuid=marker)
+    else:
+        marker_query = marker_query.filter_by(id=marker)
+    marker_ref = marker_query.first()
+    if not marker_ref:
+        raise exception.MarkerNotFound(marker=marker)
+    created_at, instance_id = marker_ref
+    return query.filter(or_(models.Instance.created_at < created_at,
+                            and_(models.Instance.created_at == created_at,
+                                 models.Instance.id < instance_id)))
+
+
 @require_context
-def instance_get_all_by_filters(context, filters):
+def instance_get_all_by_filters(context, filters, limit=None, marker=None):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
-    otherwise"""
-
-    def _regexp_filter_by_metadata(instance, meta):
-        inst_metadata = [{node['key']: node['value']} \
-                         for node in instance['metadata']]
-        if isinstance(meta, list):
-            for node in meta:
-                if node not in inst_metadata:
-                    return False
-        elif isinstance(meta, dict):
-            for k, v in meta.iteritems():
-                if {k: v} not in inst_metadata:
-                    return False
-        return True
+    otherwise.
+
+    Instances are ordered newest first.  If marker (an instance id or
+    uuid) is given only instances after it are returned, at most limit
+    of them."""
 
     def _regexp_filter_by_column(instance, filter_name, filter_re):
         try:
@@ -1243,19 +1413,35 @@ def instance_get_all_by_filters(context, filters):
             filter_dict[column] = value
             return query.filter_by(**filter_dict)
 
+    def _metadata_filter(query, meta):
+        """Require each key/value pair through an IN subquery."""
+        if isinstance(meta, dict):
+            meta = [meta]
+        for node in meta:
+            for k, v in node.iteritems():
+                # NOTE: metadata.any() reuses bind parameter names when
+                # it is used more than once in a query
+                meta_ids = select([models.InstanceMetadata.instance_id]).\
+                        where(and_(models.InstanceMetadata.key == k,
+                                   models.InstanceMetadata.value == v,
+                                   models.InstanceMetadata.deleted == False))
+                query = query.filter(models.Instance.id.in_(meta_ids))
+        return query
+
     session = get_session()
     query_prefix = session.query(models.Instance).\
                    options(joinedload('security_groups')).\
                    options(joinedload('metadata')).\
                    options(joinedload('instance_type')).\
-                   order_by(desc(models.Instance.created_at))
+                   order_by(desc(models.Instance.created_at)).\
+                   order_by(desc(models.Instance.id))
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
     filters = filters.copy()
 
     if 'changes-since' in filters:
-        changes_since = filters['changes-since']
+        changes_since = filters.pop('changes-since')
         query_prefix = query_prefix.\
                             filter(models.Instance.updated_at > changes_since)
 
@@ -1273,6 +1459,8 @@ def instance_get_all_by_filters(context, filters):
 
     query_filters = [key for key in filters.iterkeys()
             if key in exact_match_filter_names]
+    marker_scope = dict((key, filters[key]) for key in query_filters
+                        if key in ('project_id', 'user_id', 'deleted'))
 
     for filter_name in query_filters:
         # Do the matching and remove the filter from the dictionary
@@ -1280,31 +1468,56 @@ def instance_get_all_by_filters(context, filters):
         query_prefix = _exact_match_filter(query_prefix, filter_name,
                 filters.pop(filter_name))
 
-    instances = query_prefix.all()
-    if not instances:
-        return []
+    if 'metadata' in filters:
+        query_prefix = _metadata_filter(query_prefix, filters.pop('metadata'))
 
     # Now filter on everything else for regexp matching..
     # For filters not in the list, we'll attempt to use the filter_name
-    # as a column name in Instance..
-    regexp_filter_funcs = {}
-
-    for filter_name in filters.iterkeys():
-        filter_func = regexp_filter_funcs.get(filter_name, None)
-        filter_re = re.compile(str(filters[filter_name]))
-        if filter_func:
-            filter_l = lambda instance: filter_func(instance, filter_re)
-        elif filter_name == 'metadata':
-            filter_l = lambda instance: _regexp_filter_by_metadata(instance,
-                    filters[filter_name])
-        else:
-            filter_l = lambda instance: _regexp_filter_by_column(instance,
-                    filter_name, filter_re)
-        instances = filter(filter_l, instances)
-        if not instances:
-            break
+    # as a column name in Instance.  Columns get a LIKE or REGEXP in the
+    # query to narrow the rows down, the regexp is still checked below.
+    columns = models.Instance.__table__.columns
+    regexp_filters = []
+    for filter_name, value in filters.iteritems():
+        if not hasattr(models.Instance, filter_name):
+            continue
+        regexp = str(value)
+        if filter_name in columns:
+            criterion = _regex_filter(session, columns[filter_name], regexp)
+            if criterion is not None:
+                query_prefix = query_prefix.filter(criterion)
+        regexp_filters.append((filter_name, re.compile(regexp)))
+
+    if marker is not None:
+        query_prefix = _instance_marker_filter(query_prefix, session, marker,
+                                               marker_scope)
+
+    if not regexp_filters:
+        if limit is not None:
+            query_prefix = query_prefix.limit(limit)
+        return query_prefix.all()
+
+    def _matches(instance):
+        for filter_name, filter_re in regexp_filters:
+            if not _regexp_filter_by_column(instance, filter_name,
+                                            filter_re):
+                return False
+        return True
 
-    return instances
+    if limit is None:
+        return filter(_matches, query_prefix.all())
+
+    # Some rows may fail the regexps, so keep reading pages until there
+    # are enough matches.
+    instances = []
+    query = query_prefix
+    while len(instances) < limit:
+        page = query.limit(limit).all()
+        instances.extend(filter(_matches, page))
+        if len(page) < limit:
+            break
+        query = _instance_marker_filter(query_prefix, session, page[-1].id,
+                                        marker_scope)
+    return instances[:limit]
 
 
 @require_context
@@ -1372,6 +1585,19 @@ def instance_get_all_by_host(context, host):
                    all()
 
 
+@require_admin_context
+def instance_get_power_states_by_host(context, host):
+    session = get_session()
+    rows = session.query(models.Instance.id, models.Instance.power_state).\
+                   filter_by(host=host).\
+                   filter_by(deleted=can_read_deleted(context)).\
+                   all()
+    return [{'id': instance_id,
+             'name': FLAGS.instance_name_template % instance_id,
+             'power_state': state}
+            for instance_id, state in rows]
+
+
 @require_context
 def instance_get_all_by_project(context, project_id):
     authorize_project_context(context, project_id)
@@ -1495,6 +1721,18 @@ def instance_update(context, instance_id, values):
         return instance_ref
 
 
+@require_admin_context
+def instance_update_power_states(context, power_states):
+    session = get_session()
+    with session.begin():
+        for state, instance_ids in power_states.iteritems():
+            session.query(models.Instance).\
+                    filter(models.Instance.id.in_(instance_ids)).\
+                    update({'power_state': state,
+                            'updated_at': utils.utcnow()},
+                           synchronize_session=False)
+
+
 def instance_add_security_group(context, instance_id, security_group_id):
     """Associate the given security group with the given instance"""
     session = get_session()
@@ -2694,6 +2932,56 @@ def security_group_get_by_instance(context, instance_id):
                    all()
 
 
+@require_admin_context
+def security_group_get_by_instances(context, instance_ids):
+    result = dict((instance_id, []) for instance_id in instance_ids)
+    if not instance_ids:
+        return result
+
+    session = get_session()
+    association = models.SecurityGroupInstanceAssociation
+    rows = session.query(models.SecurityGroup, association.instance_id).\
+                   options(joinedload_all('rules.grantee_group')).\
+                   filter(association.security_group_id == \
+                          models.SecurityGroup.id).\
+                   filter(association.instance_id.in_(instance_ids)).\
+                   filter(association.deleted == False).\
+                   filter(models.SecurityGroup.deleted == False).\
+                   all()
+    for security_group, instance_id in rows:
+        result[instance_id].append(security_group)
+    return result
+
+
+@require_admin_context
+def security_group_get_member_addresses(context, security_group_ids):
+    result = dict((group_id, []) for group_id in security_group_ids)
+    if not security_group_ids:
+        return result
+
+    session = get_session()
+    association = models.SecurityGroupInstanceAssociation
+    rows = session.query(association.security_group_id,
+                         models.FixedIp.address).\
+                   filter(models.FixedIp.instance_id == \
+                          association.instance_id).\
+                   filter(models.Instance.id == association.instance_id).\
+                   filter(models.SecurityGroup.id == \
+                          association.security_group_id).\
+                   filter(association.security_group_id.in_(
+                          security_group_ids)).\
+                   filter(association.deleted == False).\
+                   filter(models.FixedIp.deleted == False).\
+                   filter(models.Instance.deleted == False).\
+                   filter(models.SecurityGroup.deleted == False).\
+                   order_by(models.FixedIp.instance_id).\
+                   order_by(models.FixedIp.id).\
+                   all()
+    for security_group_id, address in rows:
+        result[security_group_id].append(address)
+    return result
+
+
 @require_context
 def security_group_exists(context, project_id, group_name):
     try:
@@ -3322,22 +3610,21 @@ def _dict_with_extra_specs(inst_type_query):
 
 
 @require_context
-def instance_type_get_all(context, inactive=False):
+def instance_type_get_all(context, inactive=False, limit=None, marker=None):
     """
     Returns a dict describing all instance_types with name as key.
     """
     session = get_session()
-    if inactive:
-        inst_types = session.query(models.InstanceTypes).\
-                        options(joinedload('extra_specs')).\
-                        order_by("name").\
-                        all()
-    else:
-        inst_types = session.query(models.InstanceTypes).\
-                        options(joinedload('extra_specs')).\
-                        filter_by(deleted=False).\
-                        order_by("name").\
-                        all()
+    query = session.query(models.InstanceTypes).\
+                    options(joinedload('extra_specs')).\
+                    order_by(models.InstanceTypes.flavorid)
+    if not inactive:
+        query = query.filter_by(deleted=False)
+    if marker is not None:
+        query = query.filter(models.InstanceTypes.flavorid > marker)
+    if limit is not None:
+        query = query.limit(limit)
+    inst_types = query.all()
     inst_dict = {}
     if inst_types:
         for i in inst_types:
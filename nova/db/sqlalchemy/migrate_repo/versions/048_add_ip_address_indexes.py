@@ -0,0 +1,47 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table
+
+
+meta = MetaData()
+
+fixed_ips = Table('fixed_ips', meta,
+                  Column('id', Integer(), primary_key=True, nullable=False),
+                  Column('address', String(255)))
+
+floating_ips = Table('floating_ips', meta,
+                     Column('id', Integer(), primary_key=True,
+                            nullable=False),
+                     Column('address', String(255)))
+
+# Looking instances up by ip used to scan every virtual interface, these
+# let the network manager go straight to the address.
+indexes = [Index('fixed_ips_address_idx', fixed_ips.c.address),
+           Index('floating_ips_address_idx', floating_ips.c.address)]
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    for index in indexes:
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+    for index in indexes:
+        index.drop(migrate_engine)
@@ -293,6 +293,8 @@ DEFINE_string('ajax_console_proxy_url',
 DEFINE_string('ajax_console_proxy_port',
                8000, 'port that ajax_console_proxy binds')
 DEFINE_string('vsa_topic', 'vsa', 'the topic that nova-vsa service listens on')
+DEFINE_string('metadata_topic', 'metadata',
+              'the topic metadata api workers listen on for cache updates')
 DEFINE_bool('verbose', False, 'show debug output')
 DEFINE_boolean('fake_rabbit', False, 'use a fake rabbit')
 DEFINE_bool('fake_network', False,
@@ -418,6 +420,12 @@ DEFINE_bool('resume_guests_state_on_host_boot', False,
 
 DEFINE_string('root_helper', 'sudo',
               'Command prefix to use for running commands as root')
+DEFINE_bool('use_rootwrap_daemon', False,
+            'Run commands as root through one long running root helper'
+            ' daemon instead of running root_helper for each command')
+DEFINE_string('rootwrap_daemon_command', 'nova-rootwrap-daemon',
+              'Command that is run with root_helper to start the root'
+              ' helper daemon')
 
 DEFINE_bool('use_ipv6', False, 'use ipv6')
 
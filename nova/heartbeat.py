@@ -0,0 +1,135 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Service heartbeats and liveness.
+
+Every service sends a heartbeat every report_interval seconds, and a
+service is considered up if its last heartbeat is less than
+service_down_time seconds old. How heartbeats travel and where they are
+kept is up to the driver selected with the heartbeat_driver flag:
+
+* DbHeartbeatDriver writes every heartbeat to the services table with a
+  single UPDATE.
+* RpcHeartbeatDriver fans heartbeats out to the schedulers, which keep
+  them in memory and write them to the services table in bulk every
+  heartbeat_flush_interval seconds.
+"""
+
+import datetime
+
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova import rpc
+from nova import utils
+
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string('heartbeat_driver', 'nova.heartbeat.DbHeartbeatDriver',
+                    'Driver used to send and check service heartbeats')
+flags.DEFINE_integer('service_down_time', 60,
+                     'maximum time since last checkin for up service')
+flags.DEFINE_integer('heartbeat_flush_interval', 10,
+                     'Seconds between writing the heartbeats collected by '
+                     'the rpc heartbeat driver to the database')
+
+LOG = logging.getLogger('nova.heartbeat')
+
+
+class DbHeartbeatDriver(object):
+    """Keeps heartbeats in the services table."""
+
+    def beat(self, context, service_id):
+        """Record a heartbeat for service_id.
+
+        Returns False if the service no longer exists.
+        """
+        return db.service_heartbeat(context, [service_id]) > 0
+
+    def record(self, context, service_id):
+        """Handle a heartbeat received over rpc."""
+        pass
+
+    def is_up(self, service):
+        """Check whether a service is up based on last heartbeat."""
+        last_heartbeat = service['updated_at'] or service['created_at']
+        # Timestamps in DB are UTC.
+        elapsed = utils.utcnow() - last_heartbeat
+        return elapsed < datetime.timedelta(seconds=FLAGS.service_down_time)
+
+
+class RpcHeartbeatDriver(DbHeartbeatDriver):
+    """Sends heartbeats to the schedulers instead of the database.
+
+    Each scheduler keeps the time it last heard from every service, uses
+    that to answer is_up(), and periodically writes the services it heard
+    from to the database in one statement, so services checked from other
+    processes are still seen as up.
+    """
+
+    def __init__(self):
+        self.last_seen = {}
+        self._unflushed = set()
+        self._last_flush = utils.utcnow()
+
+    def beat(self, context, service_id):
+        rpc.fanout_cast(context, 'scheduler',
+                        {'method': 'service_heartbeat',
+                         'args': {'service_id': service_id}})
+        return True
+
+    def record(self, context, service_id):
+        now = utils.utcnow()
+        self.last_seen[service_id] = now
+        self._unflushed.add(service_id)
+        interval = datetime.timedelta(seconds=FLAGS.heartbeat_flush_interval)
+        if now - self._last_flush >= interval:
+            self.flush(context)
+
+    def flush(self, context):
+        """Write the heartbeats received since the last flush to the db."""
+        self._last_flush = utils.utcnow()
+        if not self._unflushed:
+            return
+        service_ids = list(self._unflushed)
+        self._unflushed.clear()
+        LOG.debug(_("Writing heartbeats of %d services"), len(service_ids))
+        db.service_heartbeat(context, service_ids)
+
+    def is_up(self, service):
+        last_heartbeat = self.last_seen.get(service['id'])
+        if last_heartbeat is None:
+            return super(RpcHeartbeatDriver, self).is_up(service)
+        elapsed = utils.utcnow() - last_heartbeat
+        return elapsed < datetime.timedelta(seconds=FLAGS.service_down_time)
+
+
+_driver = None
+
+
+def get_driver():
+    """Returns the heartbeat driver shared by this process."""
+    global _driver
+    if _driver is None:
+        _driver = utils.import_object(FLAGS.heartbeat_driver)
+    return _driver
+
+
+def is_up(service):
+    """Check whether a service is up based on last heartbeat."""
+    return get_driver().is_up(service)
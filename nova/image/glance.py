@@ -20,11 +20,16 @@
 from __future__ import absolute_import
 
 import copy
+import functools
 import datetime
+import httplib
 import json
 import random
+import socket
+import time
 from urlparse import urlparse
 
+from eventlet import pools
 from glance.common import exception as glance_exception
 
 from nova import exception
@@ -37,10 +42,33 @@ LOG = logging.getLogger('nova.image.glance')
 
 
 FLAGS = flags.FLAGS
+flags.DEFINE_integer('glance_client_pool_size', 8,
+                     'Number of glance clients kept per glance server and '
+                     'reused, with their connection, across requests. 0 '
+                     'makes a new client for every request.')
+flags.DEFINE_integer('glance_server_retry_interval', 30,
+                     'Seconds a glance server that could not be reached is '
+                     'skipped for before it is tried again')
+flags.DEFINE_integer('glance_show_cache_ttl', 5,
+                     'Seconds image metadata returned by show is reused '
+                     'for. 0 disables the cache.')
 
 
 GlanceClient = utils.import_class('glance.client.Client')
 
+_CONNECTION_ERRORS = (glance_exception.ClientConnectionError, socket.error,
+                      httplib.HTTPException)
+
+# Glance servers that could not be reached, and until when to skip them
+_down_servers = {}
+
+# Pools of clients, by (host, port)
+_client_pools = {}
+
+# Image metadata returned by show, by (image_id, auth_token), with the
+# time it expires at
+_show_cache = {}
+
 
 def _parse_image_ref(image_href):
     """Parse an image href into composite parts.
@@ -71,19 +99,127 @@ def _create_glance_client(context, host, port):
     return glance_client
 
 
+class _KeepAliveClient(GlanceClient):
+    """Glance client sending all its requests over one connection."""
+
+    def __init__(self, *args, **kwargs):
+        super(_KeepAliveClient, self).__init__(*args, **kwargs)
+        self._connection = None
+        self._response = None
+
+    def get_connection_type(self):
+        connection_type = super(_KeepAliveClient, self).get_connection_type()
+
+        def connect(*args, **kwargs):
+            if self._connection is None:
+                self._connection = connection_type(*args, **kwargs)
+                getresponse = self._connection.getresponse
+
+                def keep_response(*args, **kwargs):
+                    self._response = getresponse(*args, **kwargs)
+                    return self._response
+
+                self._connection.getresponse = keep_response
+            else:
+                self._finish_response()
+            return self._connection
+
+        return connect
+
+    def _finish_response(self):
+        """Reads what is left of the last response.
+
+        Some client calls, like get_image_meta and delete_image, never read
+        their response, and httplib won't send another request over the
+        connection until it has been.
+
+        """
+        response, self._response = self._response, None
+        if response is None or response.isclosed():
+            return
+        try:
+            response.read()
+            response.close()
+        except _CONNECTION_ERRORS:
+            self.reset()
+
+    def reset(self):
+        """Drops the connection, the next request opens a new one."""
+        self._response = None
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class _ClientPool(pools.Pool):
+    """Pool of _KeepAliveClients for one glance server."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        super(_ClientPool, self).__init__(
+                max_size=FLAGS.glance_client_pool_size)
+
+    def create(self):
+        return _KeepAliveClient(self.host, self.port)
+
+
+def _set_credentials(client, context):
+    """Makes a pooled client send the credentials of context."""
+    if context.strategy == 'keystone':
+        client.auth_tok = context.auth_token
+        client.creds = {'strategy': 'keystone',
+                        'username': context.user_id,
+                        'tenant': context.project_id}
+    else:
+        client.auth_tok = None
+        client.creds = {}
+
+
+def _get_client_pool(host, port):
+    if (host, port) not in _client_pools:
+        _client_pools[(host, port)] = _ClientPool(host, port)
+    return _client_pools[(host, port)]
+
+
+def _mark_server_down(host, port):
+    LOG.warn(_('Could not reach glance server %(host)s:%(port)d, skipping '
+               'it for %(interval)d seconds'),
+             {'host': host, 'port': port,
+              'interval': FLAGS.glance_server_retry_interval})
+    _down_servers[(host, port)] = (time.time() +
+                                   FLAGS.glance_server_retry_interval)
+    if (host, port) in _client_pools:
+        del _client_pools[(host, port)]
+
+
+def _glance_api_servers():
+    """Returns the (host, port) of each glance server in a random order.
+
+    Servers that could not be reached recently come last.
+
+    """
+    servers = []
+    for host_port in FLAGS.glance_api_servers:
+        host, port_str = host_port.split(':')
+        servers.append((host, int(port_str)))
+    random.shuffle(servers)
+    now = time.time()
+    return sorted(servers,
+                  key=lambda server: _down_servers.get(server, 0) > now)
+
+
 def pick_glance_api_server():
     """Return which Glance API server to use for the request
 
     This method provides a very primitive form of load-balancing suitable for
     testing and sandbox environments. In production, it would be better to use
-    one IP and route that to a real load-balancer.
+    one IP and route that to a real load-balancer. Servers that could not be
+    reached recently are only picked if no other server is left.
 
         Returns (host, port)
     """
-    host_port = random.choice(FLAGS.glance_api_servers)
-    host, port_str = host_port.split(':')
-    port = int(port_str)
-    return host, port
+    return _glance_api_servers()[0]
 
 
 def get_glance_client(context, image_href):
@@ -113,6 +249,22 @@ def get_glance_client(context, image_href):
     return (glance_client, image_id)
 
 
+def _get_image_range(client, image_id, offset):
+    """Requests image_id from byte offset on with an HTTP Range header.
+
+    :returns: a tuple of the form (image_meta, image_chunks, partial) where
+              partial is False if the server sent the whole image
+
+    """
+    from glance.common import client as glance_base_client
+    from glance.common import utils as glance_utils
+    res = client.do_request('GET', '/images/%s' % image_id,
+                            headers={'Range': 'bytes=%d-' % offset})
+    image_meta = glance_utils.get_image_meta_from_headers(res)
+    return (image_meta, glance_base_client.ImageBodyIterator(res),
+            res.status == 206)
+
+
 class GlanceImageService(object):
     """Provides storage and retrieval of disk image objects within Glance."""
 
@@ -128,32 +280,73 @@ class GlanceImageService(object):
         glance_host, glance_port = pick_glance_api_server()
         return _create_glance_client(context, glance_host, glance_port)
 
+    def _call(self, context, method, *args, **kwargs):
+        """Calls method of a glance client, failing over between servers.
+
+        Clients come from the pool of the server they talk to and go back
+        once method returns, so their connection is reused. Only calls
+        that read from glance are retried on the next server.
+
+        """
+        if self._client is not None:
+            return getattr(self._client, method)(*args, **kwargs)
+
+        servers = _glance_api_servers()
+        if method not in ('get_image_meta', 'get_images_detailed'):
+            servers = servers[:1]
+        for host, port in servers:
+            if FLAGS.glance_client_pool_size:
+                pool = _get_client_pool(host, port)
+                client = pool.get()
+                _set_credentials(client, context)
+            else:
+                pool = None
+                client = _create_glance_client(context, host, port)
+            try:
+                return getattr(client, method)(*args, **kwargs)
+            except _CONNECTION_ERRORS:
+                if pool is not None:
+                    client.reset()
+                _mark_server_down(host, port)
+                if (host, port) == servers[-1]:
+                    raise
+            finally:
+                if pool is not None:
+                    pool.put(client)
+
     def index(self, context, **kwargs):
         """Calls out to Glance for a list of images available."""
-        params = self._extract_query_params(kwargs)
-        image_metas = self._get_images(context, **params)
-
-        images = []
-        for image_meta in image_metas:
-            # NOTE(sirp): We need to use `get_images_detailed` and not
-            # `get_images` here because we need `is_public` and `properties`
-            # included so we can filter by user
-            if self._is_image_available(context, image_meta):
-                meta_subset = utils.subset_dict(image_meta, ('id', 'name'))
-                images.append(meta_subset)
-        return images
+        # NOTE(sirp): We need to use `get_images_detailed` and not
+        # `get_images` here because we need `is_public` and `properties`
+        # included so we can filter by user
+        return [utils.subset_dict(image_meta, ('id', 'name'))
+                for image_meta in self._get_available_images(context,
+                                                             **kwargs)]
 
     def detail(self, context, **kwargs):
         """Calls out to Glance for a list of detailed image information."""
-        params = self._extract_query_params(kwargs)
-        image_metas = self._get_images(context, **params)
+        return [self._translate_from_glance(image_meta)
+                for image_meta in self._get_available_images(context,
+                                                             **kwargs)]
 
-        images = []
-        for image_meta in image_metas:
+    def _get_available_images(self, context, **kwargs):
+        """Yields the images available to context, at most limit of them.
+
+        Glance counts images context can't see towards the limit, so pages
+        are fetched until limit available images have been found.
+        """
+        params = self._extract_query_params(kwargs)
+        limit = params.pop('limit', None)
+        if limit is not None and limit <= 0:
+            return
+        count = 0
+        for image_meta in self._get_images(context, page_size=limit,
+                                           **params):
             if self._is_image_available(context, image_meta):
-                base_image_meta = self._translate_from_glance(image_meta)
-                images.append(base_image_meta)
-        return images
+                yield image_meta
+                count += 1
+                if count == limit:
+                    return
 
     def _extract_query_params(self, params):
         _params = {}
@@ -165,7 +358,7 @@ class GlanceImageService(object):
 
         return _params
 
-    def _get_images(self, context, **kwargs):
+    def _get_images(self, context, page_size=None, **kwargs):
         """Get image entitites from images service"""
 
         # ensure filters is a dict
@@ -173,8 +366,11 @@ class GlanceImageService(object):
         # NOTE(vish): don't filter out private images
         kwargs['filters'].setdefault('is_public', 'none')
 
-        client = self._get_client(context)
-        return self._fetch_images(client.get_images_detailed, **kwargs)
+        fetch_func = functools.partial(self._call, context,
+                                       'get_images_detailed')
+        if page_size is not None:
+            fetch_func = functools.partial(fetch_func, limit=page_size)
+        return self._fetch_images(fetch_func, **kwargs)
 
     def _fetch_images(self, fetch_func, **kwargs):
         """Paginate through results from glance server"""
@@ -207,10 +403,13 @@ class GlanceImageService(object):
 
     def show(self, context, image_id):
         """Returns a dict with image data for the given opaque image id."""
-        try:
-            image_meta = self._get_client(context).get_image_meta(image_id)
-        except glance_exception.NotFound:
-            raise exception.ImageNotFound(image_id=image_id)
+        image_meta = self._get_cached_image_meta(context, image_id)
+        if image_meta is None:
+            try:
+                image_meta = self._call(context, 'get_image_meta', image_id)
+            except glance_exception.NotFound:
+                raise exception.ImageNotFound(image_id=image_id)
+            self._cache_image_meta(context, image_id, image_meta)
 
         if not self._is_image_available(context, image_meta):
             raise exception.ImageNotFound(image_id=image_id)
@@ -218,6 +417,37 @@ class GlanceImageService(object):
         base_image_meta = self._translate_from_glance(image_meta)
         return base_image_meta
 
+    @staticmethod
+    def _show_cache_key(context, image_id):
+        """Glance itself decides whether a request with an auth_token may
+        see an image, so metadata fetched with a token is only handed to
+        requests carrying the same token."""
+        return (str(image_id), getattr(context, 'auth_token', None))
+
+    def _get_cached_image_meta(self, context, image_id):
+        """Returns the cached metadata of image_id, or None."""
+        key = self._show_cache_key(context, image_id)
+        try:
+            expires, image_meta = _show_cache[key]
+        except KeyError:
+            return None
+        if expires < time.time():
+            _show_cache.pop(key, None)
+            return None
+        return copy.deepcopy(image_meta)
+
+    def _cache_image_meta(self, context, image_id, image_meta):
+        if FLAGS.glance_show_cache_ttl:
+            expires = time.time() + FLAGS.glance_show_cache_ttl
+            key = self._show_cache_key(context, image_id)
+            _show_cache[key] = (expires, copy.deepcopy(image_meta))
+
+    def _uncache_image_meta(self, image_id):
+        """Drops the cached metadata of image_id for every token."""
+        for key in _show_cache.keys():
+            if key[0] == str(image_id):
+                _show_cache.pop(key, None)
+
     def show_by_name(self, context, name):
         """Returns a dict containing image data for the given name."""
         # TODO(vish): replace this with more efficient call when glance
@@ -228,11 +458,25 @@ class GlanceImageService(object):
                 return image_meta
         raise exception.ImageNotFound(image_id=name)
 
-    def get(self, context, image_id, data):
-        """Calls out to Glance for metadata and data and writes data."""
+    def get(self, context, image_id, data, offset=0):
+        """Calls out to Glance for metadata and data and writes data.
+
+        If offset is given data already holds that many bytes of the image
+        and only the rest is requested. Should glance send the whole image
+        anyway, data is truncated first.
+
+        """
+        # NOTE: the image data is read after the call returns, so this
+        # uses a client of its own rather than one from the pool.
         try:
             client = self._get_client(context)
-            image_meta, image_chunks = client.get_image(image_id)
+            if offset:
+                image_meta, image_chunks, partial = _get_image_range(
+                        client, image_id, offset)
+                if not partial:
+                    data.truncate(0)
+            else:
+                image_meta, image_chunks = client.get_image(image_id)
         except glance_exception.NotFound:
             raise exception.ImageNotFound(image_id=image_id)
 
@@ -255,8 +499,8 @@ class GlanceImageService(object):
         LOG.debug(_('Metadata after formatting for Glance %s'),
                   sent_service_image_meta)
 
-        recv_service_image_meta = self._get_client(context).add_image(
-            sent_service_image_meta, data)
+        recv_service_image_meta = self._call(context, 'add_image',
+                                             sent_service_image_meta, data)
 
         # Translate Service -> Base
         base_image_meta = self._translate_from_glance(recv_service_image_meta)
@@ -274,10 +518,12 @@ class GlanceImageService(object):
         self.show(context, image_id)
         image_meta = self._translate_to_glance(image_meta)
         try:
-            client = self._get_client(context)
-            image_meta = client.update_image(image_id, image_meta, data)
+            image_meta = self._call(context, 'update_image', image_id,
+                                    image_meta, data)
         except glance_exception.NotFound:
             raise exception.ImageNotFound(image_id=image_id)
+        finally:
+            self._uncache_image_meta(image_id)
 
         base_image_meta = self._translate_from_glance(image_meta)
         return base_image_meta
@@ -291,9 +537,11 @@ class GlanceImageService(object):
         # NOTE(vish): show is to check if image is available
         self.show(context, image_id)
         try:
-            result = self._get_client(context).delete_image(image_id)
+            result = self._call(context, 'delete_image', image_id)
         except glance_exception.NotFound:
             raise exception.ImageNotFound(image_id=image_id)
+        finally:
+            self._uncache_image_meta(image_id)
         return result
 
     def delete_all(self):
@@ -23,6 +23,8 @@ import inspect
 import netaddr
 import os
 
+from eventlet import greenthread
+
 from nova import db
 from nova import exception
 from nova import flags
@@ -73,6 +75,13 @@ flags.DEFINE_bool('send_arp_for_ha', False,
 flags.DEFINE_bool('use_single_default_gateway',
                    False, 'Use single default gateway. Only first nic of vm'
                           ' will get default gateway from dhcp server')
+flags.DEFINE_bool('iptables_incremental_apply', False,
+                  'Only restore the nova chains that changed since the last'
+                  ' apply instead of rewriting whole tables. Assumes nothing'
+                  ' else modifies those chains.')
+flags.DEFINE_float('iptables_apply_delay', 0,
+                   'Seconds to wait before applying iptables changes so that'
+                   ' changes made meanwhile are applied together')
 binary_name = os.path.basename(inspect.stack()[-1][1])
 
 
@@ -291,7 +300,11 @@ class IptablesManager(object):
         self.ipv4['nat'].add_chain('floating-snat')
         self.ipv4['nat'].add_rule('snat', '-j $floating-snat')
 
-    @utils.synchronized('iptables', external=True)
+        # What was last applied to each (command, table), see apply().
+        self._applied_states = {}
+        self._generation = 0
+        self._applied_generation = 0
+
     def apply(self):
         """Apply the current in-memory set of iptables rules.
 
@@ -299,23 +312,104 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        Calls made while another apply is waiting for the lock are served
+        by that apply.
+
         """
+        self._generation += 1
+        generation = self._generation
+        if FLAGS.iptables_apply_delay > 0:
+            greenthread.sleep(FLAGS.iptables_apply_delay)
+        self._apply(generation)
+
+    @utils.synchronized('iptables', external=True)
+    def _apply(self, generation):
+        if self._applied_generation >= generation:
+            return
+        # Anything changed after this point comes with a later generation.
+        applying = self._generation
+
         s = [('iptables', self.ipv4)]
         if FLAGS.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
             for table in tables:
-                current_table, _ = self.execute('%s-save' % (cmd,),
-                                                '-t', '%s' % (table,),
-                                                run_as_root=True,
-                                                attempts=5)
-                current_lines = current_table.split('\n')
-                new_filter = self._modify_rules(current_lines,
-                                                tables[table])
-                self.execute('%s-restore' % (cmd,), run_as_root=True,
-                             process_input='\n'.join(new_filter),
-                             attempts=5)
+                state = self._table_state(tables[table])
+                lines = None
+                applied_state = self._applied_states.get((cmd, table))
+                if FLAGS.iptables_incremental_apply and applied_state:
+                    lines = self._changed_chain_rules(applied_state, state)
+
+                if lines is None:
+                    current_table, _ = self.execute('%s-save' % (cmd,),
+                                                    '-t', '%s' % (table,),
+                                                    run_as_root=True,
+                                                    attempts=5)
+                    current_lines = current_table.split('\n')
+                    new_filter = self._modify_rules(current_lines,
+                                                    tables[table])
+                    self.execute('%s-restore' % (cmd,), run_as_root=True,
+                                 process_input='\n'.join(new_filter),
+                                 attempts=5)
+                elif lines:
+                    # Declaring a chain with --noflush empties it, other
+                    # chains are left alone.
+                    lines = ['*%s' % (table,)] + lines + ['COMMIT', '']
+                    self.execute('%s-restore' % (cmd,), '--noflush',
+                                 run_as_root=True,
+                                 process_input='\n'.join(lines),
+                                 attempts=5)
+                self._applied_states[(cmd, table)] = state
+
+        self._applied_generation = applying
+
+    def _table_state(self, table):
+        """Return the rules of table as (wrapped, unwrapped).
+
+        wrapped maps each wrapped chain to its rule lines, unwrapped holds
+        the unwrapped chains and rules which other binaries share.
+
+        """
+        wrapped = dict((name, []) for name in table.chains)
+        unwrapped = []
+        for rule in table.rules:
+            if rule.wrap:
+                wrapped.setdefault(rule.chain, []).append(str(rule))
+            else:
+                unwrapped.append((str(rule), rule.top))
+
+        # Like _modify_rules, the last of identical rules wins.
+        for name, rules in wrapped.iteritems():
+            seen_rules = set()
+            deduped = []
+            for rule in reversed(rules):
+                if rule not in seen_rules:
+                    seen_rules.add(rule)
+                    deduped.append(rule)
+            deduped.reverse()
+            wrapped[name] = deduped
+
+        return wrapped, (frozenset(table.unwrapped_chains), unwrapped)
+
+    def _changed_chain_rules(self, old_state, new_state):
+        """Return iptables-restore --noflush lines going from old_state to
+        new_state, or None if the whole table needs to be rewritten."""
+        old_wrapped, old_unwrapped = old_state
+        new_wrapped, new_unwrapped = new_state
+        if old_unwrapped != new_unwrapped:
+            return None
+
+        changed = sorted(name for name, rules in new_wrapped.iteritems()
+                         if old_wrapped.get(name) != rules)
+        removed = sorted(set(old_wrapped) - set(new_wrapped))
+
+        lines = [':%s-%s - [0:0]' % (binary_name, name)
+                 for name in changed + removed]
+        for name in changed:
+            lines += new_wrapped[name]
+        lines += ['-X %s-%s' % (binary_name, name) for name in removed]
+        return lines
 
     def _modify_rules(self, current_lines, table, binary=None):
         unwrapped_chains = table.unwrapped_chains
@@ -337,16 +431,20 @@ class IptablesManager(object):
                     break
 
         our_rules = []
+        top_rules = set()
         for rule in rules:
             rule_str = str(rule)
             if rule.top:
-                # rule.top == True means we want this rule to be at the top.
-                # Further down, we weed out duplicates from the bottom of the
-                # list, so here we remove the dupes ahead of time.
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
+                top_rules.add(rule_str.strip())
             our_rules += [rule_str]
 
+        if top_rules:
+            # rule.top == True means we want this rule to be at the top.
+            # Further down, we weed out duplicates from the bottom of the
+            # list, so here we remove the dupes ahead of time.
+            new_filter = filter(lambda s: s.strip() not in top_rules,
+                                new_filter)
+
         new_filter[rules_index:rules_index] = our_rules
 
         new_filter[rules_index:rules_index] = [':%s - [0:0]' % \
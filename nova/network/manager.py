@@ -50,6 +50,7 @@ import math
 import netaddr
 import re
 import socket
+import string
 from eventlet import greenpool
 
 from nova import context
@@ -64,6 +65,7 @@ from nova import utils
 from nova import rpc
 from nova.network import api as network_api
 from nova.compute import api as compute_api
+from nova.compute import utils as compute_utils
 import random
 
 
@@ -115,6 +117,41 @@ flags.DEFINE_bool('force_dhcp_release', False,
                   'If True, send a dhcp release on instance termination')
 
 
+def _ip_regex_to_like(regex):
+    """Translates an ip filter into an equivalent LIKE pattern.
+
+    The ip filter is applied with re.match, so it is anchored at the
+    start but not at the end.  Filters built only from hex digits, ':',
+    escaped '.', '.', '.*' and anchors translate exactly, so '^10\\.0\\.'
+    becomes the prefix range '10.0.%'.  Returns None for anything else.
+    """
+    if regex.startswith('^'):
+        regex = regex[1:]
+    pattern = []
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\' and i + 1 < len(regex) and regex[i + 1] in '.:':
+            pattern.append(regex[i + 1])
+            i += 2
+        elif char == '.' and regex[i + 1:i + 2] == '*':
+            pattern.append('%')
+            i += 2
+        elif char == '.':
+            pattern.append('_')
+            i += 1
+        elif char == '$' and i == len(regex) - 1:
+            return ''.join(pattern)
+        elif char in string.hexdigits or char == ':':
+            pattern.append(char)
+            i += 1
+        else:
+            return None
+    if pattern[-1:] != ['%']:
+        pattern.append('%')
+    return ''.join(pattern)
+
+
 class AddressAlreadyAllocated(exception.Error):
     """Address was already allocated."""
     pass
@@ -296,6 +333,7 @@ class FloatingIP(object):
                                                self.host)
         self.driver.bind_floating_ip(floating_address)
         self.driver.ensure_floating_forward(floating_address, fixed_address)
+        compute_utils.invalidate_metadata(context, address=fixed_address)
 
     def disassociate_floating_ip(self, context, floating_address):
         """Disassociates a floating ip."""
@@ -303,6 +341,7 @@ class FloatingIP(object):
                                                          floating_address)
         self.driver.unbind_floating_ip(floating_address)
         self.driver.remove_floating_forward(floating_address, fixed_address)
+        compute_utils.invalidate_metadata(context, address=fixed_address)
 
     def deallocate_floating_ip(self, context, floating_address):
         """Returns an floating ip to the pool."""
@@ -406,6 +445,79 @@ class NetworkManager(manager.SchedulerDependentManager):
         return vifs
 
     def get_instance_uuids_by_ip_filter(self, context, filters):
+        fixed_ip_filter = filters.get('fixed_ip')
+        ip_filter = filters.get('ip')
+        ipv6_filter = filters.get('ip6')
+
+        ip_filter_pattern = None
+        if ip_filter is not None:
+            ip_filter_pattern = _ip_regex_to_like(str(ip_filter))
+
+        if ipv6_filter is not None or \
+           (ip_filter is not None and ip_filter_pattern is None):
+            # ipv6 addresses are not stored and real regexes can't be
+            # handed to the database, so these still scan every vif.
+            results = self._get_instances_by_ip_scan(context, filters)
+        else:
+            results = []
+            # An address never contains LIKE wildcards, so a fixed_ip
+            # filter with them can't match anything.
+            if fixed_ip_filter is not None and \
+               not set('%_\\').intersection(fixed_ip_filter):
+                for fixed_ip in self.db.fixed_ip_get_all_by_address_pattern(
+                        context, fixed_ip_filter):
+                    if fixed_ip['address'] == fixed_ip_filter:
+                        results.append(fixed_ip)
+            if ip_filter_pattern is not None:
+                regex = re.compile(str(ip_filter))
+                results.extend(self._get_ips_by_address_pattern(context,
+                                   ip_filter_pattern, regex))
+            results = self._ip_filter_results(results)
+
+        # NOTE(jkoelker) Until we switch over to instance_uuid ;)
+        ids = [res['instance_id'] for res in results]
+        uuid_map = self.db.instance_get_id_to_uuid_mapping(context, ids)
+        for res in results:
+            res['instance_uuid'] = uuid_map.get(res['instance_id'])
+        return results
+
+    def _get_ips_by_address_pattern(self, context, pattern, regex):
+        """Fixed ips, and floating ips forwarding to fixed ips that did not
+        match themselves, whose address matches a LIKE pattern and regex."""
+        fixed_ips = [fixed_ip for fixed_ip
+                     in self.db.fixed_ip_get_all_by_address_pattern(context,
+                                                                    pattern)
+                     if regex.match(fixed_ip['address'])]
+        matched = set([fixed_ip['id'] for fixed_ip in fixed_ips])
+        floating_ips = []
+        for floating_ip in self.db.floating_ip_get_all_by_address_pattern(
+                context, pattern):
+            fixed_ip = floating_ip['fixed_ip']
+            if fixed_ip['id'] in matched or \
+               not regex.match(floating_ip['address']):
+                continue
+            floating_ips.append({'address': floating_ip['address'],
+                                 'instance_id': fixed_ip['instance_id'],
+                                 'virtual_interface_id':
+                                         fixed_ip['virtual_interface_id']})
+        return fixed_ips + floating_ips
+
+    def _ip_filter_results(self, ips):
+        """Orders matched ips by vif like the scan does, one result per
+        instance and address."""
+        ips = sorted(ips, key=lambda ip: ip['virtual_interface_id'])
+        results = []
+        seen = set()
+        for ip in ips:
+            key = (ip['instance_id'], ip['address'])
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append({'instance_id': ip['instance_id'],
+                            'ip': ip['address']})
+        return results
+
+    def _get_instances_by_ip_scan(self, context, filters):
         fixed_ip_filter = filters.get('fixed_ip')
         ip_filter = re.compile(str(filters.get('ip')))
         ipv6_filter = re.compile(str(filters.get('ip6')))
@@ -445,12 +557,6 @@ class NetworkManager(manager.SchedulerDependentManager):
                         results.append({'instance_id': vif['instance_id'],
                                         'ip': floating_ip['address']})
                         continue
-
-        # NOTE(jkoelker) Until we switch over to instance_uuid ;)
-        ids = [res['instance_id'] for res in results]
-        uuid_map = self.db.instance_get_id_to_uuid_mapping(context, ids)
-        for res in results:
-            res['instance_uuid'] = uuid_map.get(res['instance_id'])
         return results
 
     def _get_networks_for_instance(self, context, instance_id, project_id,
@@ -671,6 +777,7 @@ class NetworkManager(manager.SchedulerDependentManager):
             values = {'allocated': True,
                       'virtual_interface_id': vif['id']}
             self.db.fixed_ip_update(context, address, values)
+            compute_utils.invalidate_metadata(context, address=address)
 
         self._setup_network(context, network)
         return address
@@ -685,6 +792,7 @@ class NetworkManager(manager.SchedulerDependentManager):
         instance_id = instance_ref['id']
         self._do_trigger_security_group_members_refresh_for_instance(
                                                                    instance_id)
+        compute_utils.invalidate_metadata(context, address=address)
         if FLAGS.force_dhcp_release:
             dev = self.driver.get_dev(fixed_ip_ref['network'])
             vif = self.db.virtual_interface_get_by_instance_and_network(
@@ -1087,6 +1195,7 @@ class VlanManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
         values = {'allocated': True,
                   'virtual_interface_id': vif['id']}
         self.db.fixed_ip_update(context, address, values)
+        compute_utils.invalidate_metadata(context, address=address)
         self._setup_network(context, network)
         return address
 
@@ -0,0 +1,107 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Long running root helper.
+
+nova-rootwrap-daemon is started once through the root_helper and then runs
+every command that utils.execute is asked to run as root, so each of them
+does not need its own sudo. Requests and responses are single lines of
+JSON exchanged over the daemon's stdin and stdout, which means only the
+process that started the daemon can talk to it. Each request carries an
+id and is run in its own thread, so slow commands do not hold up the
+others and responses may come back in any order.
+
+This module only uses the standard library because the daemon runs
+without eventlet.
+"""
+
+import base64
+import json
+import subprocess
+import threading
+
+
+def encode_request(request_id, cmd, process_input=None):
+    """Returns the line sent to the daemon to run cmd."""
+    request = {'id': request_id, 'cmd': cmd}
+    if process_input is not None:
+        request['input'] = base64.b64encode(process_input)
+    return json.dumps(request) + '\n'
+
+
+def decode_response(line):
+    """Returns the request id and the result of a response line.
+
+    The result is a (returncode, stdout, stderr) tuple, or an OSError if
+    the command could not be started at all.
+    """
+    response = json.loads(line)
+    if 'error' in response:
+        return response['id'], OSError(response['errno'], response['error'])
+    return response['id'], (response['returncode'],
+                            base64.b64decode(response['stdout']),
+                            base64.b64decode(response['stderr']))
+
+
+def _run(request):
+    """Runs one request and returns its response dict."""
+    process_input = request.get('input')
+    if process_input is not None:
+        process_input = base64.b64decode(process_input)
+    try:
+        obj = subprocess.Popen(request['cmd'],
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               close_fds=True)
+    except OSError, e:
+        return {'id': request['id'], 'errno': e.errno, 'error': e.strerror}
+    stdout, stderr = obj.communicate(process_input)
+    return {'id': request['id'],
+            'returncode': obj.returncode,
+            'stdout': base64.b64encode(stdout),
+            'stderr': base64.b64encode(stderr)}
+
+
+def serve(infile, outfile):
+    """Runs the requests read from infile until it is closed and writes
+    their responses to outfile.
+    """
+    write_lock = threading.Lock()
+    threads = []
+
+    def run_and_reply(request):
+        response = json.dumps(_run(request)) + '\n'
+        write_lock.acquire()
+        try:
+            outfile.write(response)
+            outfile.flush()
+        finally:
+            write_lock.release()
+
+    for line in iter(infile.readline, ''):
+        thread = threading.Thread(target=run_and_reply,
+                                  args=(json.loads(line),))
+        thread.setDaemon(True)
+        thread.start()
+        threads = [t for t in threads if t.isAlive()]
+        threads.append(thread)
+
+    # Our parent has gone away, finish what it asked for and exit.
+    for thread in threads:
+        thread.join()
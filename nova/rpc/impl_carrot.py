@@ -476,9 +476,14 @@ def msg_reply(msg_id, reply=None, failure=None):
 def _unpack_context(msg):
     """Unpack context from msg."""
     context_dict = {}
+    # NOTE(vish): Some versions of python don't like unicode keys
+    #             in kwargs.
+    packed = msg.pop('_context', None)
+    if packed is not None:
+        # Sent by the kombu driver with rpc_compact_envelope
+        for key, value in packed.iteritems():
+            context_dict[str(key)] = value
     for key in list(msg.keys()):
-        # NOTE(vish): Some versions of python don't like unicode keys
-        #             in kwargs.
         key = str(key)
         if key.startswith('_context_'):
             value = msg.pop(key)
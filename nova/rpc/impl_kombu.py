@@ -18,7 +18,9 @@ import kombu
 import kombu.entity
 import kombu.messaging
 import kombu.connection
+import heapq
 import itertools
+import json
 import sys
 import time
 import traceback
@@ -28,17 +30,44 @@ import uuid
 import eventlet
 from eventlet import greenpool
 from eventlet import pools
+from eventlet import semaphore
 import greenlet
 
 from nova import context
 from nova import exception
 from nova import flags
+from nova import utils
 from nova.rpc.common import RemoteError, LOG
 
 # Needed for tests
 eventlet.monkey_patch()
 
 FLAGS = flags.FLAGS
+flags.DEFINE_string('rpc_serializer', 'json',
+                    'Serializer for rpc messages: json, or msgpack if the '
+                    'msgpack module is installed on every node')
+flags.DEFINE_boolean('rpc_compact_envelope', False,
+                     'Send the request context as one nested object '
+                     'instead of one _context_ key per attribute. Nodes '
+                     'running older code only understand the latter, so '
+                     'only turn this on once every node is upgraded.')
+flags.DEFINE_list('rpc_method_concurrency', [],
+                  'Limits on how many calls of a method may run at once, '
+                  'as method:limit pairs such as run_instance:4. Further '
+                  'calls wait until one of the running ones is done.')
+flags.DEFINE_list('rpc_method_priorities', [],
+                  'Priorities of methods as method:priority pairs. Waiting '
+                  'calls with a higher priority start first, the default '
+                  'priority is 0.')
+flags.DEFINE_list('rpc_coalesce_methods',
+                  ['refresh_security_group_rules',
+                   'refresh_security_group_members',
+                   'refresh_provider_fw_rules'],
+                  'Casts to these methods are dropped when an identical '
+                  'cast is already waiting to run')
+flags.DEFINE_integer('rpc_prefetch_count', 0,
+                     'Maximum number of unacknowledged messages the broker '
+                     'sends to a consumer, 0 for no limit')
 
 
 class ConsumerBase(object):
@@ -227,10 +256,15 @@ class Publisher(object):
         self.exchange = kombu.entity.Exchange(name=self.exchange_name,
                 **self.kwargs)
         self.producer = kombu.messaging.Producer(exchange=self.exchange,
-                channel=channel, routing_key=self.routing_key)
+                channel=channel, routing_key=self.routing_key,
+                serializer=FLAGS.rpc_serializer)
 
     def send(self, msg):
         """Send a message"""
+        if FLAGS.rpc_serializer != 'json':
+            # json serializes through utils.dumps, which already copes
+            # with objects; other codecs only take primitives.
+            msg = utils.to_primitive(msg)
         self.producer.publish(msg)
 
 
@@ -295,6 +329,7 @@ class Connection(object):
     def __init__(self):
         self.consumers = []
         self.consumer_thread = None
+        self.proxy_callbacks = {}
         self.max_retries = FLAGS.rabbit_max_retries
         # Try forever?
         if self.max_retries <= 0:
@@ -348,15 +383,24 @@ class Connection(object):
             sys.exit(1)
         LOG.info(_('Connected to AMQP server on %(hostname)s:%(port)d' %
                 self.params))
-        self.channel = self.connection.channel()
-        # work around 'memory' transport bug in 1.1.3
-        if self.memory_transport:
-            self.channel._new_queue('ae.undeliver')
+        self._open_channel()
         for consumer in self.consumers:
             consumer.reconnect(self.channel)
         if self.consumers:
             LOG.debug(_("Re-established AMQP queues"))
 
+    def _open_channel(self):
+        """Open a new channel on the connection"""
+        self.channel = self.connection.channel()
+        # work around 'memory' transport bug in 1.1.3
+        if self.memory_transport:
+            self.channel._new_queue('ae.undeliver')
+        if FLAGS.rpc_prefetch_count:
+            # Messages are acked once ProxyCallback has queued them, and
+            # it stops taking them when its queue is full, so this bounds
+            # what the broker pushes at a busy consumer.
+            self.channel.basic_qos(0, FLAGS.rpc_prefetch_count, False)
+
     def get_channel(self):
         """Convenience call for bin/clear_rabbit_queues"""
         return self.channel
@@ -380,10 +424,7 @@ class Connection(object):
         """Reset a connection so it can be used again"""
         self.cancel_consumer_thread()
         self.channel.close()
-        self.channel = self.connection.channel()
-        # work around 'memory' transport bug in 1.1.3
-        if self.memory_transport:
-            self.channel._new_queue('ae.undeliver')
+        self._open_channel()
         self.consumers = []
 
     def declare_consumer(self, consumer_cls, topic, callback):
@@ -490,10 +531,16 @@ class Connection(object):
 
     def create_consumer(self, topic, proxy, fanout=False):
         """Create a consumer that calls a method in a proxy object"""
+        # NOTE: the topic, topic.host and fanout consumers of a service
+        # share one dispatcher so its limits and stats are per service
+        callback = self.proxy_callbacks.get(id(proxy))
+        if callback is None:
+            callback = ProxyCallback(proxy)
+            self.proxy_callbacks[id(proxy)] = callback
         if fanout:
-            self.declare_fanout_consumer(topic, ProxyCallback(proxy))
+            self.declare_fanout_consumer(topic, callback)
         else:
-            self.declare_topic_consumer(topic, ProxyCallback(proxy))
+            self.declare_topic_consumer(topic, callback)
 
 
 class Pool(pools.Pool):
@@ -578,17 +625,35 @@ class ConnectionContext(object):
 
 
 class ProxyCallback(object):
-    """Calls methods on a proxy object based on method and args."""
+    """Calls methods on a proxy object based on method and args.
+
+    Calls wait in a queue until one of the rpc_thread_pool_size workers is
+    free and fewer calls of the same method than its rpc_method_concurrency
+    limit are running, and the waiting call with the highest priority goes
+    first. Once rpc_thread_pool_size calls are waiting, the consumer stops
+    taking messages off the queue until some of them have started. Calls
+    of methods with a concurrency limit don't count towards that, so a
+    flood of them can't hold up the other methods.
+
+    """
 
     def __init__(self, proxy):
         self.proxy = proxy
         self.pool = greenpool.GreenPool(FLAGS.rpc_thread_pool_size)
+        self.limits = _parse_method_values(FLAGS.rpc_method_concurrency)
+        self.priorities = _parse_method_values(FLAGS.rpc_method_priorities)
+        self.room = semaphore.Semaphore(FLAGS.rpc_thread_pool_size)
+        self.waiting = []
+        self.waiting_casts = set()
+        self.sequence = itertools.count()
+        self.workers = 0
+        self.stats = {}
 
     def __call__(self, message_data):
         """Consumer callback to call a method on a proxy object.
 
-        Parses the message for validity and fires off a thread to call the
-        proxy object method.
+        Parses the message for validity and queues it to be run by one of
+        the worker threads.
 
         Message data should be a dictionary with two keys:
             method: string representing the method to call
@@ -597,15 +662,104 @@ class ProxyCallback(object):
         Example: {'method': 'echo', 'args': {'value': 42}}
 
         """
-        LOG.debug(_('received %s') % message_data)
+        LOG.debug(_('received %s'), message_data)
         ctxt = _unpack_context(message_data)
         method = message_data.get('method')
         args = message_data.get('args', {})
         if not method:
-            LOG.warn(_('no method for message: %s') % message_data)
+            LOG.warn(_('no method for message: %s'), message_data)
             ctxt.reply(_('No method for message: %s') % message_data)
             return
-        self.pool.spawn_n(self._process_data, ctxt, method, args)
+
+        stats = self.get_method_stats(method)
+        key = None
+        if method in FLAGS.rpc_coalesce_methods and not ctxt.msg_id:
+            key = (method, json.dumps(args, sort_keys=True))
+            if key in self.waiting_casts:
+                LOG.debug(_('%s is already waiting to run, dropping it'),
+                          method)
+                stats['coalesced'] += 1
+                return
+            self.waiting_casts.add(key)
+
+        if method not in self.limits:
+            # Blocks the consumer while the queue is full.
+            self.room.acquire()
+        priority = self.priorities.get(method, 0)
+        heapq.heappush(self.waiting, (-priority, self.sequence.next(),
+                                      method, ctxt, args, key, time.time()))
+        stats['waiting'] += 1
+        if self.workers < FLAGS.rpc_thread_pool_size:
+            self.workers += 1
+            self.pool.spawn_n(self._worker)
+
+    def get_method_stats(self, method):
+        """Returns the counters kept for method.
+
+        waiting and running are the number of calls currently queued and
+        running, processed the number finished, coalesced the number of
+        casts dropped, and wait_time, max_wait_time and run_time are in
+        seconds.
+
+        """
+        if method not in self.stats:
+            self.stats[method] = {'waiting': 0,
+                                  'running': 0,
+                                  'processed': 0,
+                                  'coalesced': 0,
+                                  'wait_time': 0.0,
+                                  'max_wait_time': 0.0,
+                                  'run_time': 0.0}
+        return self.stats[method]
+
+    def _next_call(self):
+        """Pops the waiting call with the highest priority whose method
+        is below its concurrency limit, or returns None.
+        """
+        blocked = []
+        call = None
+        while self.waiting:
+            item = heapq.heappop(self.waiting)
+            method = item[2]
+            limit = self.limits.get(method)
+            if limit is None or self.stats[method]['running'] < limit:
+                call = item
+                break
+            blocked.append(item)
+        for item in blocked:
+            heapq.heappush(self.waiting, item)
+        return call
+
+    def _worker(self):
+        """Runs waiting calls until none of them can be started."""
+        try:
+            while True:
+                call = self._next_call()
+                if call is None:
+                    return
+                method, ctxt, args, key, queued_at = call[2:]
+                self.waiting_casts.discard(key)
+                if method not in self.limits:
+                    self.room.release()
+                stats = self.stats[method]
+                stats['waiting'] -= 1
+                stats['running'] += 1
+                started_at = time.time()
+                try:
+                    self._process_data(ctxt, method, args)
+                except Exception:
+                    LOG.exception(_('Exception during message handling'))
+                finally:
+                    finished_at = time.time()
+                    wait_time = started_at - queued_at
+                    stats['running'] -= 1
+                    stats['processed'] += 1
+                    stats['wait_time'] += wait_time
+                    stats['max_wait_time'] = max(stats['max_wait_time'],
+                                                 wait_time)
+                    stats['run_time'] += finished_at - started_at
+        finally:
+            self.workers -= 1
 
     @exception.wrap_exception()
     def _process_data(self, ctxt, method, args):
@@ -632,16 +786,26 @@ class ProxyCallback(object):
         return
 
 
+def _parse_method_values(pairs):
+    """Turns a list of method:value strings into a dict of ints."""
+    values = {}
+    for pair in pairs:
+        method, sep, value = pair.partition(':')
+        values[method.strip()] = int(value)
+    return values
+
+
 def _unpack_context(msg):
     """Unpack context from msg."""
     context_dict = {}
-    for key in list(msg.keys()):
-        # NOTE(vish): Some versions of python don't like unicode keys
-        #             in kwargs.
-        key = str(key)
-        if key.startswith('_context_'):
-            value = msg.pop(key)
-            context_dict[key[9:]] = value
+    packed = msg.pop('_context', None)
+    if packed is not None:
+        for key, value in packed.iteritems():
+            # NOTE(vish): Some versions of python don't like unicode keys
+            #             in kwargs.
+            context_dict[str(key)] = value
+    for key in [key for key in msg if key.startswith('_context_')]:
+        context_dict[str(key[9:])] = msg.pop(key)
     context_dict['msg_id'] = msg.pop('_msg_id', None)
     LOG.debug(_('unpacked context: %s'), context_dict)
     return RpcContext.from_dict(context_dict)
@@ -650,12 +814,14 @@ def _unpack_context(msg):
 def _pack_context(msg, context):
     """Pack context into msg.
 
-    Values for message keys need to be less than 255 chars, so we pull
-    context out into a bunch of separate keys. If we want to support
-    more arguments in rabbit messages, we may want to do the same
-    for args at some point.
+    Every attribute of the context gets its own _context_<name> key as
+    older nodes expect, unless rpc_compact_envelope is turned on, in which
+    case the context goes into a single _context key.
 
     """
+    if FLAGS.rpc_compact_envelope:
+        msg['_context'] = context.to_dict()
+        return
     context_d = dict([('_context_%s' % key, value)
                       for (key, value) in context.to_dict().iteritems()])
     msg.update(context_d)
@@ -721,7 +887,7 @@ def multicall(context, topic, msg):
     LOG.debug(_('Making asynchronous call on %s ...'), topic)
     msg_id = uuid.uuid4().hex
     msg.update({'_msg_id': msg_id})
-    LOG.debug(_('MSG_ID is %s') % (msg_id))
+    LOG.debug(_('MSG_ID is %s'), msg_id)
     _pack_context(msg, context)
 
     conn = ConnectionContext()
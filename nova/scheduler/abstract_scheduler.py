@@ -180,6 +180,21 @@ class AbstractScheduler(driver.Scheduler):
         self._provision_resource_from_blob(context, build_plan_item,
                 instance_id, request_spec, kwargs)
 
+    def _claim_capacity(self, build_plan_item, request_spec):
+        """Claim the resources for a local build plan item in the
+        ZoneManager. Returns False if the host has filled up since the
+        build plan was made, in which case the item should be skipped.
+        """
+        host = build_plan_item.get('hostname')
+        if host is None or self.zone_manager is None:
+            return True
+        instance_type = request_spec.get('instance_type')
+        if self.zone_manager.claim_host_capacity(host, instance_type):
+            return True
+        LOG.debug(_("Skipping %(host)s, it no longer has room for the "
+                "instance") % locals())
+        return False
+
     def _adjust_child_weights(self, child_results, zones):
         """Apply the Scale and Offset values from the Zone definition
         to adjust the weights returned from the child zones. Alters
@@ -230,12 +245,14 @@ class AbstractScheduler(driver.Scheduler):
         if not build_plan:
             raise driver.NoValidHost(_('No hosts were available'))
 
-        for num in xrange(num_instances):
-            if not build_plan:
-                break
+        num_provisioned = 0
+        while build_plan and num_provisioned < num_instances:
             build_plan_item = build_plan.pop(0)
+            if not self._claim_capacity(build_plan_item, request_spec):
+                continue
             self._provision_resource(context, build_plan_item, instance_id,
                     request_spec, kwargs)
+            num_provisioned += 1
 
         # Returning None short-circuits the routing to Compute (since
         # we've already done it here)
@@ -103,6 +103,14 @@ def update_service_capabilities(context, service_name, host, capabilities):
     return rpc.fanout_cast(context, 'scheduler', kwargs)
 
 
+def release_resources(context, topic, host, amount):
+    """Tell all the scheduler services that an instance or volume using
+       amount cores or gigabytes on host is gone."""
+    kwargs = dict(method='release_resources',
+                  args=dict(topic=topic, host=host, amount=amount))
+    return rpc.fanout_cast(context, 'scheduler', kwargs)
+
+
 def call_zone_method(context, method_name, errors_to_ignore=None,
                      novaclient_collection_name='zones', zones=None,
                      *args, **kwargs):
@@ -21,22 +21,18 @@
 Scheduler base class that all Schedulers should inherit from
 """
 
-import datetime
-
 from nova import db
 from nova import exception
 from nova import flags
+from nova import heartbeat
 from nova import log as logging
 from nova import rpc
-from nova import utils
 from nova.compute import power_state
 from nova.compute import vm_states
 from nova.api.ec2 import ec2utils
 
 
 FLAGS = flags.FLAGS
-flags.DEFINE_integer('service_down_time', 60,
-                     'maximum time since last checkin for up service')
 flags.DECLARE('instances_path', 'nova.compute.manager')
 
 
@@ -63,10 +59,7 @@ class Scheduler(object):
     @staticmethod
     def service_is_up(service):
         """Check whether a service is up based on last heartbeat."""
-        last_heartbeat = service['updated_at'] or service['created_at']
-        # Timestamps in DB are UTC.
-        elapsed = utils.utcnow() - last_heartbeat
-        return elapsed < datetime.timedelta(seconds=FLAGS.service_down_time)
+        return heartbeat.is_up(service)
 
     def hosts_up(self, context, topic):
         """Return the list of hosts that have a running service for topic."""
@@ -76,6 +69,11 @@ class Scheduler(object):
                 for service in services
                 if self.service_is_up(service)]
 
+    def release_resources(self, context, topic, host, amount):
+        """Called when an instance or volume on host has been deleted.
+        Drivers that keep track of host load can override this."""
+        pass
+
     def schedule(self, context, topic, *_args, **_kwargs):
         """Must override at least this method for scheduler to work."""
         raise NotImplementedError(_("Must implement a fallback schedule"))
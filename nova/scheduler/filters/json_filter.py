@@ -96,48 +96,60 @@ class JsonFilter(abstract_filter.AbstractHostFilter):
                 ['>=', '$compute.disk_available', required_disk]]
         return (self._full_name(), json.dumps(query))
 
-    def _parse_string(self, string, host, services):
+    def _compile_lookup(self, string):
         """Strings prefixed with $ are capability lookups in the
         form '$service.capability[.subcap*]'.
         """
-        if not string:
-            return None
-        if not string.startswith("$"):
-            return string
-
         path = string[1:].split(".")
-        for item in path:
-            services = services.get(item, None)
-            if not services:
-                return None
-        return services
 
-    def _process_filter(self, zone_manager, query, host, services):
-        """Recursively parse the query structure."""
+        def lookup(services):
+            for item in path:
+                services = services.get(item, None)
+                if not services:
+                    return None
+            return services
+        return lookup
+
+    def _compile(self, query):
+        """Turn the query structure into a function of a host's services
+        returning the result of the query for that host."""
         if not query:
-            return True
-        cmd = query[0]
-        method = self.commands[cmd]
-        cooked_args = []
+            return lambda services: True
+        method = self.commands[query[0]]
+        args = []
         for arg in query[1:]:
             if isinstance(arg, list):
-                arg = self._process_filter(zone_manager, arg, host, services)
-            elif isinstance(arg, basestring):
-                arg = self._parse_string(arg, host, services)
-            if arg is not None:
-                cooked_args.append(arg)
-        result = method(self, cooked_args)
-        return result
+                arg = self._compile(arg)
+            elif isinstance(arg, basestring) and arg.startswith("$"):
+                arg = self._compile_lookup(arg)
+            else:
+                if isinstance(arg, basestring) and not arg:
+                    arg = None
+                arg = lambda services, value=arg: value
+            args.append(arg)
+
+        def evaluate(services):
+            cooked_args = []
+            for arg in args:
+                value = arg(services)
+                if value is not None:
+                    cooked_args.append(value)
+            return method(self, cooked_args)
+        return evaluate
+
+    def _process_filter(self, zone_manager, query, host, services):
+        """Recursively parse the query structure."""
+        return self._compile(query)(services)
 
     def filter_hosts(self, zone_manager, query):
         """Return a list of hosts that can fulfill the requirements
         specified in the query.
         """
-        expanded = json.loads(query)
+        # The query is parsed once, not again for every host
+        host_filter = self._compile(json.loads(query))
         filtered_hosts = []
         for host, services in zone_manager.service_states.iteritems():
-            result = self._process_filter(zone_manager, expanded, host,
-                    services)
+            result = host_filter(services)
             if isinstance(result, list):
                 # If any succeeded, include the host
                 result = any(result)
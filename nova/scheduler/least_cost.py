@@ -23,8 +23,6 @@ is then selected for provisioning.
 """
 
 
-import collections
-
 from nova import flags
 from nova import log as logging
 from nova.scheduler import base_scheduler
@@ -86,26 +84,17 @@ def weighted_sum(domain, weighted_fns, normalize=True):
     Returns an unsorted list of scores. To pair with hosts do:
         zip(scores, hosts)
     """
-    # Table of form:
-    #   { domain1: [score1, score2, ..., scoreM]
-    #     ...
-    #     domainN: [score1, score2, ..., scoreM] }
-    score_table = collections.defaultdict(list)
+    if not weighted_fns:
+        return []
+
+    # Running total of the weighted scores of each element in domain
+    domain_scores = [0] * len(domain)
     for weight, fn in weighted_fns:
         scores = [fn(elem) for elem in domain]
         if normalize:
-            norm_scores = normalize_list(scores)
-        else:
-            norm_scores = scores
-        for idx, score in enumerate(norm_scores):
-            weighted_score = score * weight
-            score_table[idx].append(weighted_score)
-
-    # Sum rows in table to compute score for each element in domain
-    domain_scores = []
-    for idx in sorted(score_table):
-        elem_score = sum(score_table[idx])
-        domain_scores.append(elem_score)
+            scores = normalize_list(scores)
+        for idx, score in enumerate(scores):
+            domain_scores[idx] += score * weight
     return domain_scores
 
 
@@ -159,13 +148,15 @@ class LeastCostScheduler(base_scheduler.BaseScheduler):
         costs = weighted_sum(domain=hosts, weighted_fns=cost_fns)
 
         weighted = []
-        weight_log = []
         for cost, (hostname, service) in zip(costs, hosts):
             caps = service[topic]
-            weight_log.append("%s: %s" % (hostname, "%.2f" % cost))
             weight_dict = dict(weight=cost, hostname=hostname,
                     capabilities=caps)
             weighted.append(weight_dict)
 
-        LOG.debug(_("Weighted Costs => %s") % weight_log)
+        if LOG.isEnabledFor(logging.DEBUG):
+            weight_log = ["%s: %.2f" % (weighted_host['hostname'],
+                                        weighted_host['weight'])
+                          for weighted_host in weighted]
+            LOG.debug(_("Weighted Costs => %s") % weight_log)
         return weighted
@@ -25,6 +25,7 @@ import functools
 
 from nova import db
 from nova import flags
+from nova import heartbeat
 from nova import log as logging
 from nova import manager
 from nova import rpc
@@ -77,6 +78,15 @@ class SchedulerManager(manager.Manager):
         self.zone_manager.update_service_capabilities(service_name,
                             host, capabilities)
 
+    def release_resources(self, context=None, topic=None, host=None,
+                          amount=0):
+        """Process a notification that resources on host were freed."""
+        self.driver.release_resources(context, topic, host, amount)
+
+    def service_heartbeat(self, context=None, service_id=None):
+        """Process a heartbeat sent by the rpc heartbeat driver."""
+        heartbeat.get_driver().record(context, service_id)
+
     def select(self, context=None, *args, **kwargs):
         """Select a list of hosts best matching the provided specs."""
         return self.driver.select(context, *args, **kwargs)
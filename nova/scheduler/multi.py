@@ -69,5 +69,10 @@ class MultiScheduler(driver.Scheduler):
         for k, v in self.drivers.iteritems():
             v.set_zone_manager(zone_manager)
 
+    def release_resources(self, context, topic, host, amount):
+        if topic in self.drivers:
+            self.drivers[topic].release_resources(context, topic, host,
+                                                  amount)
+
     def schedule(self, context, topic, *_args, **_kwargs):
         return self.drivers[topic].schedule(context, topic, *_args, **_kwargs)
@@ -21,6 +21,9 @@
 Simple Scheduler
 """
 
+import datetime
+import heapq
+
 from nova import db
 from nova import flags
 from nova import utils
@@ -34,11 +37,91 @@ flags.DEFINE_integer("max_gigabytes", 10000,
                      "maximum number of volume gigabytes to allow per host")
 flags.DEFINE_integer("max_networks", 1000,
                      "maximum number of networks to allow per host")
+flags.DEFINE_integer("simple_scheduler_reconcile_interval", 30,
+                     "seconds between reloading host loads from the db; "
+                     "0 reloads them for every request")
+
+
+class HostLoadIndex(object):
+    """Keeps the enabled hosts of one service ordered by load.
+
+    The index is loaded from the db the first time it is used and again
+    every simple_scheduler_reconcile_interval seconds. In between, it is
+    kept up to date with add() for every placement and release() for
+    every deletion, so picking a host does not hit the db.
+    """
+
+    def __init__(self, topic):
+        self.topic = topic
+        self._loads = {}
+        self._heap = []
+        self._loaded_at = None
+
+    def _reconcile(self, context):
+        """Reload the host loads from the db."""
+        self._loads = {}
+        loader = getattr(db, 'service_get_all_%s_sorted' % self.topic)
+        for service, load in loader(context):
+            if driver.Scheduler.service_is_up(service):
+                self._loads[service['host']] = load
+        self._rebuild_heap()
+        self._loaded_at = utils.utcnow()
+
+    def _rebuild_heap(self):
+        self._heap = [(load, host) for host, load in self._loads.iteritems()]
+        heapq.heapify(self._heap)
+
+    def _is_stale(self):
+        if self._loaded_at is None:
+            return True
+        interval = FLAGS.simple_scheduler_reconcile_interval
+        elapsed = utils.utcnow() - self._loaded_at
+        return elapsed >= datetime.timedelta(seconds=interval)
+
+    def least_loaded(self, context):
+        """Returns a (host, load) tuple for the least loaded host that was
+        up when the index was last reconciled, or None if there are none.
+        """
+        if self._is_stale():
+            self._reconcile(context)
+        while self._heap:
+            load, host = self._heap[0]
+            if self._loads.get(host) == load:
+                return host, load
+            # Outdated entry left behind by add() or release()
+            heapq.heappop(self._heap)
+        return None
+
+    def add(self, host, amount):
+        """Account for amount more load on host."""
+        if host not in self._loads:
+            return
+        self._loads[host] += amount
+        heapq.heappush(self._heap, (self._loads[host], host))
+        if len(self._heap) > 2 * len(self._loads) + 16:
+            self._rebuild_heap()
+
+    def release(self, host, amount):
+        """Account for amount less load on host."""
+        if host in self._loads:
+            self.add(host, -min(amount, self._loads[host]))
 
 
 class SimpleScheduler(chance.ChanceScheduler):
     """Implements Naive Scheduler that tries to find least loaded host."""
 
+    def __init__(self):
+        super(SimpleScheduler, self).__init__()
+        self.load_indexes = dict((topic, HostLoadIndex(topic))
+                                 for topic in ('compute', 'volume', 'network'))
+
+    def release_resources(self, context, topic, host, amount):
+        """Hand back the cores or gigabytes of a deleted instance or
+        volume to host.
+        """
+        if topic in self.load_indexes:
+            self.load_indexes[topic].release(host, amount)
+
     def _schedule_instance(self, context, instance_id, *_args, **_kwargs):
         """Picks a host that is up and has the fewest running instances."""
         instance_ref = db.instance_get(context, instance_id)
@@ -56,24 +139,25 @@ class SimpleScheduler(chance.ChanceScheduler):
             now = utils.utcnow()
             db.instance_update(context, instance_id, {'host': host,
                                                       'scheduled_at': now})
+            self.load_indexes['compute'].add(host, instance_ref['vcpus'])
             return host
-        results = db.service_get_all_compute_sorted(context)
-        for result in results:
-            (service, instance_cores) = result
-            if instance_cores + instance_ref['vcpus'] > FLAGS.max_cores:
-                raise driver.NoValidHost(_("All hosts have too many cores"))
-            if self.service_is_up(service):
-                # NOTE(vish): this probably belongs in the manager, if we
-                #             can generalize this somehow
-                now = utils.utcnow()
-                db.instance_update(context,
-                                   instance_id,
-                                   {'host': service['host'],
-                                    'scheduled_at': now})
-                return service['host']
-        raise driver.NoValidHost(_("Scheduler was unable to locate a host"
-                                   " for this request. Is the appropriate"
-                                   " service running?"))
+        result = self.load_indexes['compute'].least_loaded(context)
+        if result is None:
+            raise driver.NoValidHost(_("Scheduler was unable to locate a host"
+                                       " for this request. Is the appropriate"
+                                       " service running?"))
+        (host, instance_cores) = result
+        if instance_cores + instance_ref['vcpus'] > FLAGS.max_cores:
+            raise driver.NoValidHost(_("All hosts have too many cores"))
+        # NOTE(vish): this probably belongs in the manager, if we
+        #             can generalize this somehow
+        now = utils.utcnow()
+        db.instance_update(context,
+                           instance_id,
+                           {'host': host,
+                            'scheduled_at': now})
+        self.load_indexes['compute'].add(host, instance_ref['vcpus'])
+        return host
 
     def schedule_run_instance(self, context, instance_id, *_args, **_kwargs):
         return self._schedule_instance(context, instance_id, *_args, **_kwargs)
@@ -98,36 +182,36 @@ class SimpleScheduler(chance.ChanceScheduler):
             now = utils.utcnow()
             db.volume_update(context, volume_id, {'host': host,
                                                   'scheduled_at': now})
+            self.load_indexes['volume'].add(host, volume_ref['size'])
             return host
-        results = db.service_get_all_volume_sorted(context)
-        for result in results:
-            (service, volume_gigabytes) = result
-            if volume_gigabytes + volume_ref['size'] > FLAGS.max_gigabytes:
-                raise driver.NoValidHost(_("All hosts have too many "
-                                           "gigabytes"))
-            if self.service_is_up(service):
-                # NOTE(vish): this probably belongs in the manager, if we
-                #             can generalize this somehow
-                now = utils.utcnow()
-                db.volume_update(context,
-                                 volume_id,
-                                 {'host': service['host'],
-                                  'scheduled_at': now})
-                return service['host']
-        raise driver.NoValidHost(_("Scheduler was unable to locate a host"
-                                   " for this request. Is the appropriate"
-                                   " service running?"))
+        result = self.load_indexes['volume'].least_loaded(context)
+        if result is None:
+            raise driver.NoValidHost(_("Scheduler was unable to locate a host"
+                                       " for this request. Is the appropriate"
+                                       " service running?"))
+        (host, volume_gigabytes) = result
+        if volume_gigabytes + volume_ref['size'] > FLAGS.max_gigabytes:
+            raise driver.NoValidHost(_("All hosts have too many gigabytes"))
+        # NOTE(vish): this probably belongs in the manager, if we
+        #             can generalize this somehow
+        now = utils.utcnow()
+        db.volume_update(context,
+                         volume_id,
+                         {'host': host,
+                          'scheduled_at': now})
+        self.load_indexes['volume'].add(host, volume_ref['size'])
+        return host
 
     def schedule_set_network_host(self, context, *_args, **_kwargs):
         """Picks a host that is up and has the fewest networks."""
 
-        results = db.service_get_all_network_sorted(context)
-        for result in results:
-            (service, instance_count) = result
-            if instance_count >= FLAGS.max_networks:
-                raise driver.NoValidHost(_("All hosts have too many networks"))
-            if self.service_is_up(service):
-                return service['host']
-        raise driver.NoValidHost(_("Scheduler was unable to locate a host"
-                                   " for this request. Is the appropriate"
-                                   " service running?"))
+        result = self.load_indexes['network'].least_loaded(context)
+        if result is None:
+            raise driver.NoValidHost(_("Scheduler was unable to locate a host"
+                                       " for this request. Is the appropriate"
+                                       " service running?"))
+        (host, network_count) = result
+        if network_count >= FLAGS.max_networks:
+            raise driver.NoValidHost(_("All hosts have too many networks"))
+        self.load_indexes['network'].add(host, 1)
+        return host
@@ -204,6 +204,37 @@ class ZoneManager(object):
         service_caps[service_name] = capabilities
         self.service_states[host] = service_caps
 
+    def claim_host_capacity(self, host, instance_type):
+        """Reserve room for instance_type on host in the cached compute
+        capabilities so that requests scheduled before the host reports
+        again see the reduced capacity. The claim is dropped when the next
+        report replaces the cached capabilities.
+
+        Returns False, without claiming anything, if the host is no
+        longer able to fit the instance.
+        """
+        caps = self.service_states.get(host, {}).get('compute')
+        if not caps or not instance_type:
+            return True
+        memory = instance_type.get('memory_mb', 0) * 1024 * 1024
+        disk = instance_type.get('local_gb', 0) * 1024 * 1024 * 1024
+        vcpus = instance_type.get('vcpus', 0)
+
+        if caps.get('host_memory_free', memory) < memory:
+            return False
+        if caps.get('disk_available', disk) < disk:
+            return False
+
+        if 'host_memory_free' in caps:
+            caps['host_memory_free'] -= memory
+        if 'disk_available' in caps:
+            caps['disk_available'] -= disk
+        if 'vcpus_used' in caps:
+            caps['vcpus_used'] += vcpus
+        logging.debug(_("Claimed %(memory)d bytes of memory, %(disk)d bytes "
+                "of disk and %(vcpus)d vcpus on %(host)s") % locals())
+        return True
+
     def host_service_caps_stale(self, host, service):
         """Check if host service capabilites are not recent enough."""
         allowed_time_diff = FLAGS.periodic_interval * 3
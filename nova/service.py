@@ -29,6 +29,7 @@ from nova import context
 from nova import db
 from nova import exception
 from nova import flags
+from nova import heartbeat
 from nova import log as logging
 from nova import rpc
 from nova import utils
@@ -254,17 +255,10 @@ class Service(object):
         """Update the state of this service in the datastore."""
         ctxt = context.get_admin_context()
         try:
-            try:
-                service_ref = db.service_get(ctxt, self.service_id)
-            except exception.NotFound:
+            if not heartbeat.get_driver().beat(ctxt, self.service_id):
                 logging.debug(_('The service database object disappeared, '
                                 'Recreating it.'))
                 self._create_service_ref(ctxt)
-                service_ref = db.service_get(ctxt, self.service_id)
-
-            db.service_update(ctxt,
-                             self.service_id,
-                             {'report_count': service_ref['report_count'] + 1})
 
             # TODO(termie): make this pattern be more elegant.
             if getattr(self, 'model_disconnected', False):
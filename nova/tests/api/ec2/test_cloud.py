@@ -31,6 +31,7 @@ from nova import crypto
 from nova import db
 from nova import exception
 from nova import flags
+from nova import heartbeat
 from nova import log as logging
 from nova import network
 from nova import rpc
@@ -457,6 +458,22 @@ class CloudTestCase(test.TestCase):
         db.service_destroy(self.context, service1['id'])
         db.service_destroy(self.context, service2['id'])
 
+    def test_describe_availability_zones_verbose(self):
+        """Makes sure the verbose listing asks the heartbeat driver."""
+        service = db.service_create(self.context, {'host': 'host1_zones',
+                                        'binary': "nova-compute",
+                                        'topic': 'compute',
+                                        'report_count': 0})
+        self.stubs.Set(heartbeat, 'is_up', lambda service: False)
+        result = self.cloud.describe_availability_zones(
+                self.context.elevated(), zone_name=['verbose'])
+        states = [zone['zoneState'] for zone in result['availabilityZoneInfo']
+                  if zone['zoneName'] == '| |- nova-compute']
+        self.assertTrue(states)
+        for state in states:
+            self.assertTrue(' XXX ' in state)
+        db.service_destroy(self.context, service['id'])
+
     def test_describe_snapshots(self):
         """Makes sure describe_snapshots works and filters results."""
         vol = db.volume_create(self.context, {})
@@ -28,6 +28,7 @@ from glance.common import exception as glance_exc
 
 from nova import context
 from nova import exception as exc
+from nova import fakememcache
 from nova import utils
 from nova import wsgi
 import nova.api.openstack.auth
@@ -64,6 +65,7 @@ def fake_auth_init(self, application):
     self.db = FakeAuthDatabase()
     self.context = Context()
     self.auth = FakeAuthManager()
+    self.mc = fakememcache.Client()
     self.application = application
 
 
@@ -336,6 +338,9 @@ class FakeAuthManager(object):
         user = self.get_user(user_id)
         return user.admin
 
+    def get_user_generation(self, user_id):
+        return 'generation'
+
     def is_project_member(self, user_id, project):
         if not isinstance(project, Project):
             try:
@@ -206,6 +206,70 @@ class Test(test.TestCase):
         result = req.get_response(fakes.wsgi_app(fake_auth=False))
         self.assertEqual(result.status, '401 Unauthorized')
 
+    def _get_token(self):
+        f = fakes.FakeAuthManager()
+        user = nova.auth.manager.User('id1', 'user1', 'user1_key', None, None)
+        f.add_user(user)
+        f.create_project('user1_project', user)
+
+        req = webob.Request.blank('/v1.0/', {'HTTP_HOST': 'foo'})
+        req.headers['X-Auth-User'] = 'user1'
+        req.headers['X-Auth-Key'] = 'user1_key'
+        result = req.get_response(fakes.wsgi_app(fake_auth=False))
+        self.stubs.Set(nova.api.openstack, 'APIRouterV10', fakes.FakeRouter)
+        return result.headers['X-Auth-Token']
+
+    def _count_token_lookups(self):
+        lookups = []
+        real_auth_token_get = fakes.FakeAuthDatabase.auth_token_get
+
+        def auth_token_get(meh, context, token_hash):
+            lookups.append(token_hash)
+            return real_auth_token_get(context, token_hash)
+
+        self.stubs.Set(fakes.FakeAuthDatabase, 'auth_token_get',
+                       auth_token_get)
+        return lookups
+
+    def test_token_is_cached(self):
+        token = self._get_token()
+        lookups = self._count_token_lookups()
+        app = fakes.wsgi_app(fake_auth=False)
+        for i in range(2):
+            req = webob.Request.blank('/v1.0/user1_project')
+            req.headers['X-Auth-Token'] = token
+            result = req.get_response(app)
+            self.assertEqual(result.status, '200 OK')
+        self.assertEqual([token], lookups)
+
+    def test_unknown_token_is_cached(self):
+        lookups = self._count_token_lookups()
+        app = fakes.wsgi_app(fake_auth=False)
+        for i in range(2):
+            req = webob.Request.blank('/v1.0/')
+            req.headers['X-Auth-Token'] = 'unknown_token'
+            result = req.get_response(app)
+            self.assertEqual(result.status, '401 Unauthorized')
+        self.assertEqual(['unknown_token'], lookups)
+
+    def test_cached_token_is_dropped_when_user_changes(self):
+        token = self._get_token()
+        lookups = self._count_token_lookups()
+        app = fakes.wsgi_app(fake_auth=False)
+        req = webob.Request.blank('/v1.0/user1_project')
+        req.headers['X-Auth-Token'] = token
+        req.get_response(app)
+
+        self.stubs.Set(fakes.FakeAuthManager, 'get_user_generation',
+                       lambda self, user_id: 'changed')
+        fakes.FakeAuthManager.projects['user1_project'].project_manager_id = \
+                'someone_else'
+        req = webob.Request.blank('/v1.0/user1_project')
+        req.headers['X-Auth-Token'] = token
+        result = req.get_response(app)
+        self.assertEqual(result.status, '401 Unauthorized')
+        self.assertEqual([token, token], lookups)
+
 
 class TestFunctional(test.TestCase):
     def test_token_expiry(self):
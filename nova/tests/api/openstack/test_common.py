@@ -198,6 +198,20 @@ class PaginationParamsTest(test.TestCase):
         self.assertEqual(common.get_pagination_params(req),
                          {'marker': 40, 'limit': 20})
 
+    def test_get_limit_and_marker(self):
+        """ Test limit is capped and a missing marker is None. """
+        req = Request.blank('/?limit=2000')
+        self.assertEqual(common.get_limit_and_marker(req), (1000, None))
+        req = Request.blank('/?limit=20&marker=40')
+        self.assertEqual(common.get_limit_and_marker(req), (20, 40))
+
+    def test_get_offset_and_limit(self):
+        """ Test offset and limit defaults. """
+        req = Request.blank('/')
+        self.assertEqual(common.get_offset_and_limit(req), (0, 1000))
+        req = Request.blank('/?offset=10&limit=0')
+        self.assertEqual(common.get_offset_and_limit(req), (10, 1000))
+
 
 class MiscFunctionsTest(test.TestCase):
 
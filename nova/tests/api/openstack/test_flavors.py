@@ -22,6 +22,7 @@ from lxml import etree
 from nova.api.openstack import flavors
 import nova.db.api
 from nova import exception
+from nova import flags
 from nova import test
 from nova.api.openstack import xmlutil
 from nova.tests.api.openstack import fakes
@@ -30,6 +31,7 @@ from nova import wsgi
 
 NS = "{http://docs.openstack.org/compute/api/v1.1}"
 ATOMNS = "{http://www.w3.org/2005/Atom}"
+FLAGS = flags.FLAGS
 
 
 def stub_flavor(flavorid, name, memory_mb="256", local_gb="10"):
@@ -45,9 +47,9 @@ def return_instance_type_by_flavor_id(context, flavorid):
     return stub_flavor(flavorid, "flavor %s" % (flavorid,))
 
 
-def return_instance_types(context, num=2):
+def return_instance_types(context, limit=None, marker=None):
     instance_types = {}
-    for i in xrange(1, num + 1):
+    for i in xrange(1, 3):
         name = "flavor %s" % (i,)
         instance_types[name] = stub_flavor(i, name)
     return instance_types
@@ -277,7 +279,7 @@ class FlavorsTest(test.TestCase):
         self.assertEqual(flavor, expected)
 
     def test_get_empty_flavor_list_v1_1(self):
-        def _return_empty(self):
+        def _return_empty(context, limit=None, marker=None):
             return {}
         self.stubs.Set(nova.db.api, "instance_type_get_all", _return_empty)
 
@@ -288,6 +290,34 @@ class FlavorsTest(test.TestCase):
         expected = []
         self.assertEqual(flavors, expected)
 
+    def test_get_flavor_list_with_limit_and_marker_v1_1(self):
+        def _return_instance_types(context, limit=None, marker=None):
+            self.assertEqual(limit, 1)
+            self.assertEqual(marker, 1)
+            return {'flavor 2': stub_flavor(2, 'flavor 2')}
+        self.stubs.Set(nova.db.api, "instance_type_get_all",
+                       _return_instance_types)
+
+        req = webob.Request.blank('/v1.1/fake/flavors?limit=1&marker=1')
+        res = req.get_response(fakes.wsgi_app())
+        self.assertEqual(res.status_int, 200)
+        flavors = json.loads(res.body)["flavors"]
+        self.assertEqual(['2'], [flavor['id'] for flavor in flavors])
+
+    def test_get_flavor_list_limit_is_capped_v1_1(self):
+        limits = []
+
+        def _return_instance_types(context, limit=None, marker=None):
+            limits.append(limit)
+            return {}
+        self.stubs.Set(nova.db.api, "instance_type_get_all",
+                       _return_instance_types)
+
+        req = webob.Request.blank('/v1.1/fake/flavors?limit=5000')
+        res = req.get_response(fakes.wsgi_app())
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual([FLAGS.osapi_max_limit], limits)
+
 
 class FlavorsXMLSerializationTest(test.TestCase):
 
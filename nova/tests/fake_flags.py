@@ -39,6 +39,8 @@ flags.DECLARE('iscsi_num_targets', 'nova.volume.driver')
 FLAGS['num_shelves'].SetDefault(2)
 FLAGS['blades_per_shelf'].SetDefault(4)
 FLAGS['iscsi_num_targets'].SetDefault(8)
+flags.DECLARE('glance_show_cache_ttl', 'nova.image.glance')
+FLAGS['glance_show_cache_ttl'].SetDefault(0)
 FLAGS['verbose'].SetDefault(True)
 FLAGS['sqlite_db'].SetDefault("tests.sqlite")
 FLAGS['use_ipv6'].SetDefault(True)
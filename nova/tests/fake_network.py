@@ -15,6 +15,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import re
+
 from nova import db
 from nova import exception
 from nova import flags
@@ -91,20 +93,64 @@ class FakeNetworkManager(network_manager.NetworkManager):
                       {'address': '172.16.1.2'},
                       {'address': '173.16.1.2'}]
 
-            vifs = [{'instance_id': 0,
+            vifs = [{'id': 0,
+                     'instance_id': 0,
                      'fixed_ipv6': '2001:db8::dcad:beff:feef:1',
-                     'fixed_ips': [{'address': '172.16.0.1',
+                     'fixed_ips': [{'id': 0,
+                                    'address': '172.16.0.1',
                                     'floating_ips': [floats[0]]}]},
-                    {'instance_id': 20,
+                    {'id': 1,
+                     'instance_id': 20,
                      'fixed_ipv6': '2001:db8::dcad:beff:feef:2',
-                     'fixed_ips': [{'address': '172.16.0.2',
+                     'fixed_ips': [{'id': 1,
+                                    'address': '172.16.0.2',
                                     'floating_ips': [floats[1]]}]},
-                    {'instance_id': 30,
+                    {'id': 2,
+                     'instance_id': 30,
                      'fixed_ipv6': '2002:db8::dcad:beff:feef:2',
-                     'fixed_ips': [{'address': '173.16.0.2',
+                     'fixed_ips': [{'id': 2,
+                                    'address': '173.16.0.2',
                                     'floating_ips': [floats[2]]}]}]
             return vifs
 
+        def _fixed_ips(self, context):
+            # NOTE: the same addresses as virtual_interface_get_all, kept
+            # as a table of their own like the fixed_ips table in the db
+            return [{'id': 0,
+                     'address': '172.16.0.1',
+                     'instance_id': 0,
+                     'virtual_interface_id': 0,
+                     'floating_ips': [{'address': '172.16.1.1'}]},
+                    {'id': 1,
+                     'address': '172.16.0.2',
+                     'instance_id': 20,
+                     'virtual_interface_id': 1,
+                     'floating_ips': [{'address': '172.16.1.2'}]},
+                    {'id': 2,
+                     'address': '173.16.0.2',
+                     'instance_id': 30,
+                     'virtual_interface_id': 2,
+                     'floating_ips': [{'address': '173.16.1.2'}]}]
+
+        def _like(self, pattern, address):
+            regex = ''.join(['.*' if c == '%' else '.' if c == '_'
+                             else re.escape(c) for c in pattern])
+            return re.match('%s$' % regex, address)
+
+        def fixed_ip_get_all_by_address_pattern(self, context, pattern):
+            return [fixed_ip for fixed_ip in self._fixed_ips(context)
+                    if self._like(pattern, fixed_ip['address'])]
+
+        def floating_ip_get_all_by_address_pattern(self, context, pattern):
+            floating_ips = []
+            for fixed_ip in self._fixed_ips(context):
+                for floating_ip in fixed_ip['floating_ips']:
+                    if self._like(pattern, floating_ip['address']):
+                        floating_ip = dict(floating_ip)
+                        floating_ip['fixed_ip'] = fixed_ip
+                        floating_ips.append(floating_ip)
+            return floating_ips
+
         def instance_get_id_to_uuid_mapping(self, context, ids):
             # NOTE(jkoelker): This is just here until we can rely on UUIDs
             mapping = {}
@@ -16,8 +16,13 @@
 #    under the License.
 
 
+import BaseHTTPServer
 import datetime
+import json
+import socket
+import SocketServer
 import stubout
+import threading
 
 from nova.tests.api.openstack import fakes
 from nova import context
@@ -89,7 +94,9 @@ class TestGlanceImageService(test.TestCase):
 
     def setUp(self):
         super(TestGlanceImageService, self).setUp()
+        self.flags(glance_show_cache_ttl=60)
         self.stubs = stubout.StubOutForTesting()
+        self.stubs.Set(glance, '_show_cache', {})
         fakes.stub_out_compute_api_snapshot(self.stubs)
         client = glance_stubs.StubGlanceClient()
         self.service = glance.GlanceImageService(client=client)
@@ -311,6 +318,22 @@ class TestGlanceImageService(test.TestCase):
         image_metas = self.service.detail(self.context, limit=5)
         self.assertEquals(len(image_metas), 5)
 
+    def test_limit_counts_available_images_only(self):
+        ids = []
+        for i in range(10):
+            fixture = self._make_fixture(name='TestImage %d' % (i),
+                                         is_public=(i % 2 == 0))
+            ids.append(self.service.create(self.context, fixture)['id'])
+        self.context.auth_token = False
+
+        image_metas = self.service.index(self.context, limit=3)
+        self.assertEqual([ids[0], ids[2], ids[4]],
+                         [meta['id'] for meta in image_metas])
+        image_metas = self.service.detail(self.context, marker=ids[4],
+                                          limit=3)
+        self.assertEqual([ids[6], ids[8]],
+                         [meta['id'] for meta in image_metas])
+
     def test_detail_marker_and_limit(self):
         fixtures = []
         ids = []
@@ -451,3 +474,176 @@ class TestGlanceImageService(test.TestCase):
         image_meta = self.service.get(self.context, image_id, writer)
         self.assertEqual(image_meta['created_at'], self.NOW_DATETIME)
         self.assertEqual(image_meta['updated_at'], self.NOW_DATETIME)
+
+    def test_show_is_cached_until_update(self):
+        fixture = self._make_fixture(name='image1')
+        image_id = self.service.create(self.context, fixture)['id']
+        calls = []
+        client = self.service._client
+        real_get_image_meta = client.get_image_meta
+
+        def fake_get_image_meta(image_id):
+            calls.append(image_id)
+            return real_get_image_meta(image_id)
+
+        self.stubs.Set(client, 'get_image_meta', fake_get_image_meta)
+        self.service.show(self.context, image_id)
+        self.service.show(self.context, image_id)
+        self.assertEqual(1, len(calls))
+
+        self.service.update(self.context, image_id, {'name': 'image2'})
+        image_meta = self.service.show(self.context, image_id)
+        self.assertEqual('image2', image_meta['name'])
+        self.assertEqual(2, len(calls))
+
+    def test_show_cache_is_not_shared_between_tokens(self):
+        fixture = self._make_fixture(name='image1')
+        image_id = self.service.create(self.context, fixture)['id']
+        calls = []
+        client = self.service._client
+        real_get_image_meta = client.get_image_meta
+
+        def fake_get_image_meta(image_id):
+            calls.append(image_id)
+            return real_get_image_meta(image_id)
+
+        self.stubs.Set(client, 'get_image_meta', fake_get_image_meta)
+        for token in ('tenant-a', 'tenant-b', 'tenant-a'):
+            ctxt = context.RequestContext('fake', 'fake', auth_token=token)
+            self.service.show(ctxt, image_id)
+        self.assertEqual(2, len(calls))
+
+
+    def test_show_cache_is_shared_between_services(self):
+        fixture = self._make_fixture(name='image1')
+        image_id = self.service.create(self.context, fixture)['id']
+        calls = []
+        client = self.service._client
+        real_get_image_meta = client.get_image_meta
+
+        def fake_get_image_meta(image_id):
+            calls.append(image_id)
+            return real_get_image_meta(image_id)
+
+        self.stubs.Set(client, 'get_image_meta', fake_get_image_meta)
+        self.service.show(self.context, image_id)
+        service = glance.GlanceImageService(client=client)
+        self.assertEqual('image1', service.show(self.context, image_id)['name'])
+        self.assertEqual(1, len(calls))
+
+        service.delete(self.context, image_id)
+        self.assertRaises(exception.ImageNotFound, self.service.show,
+                          self.context, image_id)
+
+
+class _ThreadedHTTPServer(SocketServer.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class TestGlanceKeepAlive(test.TestCase):
+    """Runs requests through the client pool against a local http server."""
+
+    def setUp(self):
+        super(TestGlanceKeepAlive, self).setUp()
+        self.requests = []
+        requests = self.requests
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_HEAD(self):
+                requests.append(('HEAD', self.client_address))
+                image_id = self.path.rsplit('/', 1)[-1]
+                self.send_response(200)
+                self.send_header('x-image-meta-id', image_id)
+                self.send_header('x-image-meta-name', 'image%s' % image_id)
+                self.send_header('x-image-meta-is_public', 'True')
+                self.send_header('x-image-meta-status', 'active')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_GET(self):
+                requests.append(('GET', self.client_address))
+                images = []
+                if 'marker' not in self.path:
+                    images = [{'id': 1, 'name': 'image1', 'is_public': True,
+                               'properties': {}, 'status': 'active'}]
+                body = json.dumps({'images': images})
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _ThreadedHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        port = self.server.server_address[1]
+        self.flags(glance_api_servers=['127.0.0.1:%d' % port],
+                   glance_client_pool_size=1, glance_show_cache_ttl=0)
+        self.stubs.Set(glance, '_client_pools', {})
+        self.stubs.Set(glance, '_down_servers', {})
+        self.context = context.get_admin_context()
+
+    def tearDown(self):
+        for pool in glance._client_pools.values():
+            for client in pool.free_items:
+                client.reset()
+        self.server.shutdown()
+        self.server.server_close()
+        super(TestGlanceKeepAlive, self).tearDown()
+
+    def test_head_then_get_reuse_the_connection(self):
+        service = glance.GlanceImageService()
+        self.assertEqual('image1', service.show(self.context, 1)['name'])
+        self.assertEqual('image2', service.show(self.context, 2)['name'])
+        images = service.detail(self.context)
+        self.assertEqual(['image1'], [image['name'] for image in images])
+        methods = [method for method, address in self.requests]
+        self.assertEqual(['HEAD', 'HEAD', 'GET'], methods[:3])
+        addresses = set(address for method, address in self.requests)
+        self.assertEqual(1, len(addresses))
+
+
+class TestGlanceServerFailover(test.TestCase):
+    def setUp(self):
+        super(TestGlanceServerFailover, self).setUp()
+        self.flags(glance_api_servers=['down:9292', 'up:9292'],
+                   glance_client_pool_size=0)
+        self.context = context.RequestContext('fake', 'fake', auth_token=True)
+        self.hosts = []
+        self.stubs.Set(glance, '_down_servers', {})
+
+        test_case = self
+
+        class FakeClient(object):
+            def __init__(self, host):
+                self.host = host
+
+            def get_image_meta(self, image_id):
+                test_case.hosts.append(self.host)
+                if self.host == 'down':
+                    raise socket.error()
+                return {'id': image_id, 'properties': {}, 'is_public': True}
+
+        self.stubs.Set(glance, '_create_glance_client',
+                       lambda context, host, port: FakeClient(host))
+
+    def test_failed_server_is_skipped(self):
+        service = glance.GlanceImageService()
+        self.stubs.Set(glance.random, 'shuffle', lambda servers: None)
+        self.assertEqual(1, service.show(self.context, 1)['id'])
+        self.assertEqual(['down', 'up'], self.hosts)
+
+        service = glance.GlanceImageService()
+        self.assertEqual(2, service.show(self.context, 2)['id'])
+        self.assertEqual(['down', 'up', 'up'], self.hosts)
+        self.assertEqual(('up', 9292), glance.pick_glance_api_server())
@@ -394,6 +394,37 @@ class AbstractSchedulerTestCase(test.TestCase):
         # 0 from local zones, 12 from remotes
         self.assertEqual(12, len(build_plan))
 
+    def test_schedule_run_instance_claims_capacity(self):
+        """Hosts repeated in the build plan are skipped once the
+        earlier claims have used up their memory.
+        """
+        sched = FakeAbstractScheduler()
+        provisioned = []
+
+        def fake_select(context, request_spec):
+            return [dict(weight=1, hostname='host1'),
+                    dict(weight=1, hostname='host1'),
+                    dict(weight=1, hostname='host1'),
+                    dict(weight=2, hostname='host2')]
+
+        def fake_provision(context, item, instance_id, request_spec, kwargs):
+            provisioned.append(item['hostname'])
+
+        self.stubs.Set(sched, 'select', fake_select)
+        self.stubs.Set(sched, '_provision_resource', fake_provision)
+        zm = FakeZoneManager()
+        sched.set_zone_manager(zm)
+
+        request_spec = {'instance_type': {'memory_mb': 512},
+                        'num_instances': 3}
+        sched.schedule_run_instance({}, 1, request_spec)
+
+        self.assertEqual(provisioned, ['host1', 'host1', 'host2'])
+        self.assertEqual(zm.service_states['host1']['compute']
+                         ['host_memory_free'], 0)
+        self.assertEqual(zm.service_states['host2']['compute']
+                         ['host_memory_free'], 1610612736)
+
 
 class BaseSchedulerTestCase(test.TestCase):
     """Test case for Base Scheduler."""
@@ -227,3 +227,23 @@ class HostFilterTestCase(test.TestCase):
 
         self.assertFalse(hf.filter_hosts(self.zone_manager,
                 json.dumps(['=', {}, ['>', '$missing....foo']])))
+
+    def test_json_filter_parses_query_once(self):
+        hf = filters.JsonFilter()
+        compiled = []
+        compile_query = hf._compile
+
+        def fake_compile(query):
+            compiled.append(query)
+            return compile_query(query)
+
+        self.stubs.Set(hf, '_compile', fake_compile)
+        raw = ['and',
+                  ['>=', '$compute.host_memory_free', 30],
+                  ['<', '$compute.disk_available', 500],
+              ]
+        hosts = hf.filter_hosts(self.zone_manager, json.dumps(raw))
+        self.assertEquals(['host03', 'host04'],
+                          sorted(host for host, caps in hosts))
+        # one for each list in the query, regardless of the host count
+        self.assertEquals(3, len(compiled))
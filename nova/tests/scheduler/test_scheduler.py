@@ -591,6 +591,53 @@ class SimpleDriverTestCase(test.TestCase):
         compute1.kill()
         compute2.kill()
 
+    def test_load_index_avoids_db_per_request(self):
+        """Ensures host loads are only read from the db once"""
+        compute1 = self.start_service('compute', host='host1')
+        compute2 = self.start_service('compute', host='host2')
+        calls = []
+        real_sorted = db.service_get_all_compute_sorted
+
+        def fake_sorted(context):
+            calls.append(context)
+            return real_sorted(context)
+
+        self.stubs.Set(db, 'service_get_all_compute_sorted', fake_sorted)
+        instance_ids = [self._create_instance() for i in xrange(4)]
+        hosts = [self.scheduler.driver.schedule_run_instance(self.context,
+                                                             instance_id)
+                 for instance_id in instance_ids]
+        self.assertEqual(sorted(hosts), ['host1', 'host1', 'host2', 'host2'])
+        self.assertEqual(len(calls), 1)
+        for instance_id in instance_ids:
+            db.instance_destroy(self.context, instance_id)
+        compute1.kill()
+        compute2.kill()
+
+    def test_release_resources_frees_cores(self):
+        """Ensures released cores can be scheduled again"""
+        compute1 = self.start_service('compute', host='host1')
+        instance_ids = []
+        for index in xrange(FLAGS.max_cores):
+            instance_id = self._create_instance()
+            self.scheduler.driver.schedule_run_instance(self.context,
+                                                        instance_id)
+            instance_ids.append(instance_id)
+        instance_id = self._create_instance()
+        self.assertRaises(driver.NoValidHost,
+                          self.scheduler.driver.schedule_run_instance,
+                          self.context,
+                          instance_id)
+        self.scheduler.release_resources(self.context, topic='compute',
+                                         host='host1', amount=1)
+        host = self.scheduler.driver.schedule_run_instance(self.context,
+                                                           instance_id)
+        self.assertEqual(host, 'host1')
+        instance_ids.append(instance_id)
+        for instance_id in instance_ids:
+            db.instance_destroy(self.context, instance_id)
+        compute1.kill()
+
     def test_least_busy_host_gets_volume(self):
         """Ensures the host with less gigabytes gets the next one"""
         volume1 = self.start_service('volume', host='host1')
@@ -951,6 +951,92 @@ class ComputeTestCase(test.TestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(power_state.NOSTATE, instances[0]['power_state'])
 
+    def test_sync_power_states_is_throttled(self):
+        """Power states are only synced once per sync interval"""
+        self.stubs.Set(compute_manager.ComputeManager,
+                '_report_driver_status', nop_report_driver_status)
+        self.flags(power_state_sync_interval=600)
+        calls = []
+
+        def fake_list_instances_detail():
+            calls.append(True)
+            return []
+
+        self.stubs.Set(self.compute.driver, 'list_instances_detail',
+                       fake_list_instances_detail)
+        self.compute.periodic_tasks(context.get_admin_context())
+        self.compute.periodic_tasks(context.get_admin_context())
+        self.assertEqual(1, len(calls))
+
+    def test_security_group_refreshes_are_coalesced(self):
+        """Repeated refreshes of a group in one window are applied once"""
+        calls = []
+        timers = []
+
+        def fake_refresh(security_group_id):
+            calls.append(security_group_id)
+
+        def fake_spawn_after(seconds, func):
+            timers.append(func)
+            return func
+
+        self.stubs.Set(self.compute.driver, 'refresh_security_group_members',
+                       fake_refresh)
+        self.stubs.Set(compute_manager.greenthread, 'spawn_after',
+                       fake_spawn_after)
+        for group_id in (1, 2, 1, 1):
+            self.compute.refresh_security_group_members(self.context, group_id)
+        self.assertEqual([], calls)
+        self.assertEqual(1, len(timers))
+
+        timers[0]()
+        self.assertEqual([1, 2], calls)
+
+    def test_security_group_refresh_for_other_hosts_is_ignored(self):
+        self.flags(security_group_refresh_window=0)
+        calls = []
+
+        def fake_refresh(security_group_id):
+            calls.append(security_group_id)
+
+        self.stubs.Set(self.compute.driver, 'refresh_security_group_rules',
+                       fake_refresh)
+        self.compute.refresh_security_group_rules(self.context, 1,
+                                                  hosts=['otherhost'])
+        self.compute.refresh_security_group_rules(self.context, 2,
+                                                  hosts=[self.compute.host])
+        self.assertEqual([2], calls)
+
+    def test_security_group_members_refresh_without_groups(self):
+        casts = []
+        self.stubs.Set(rpc, 'fanout_cast',
+                       lambda context, topic, msg: casts.append(msg))
+        self.stubs.Set(rpc, 'cast',
+                       lambda context, topic, msg: casts.append(msg))
+        self.compute_api.trigger_security_group_members_refresh(self.context,
+                                                                [])
+        self.assertEqual([], casts)
+
+    def test_security_group_rules_refresh_is_one_fanout_cast(self):
+        group = self._create_group()
+        for host in ('host1', 'host2'):
+            instance_id = self._create_instance({'host': host})
+            db.instance_add_security_group(self.context.elevated(),
+                                           instance_id, group['id'])
+        casts = []
+
+        def fake_fanout_cast(context, topic, msg):
+            casts.append((topic, msg))
+
+        self.stubs.Set(rpc, 'fanout_cast', fake_fanout_cast)
+        self.compute_api.trigger_security_group_rules_refresh(self.context,
+                                                              group['id'])
+        self.assertEqual(1, len(casts))
+        topic, msg = casts[0]
+        self.assertEqual(FLAGS.compute_topic, topic)
+        self.assertEqual('refresh_security_group_rules', msg['method'])
+        self.assertEqual(['host1', 'host2'], msg['args']['hosts'])
+
     def test_get_all_by_name_regexp(self):
         """Test searching instances by name (display_name)"""
         c = context.get_admin_context()
@@ -23,7 +23,10 @@ import datetime
 from nova import test
 from nova import context
 from nova import db
+from nova import exception
 from nova import flags
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
 
 FLAGS = flags.FLAGS
 
@@ -101,6 +104,145 @@ class DbApiTestCase(test.TestCase):
         else:
             self.assertTrue(result[1].deleted)
 
+    def test_instance_get_all_by_filters_regexp(self):
+        for name in ('web1', 'web2', 'db1', 'web_3'):
+            db.instance_create(self.context, {'display_name': name,
+                                              'project_id': self.project_id})
+        result = db.instance_get_all_by_filters(self.context,
+                                                {'display_name': 'web'})
+        self.assertEqual(['web_3', 'web2', 'web1'],
+                         [inst['display_name'] for inst in result])
+        result = db.instance_get_all_by_filters(self.context,
+                                                {'display_name': 'web.$'})
+        self.assertEqual(['web2', 'web1'],
+                         [inst['display_name'] for inst in result])
+        result = db.instance_get_all_by_filters(self.context,
+                                                {'display_name': '(db|x)1'})
+        self.assertEqual(['db1'], [inst['display_name'] for inst in result])
+
+    def test_instance_get_all_by_filters_boolean(self):
+        for locked in (True, False, True):
+            db.instance_create(self.context, {'locked': locked,
+                                              'project_id': self.project_id})
+        result = db.instance_get_all_by_filters(self.context,
+                                                {'locked': True})
+        self.assertEqual([True, True], [inst['locked'] for inst in result])
+
+    def test_instance_get_all_by_filters_integer(self):
+        for vcpus in (1, 12, 2):
+            db.instance_create(self.context, {'vcpus': vcpus,
+                                              'project_id': self.project_id})
+        result = db.instance_get_all_by_filters(self.context, {'vcpus': 2})
+        self.assertEqual([2], [inst['vcpus'] for inst in result])
+        result = db.instance_get_all_by_filters(self.context, {'vcpus': 1})
+        self.assertEqual([12, 1], [inst['vcpus'] for inst in result])
+
+    def test_instance_get_all_by_filters_metadata(self):
+        def _create(metadata):
+            return db.instance_create(self.context,
+                                      {'metadata': metadata,
+                                       'project_id': self.project_id})
+
+        inst1 = _create({'role': 'web', 'a': '1'})
+        inst2 = _create({'role': 'web'})
+        _create({'role': 'db'})
+        result = db.instance_get_all_by_filters(self.context,
+                {'metadata': {'role': 'web'}})
+        self.assertEqual(sorted([inst1['id'], inst2['id']]),
+                         sorted([inst['id'] for inst in result]))
+        result = db.instance_get_all_by_filters(self.context,
+                {'metadata': [{'role': 'web'}, {'a': '1'}]})
+        self.assertEqual([inst1['id']], [inst['id'] for inst in result])
+
+    def test_instance_get_all_by_filters_limit_marker(self):
+        ids = [db.instance_create(self.context,
+                                  {'display_name': 'inst%d' % (i % 2),
+                                   'project_id': self.project_id})['id']
+               for i in xrange(6)]
+        ids.reverse()
+        result = db.instance_get_all_by_filters(self.context, {}, limit=2)
+        self.assertEqual(ids[:2], [inst['id'] for inst in result])
+        result = db.instance_get_all_by_filters(self.context, {}, limit=2,
+                                                marker=result[-1]['uuid'])
+        self.assertEqual(ids[2:4], [inst['id'] for inst in result])
+        result = db.instance_get_all_by_filters(self.context,
+                {'display_name': 'inst0'}, limit=2, marker=ids[0])
+        self.assertEqual([ids[1], ids[3]], [inst['id'] for inst in result])
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          self.context, {}, marker=-1)
+
+    def test_regex_to_like(self):
+        regex_to_like = sqlalchemy_api._regex_to_like
+        self.assertEqual('web%', regex_to_like('web'))
+        self.assertEqual('web_', regex_to_like('^web.$'))
+        self.assertEqual('a_%b%', regex_to_like('a.+b'))
+        self.assertEqual('a!_b!%%', regex_to_like('a_b%'))
+        self.assertEqual('10.0.0.1%', regex_to_like(r'10\.0\.0\.1'))
+        self.assertEqual(None, regex_to_like('(a|b)'))
+        self.assertEqual(None, regex_to_like(r'\bfoo'))
+        self.assertEqual('a_b%', regex_to_like('a[xy]b'))
+        self.assertEqual(None, regex_to_like('a[^]]b'))
+        self.assertEqual(None, regex_to_like(r'a[\]]b'))
+
+    def test_regex_filter(self):
+        class FakeSession(object):
+            class bind(object):
+                class dialect(object):
+                    name = 'mysql'
+
+        columns = models.Instance.__table__.columns
+
+        def regex_filter(column, regex):
+            return sqlalchemy_api._regex_filter(FakeSession, columns[column],
+                                                regex)
+
+        self.assertNotEqual(None, regex_filter('display_name', 'web'))
+        self.assertNotEqual(None, regex_filter('display_name', '(a|b)c'))
+        self.assertNotEqual(None, regex_filter('display_name', 'a{1,3}'))
+        self.assertEqual(None, regex_filter('locked', 'True'))
+        self.assertEqual(None, regex_filter('vcpus', '1'))
+        self.assertEqual(None, regex_filter('display_name', '(a|b)*?c'))
+        self.assertEqual(None, regex_filter('display_name', '(a|b){,3}'))
+        self.assertEqual(None, regex_filter('display_name', r'(a|b)\d'))
+        self.assertEqual(None, regex_filter('display_name', '(?i)a|b'))
+        self.assertEqual(None, regex_filter('display_name', '(a|)b'))
+
+    def test_instance_marker_of_other_project_not_found(self):
+        other = context.RequestContext('other', 'other')
+        inst = db.instance_create(other, {'project_id': 'other'})
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          self.context, {}, marker=inst['uuid'])
+
+    def test_instance_type_get_all_limit_marker(self):
+        ctxt = context.get_admin_context()
+        flavorids = sorted(flavor['flavorid'] for flavor in
+                           db.instance_type_get_all(ctxt).values())
+        result = db.instance_type_get_all(ctxt, limit=2,
+                                          marker=flavorids[0])
+        self.assertEqual(flavorids[1:3],
+                         sorted(flavor['flavorid']
+                                for flavor in result.values()))
+
+    def test_instance_power_states_by_host(self):
+        ctxt = context.get_admin_context()
+        inst1 = db.instance_create(ctxt, {'host': 'host1', 'power_state': 1})
+        inst2 = db.instance_create(ctxt, {'host': 'host1', 'power_state': 1})
+        inst3 = db.instance_create(ctxt, {'host': 'host2', 'power_state': 1})
+
+        result = db.instance_get_power_states_by_host(ctxt, 'host1')
+        self.assertEqual(sorted([(inst1.id, inst1.name, 1),
+                                 (inst2.id, inst2.name, 1)]),
+                         sorted((r['id'], r['name'], r['power_state'])
+                                for r in result))
+
+        db.instance_update_power_states(ctxt, {0: [inst1.id],
+                                               4: [inst2.id, inst3.id]})
+        self.assertEqual(0, db.instance_get(ctxt, inst1.id)['power_state'])
+        self.assertEqual(4, db.instance_get(ctxt, inst2.id)['power_state'])
+        self.assertEqual(4, db.instance_get(ctxt, inst3.id)['power_state'])
+
     def test_migration_get_all_unconfirmed(self):
         ctxt = context.get_admin_context()
 
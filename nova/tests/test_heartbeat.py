@@ -0,0 +1,114 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For service heartbeat drivers.
+"""
+
+import datetime
+
+from nova import context
+from nova import db
+from nova import flags
+from nova import heartbeat
+from nova import rpc
+from nova import test
+from nova import utils
+
+FLAGS = flags.FLAGS
+
+
+class HeartbeatTestCase(test.TestCase):
+    def setUp(self):
+        super(HeartbeatTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.service = db.service_create(self.context,
+                                         {'host': 'host1',
+                                          'binary': 'nova-compute',
+                                          'topic': 'compute',
+                                          'report_count': 0})
+        self.casts = []
+
+        def fake_fanout_cast(context, topic, msg):
+            self.casts.append((topic, msg))
+
+        self.stubs.Set(rpc, 'fanout_cast', fake_fanout_cast)
+
+    def tearDown(self):
+        utils.clear_time_override()
+        super(HeartbeatTestCase, self).tearDown()
+
+    def _make_stale(self):
+        """Move the clock past service_down_time."""
+        later = utils.utcnow() + datetime.timedelta(
+                seconds=FLAGS.service_down_time + 1)
+        utils.set_time_override(later)
+
+    def test_db_driver_beat(self):
+        driver = heartbeat.DbHeartbeatDriver()
+        self.assertTrue(driver.beat(self.context, self.service['id']))
+        service = db.service_get(self.context, self.service['id'])
+        self.assertEqual(1, service['report_count'])
+        self.assertTrue(driver.is_up(service))
+        self.assertFalse(self.casts)
+
+        self._make_stale()
+        self.assertFalse(driver.is_up(service))
+
+        db.service_destroy(self.context, self.service['id'])
+        self.assertFalse(driver.beat(self.context, self.service['id']))
+
+    def test_rpc_driver_beat_is_cast(self):
+        driver = heartbeat.RpcHeartbeatDriver()
+        self.assertTrue(driver.beat(self.context, self.service['id']))
+        self.assertEqual([('scheduler',
+                           {'method': 'service_heartbeat',
+                            'args': {'service_id': self.service['id']}})],
+                         self.casts)
+        service = db.service_get(self.context, self.service['id'])
+        self.assertEqual(0, service['report_count'])
+
+    def test_rpc_driver_uses_recorded_heartbeats(self):
+        driver = heartbeat.RpcHeartbeatDriver()
+        self._make_stale()
+        service = db.service_get(self.context, self.service['id'])
+        self.assertFalse(driver.is_up(service))
+
+        driver.record(self.context, self.service['id'])
+        self.assertTrue(driver.is_up(service))
+
+    def test_rpc_driver_flushes_in_bulk(self):
+        self.flags(heartbeat_flush_interval=10)
+        driver = heartbeat.RpcHeartbeatDriver()
+        other = db.service_create(self.context,
+                                  {'host': 'host2',
+                                   'binary': 'nova-volume',
+                                   'topic': 'volume',
+                                   'report_count': 0})
+        driver.record(self.context, self.service['id'])
+        driver.record(self.context, self.service['id'])
+        service = db.service_get(self.context, self.service['id'])
+        self.assertEqual(0, service['report_count'])
+
+        later = utils.utcnow() + datetime.timedelta(seconds=11)
+        utils.set_time_override(later)
+        driver.record(self.context, other['id'])
+        service = db.service_get(self.context, self.service['id'])
+        self.assertEqual(1, service['report_count'])
+        self.assertEqual(later, service['updated_at'])
+        other = db.service_get(self.context, other['id'])
+        self.assertEqual(1, other['report_count'])
@@ -0,0 +1,116 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for downloading images in nova.virt.images"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import eventlet
+
+from nova import context
+from nova import exception
+import nova.image
+from nova import test
+from nova.image import glance
+from nova.virt import images
+
+
+IMAGE_DATA = 'abcdefgh' * 16
+
+
+class FakeGlanceImageService(glance.GlanceImageService):
+    """Sends IMAGE_DATA in chunks, from offset on if asked to."""
+
+    def __init__(self, checksum=None):
+        super(FakeGlanceImageService, self).__init__()
+        self.checksum = checksum or hashlib.md5(IMAGE_DATA).hexdigest()
+        self.offsets = []
+
+    def get(self, context, image_id, data, offset=0):
+        self.offsets.append(offset)
+        for start in range(offset, len(IMAGE_DATA), 16):
+            data.write(IMAGE_DATA[start:start + 16])
+            eventlet.sleep(0)
+        return {'id': image_id, 'checksum': self.checksum}
+
+
+class FetchTestCase(test.TestCase):
+    def setUp(self):
+        super(FetchTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'image')
+        self.service = FakeGlanceImageService()
+        self.stubs.Set(nova.image, 'get_image_service',
+                       lambda context, href: (self.service, href))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(FetchTestCase, self).tearDown()
+
+    def test_fetch(self):
+        metadata = images.fetch(self.context, 1, self.path, None, None)
+        self.assertEqual(1, metadata['id'])
+        self.assertEqual(IMAGE_DATA, open(self.path).read())
+        self.assertEqual(['image'], os.listdir(self.dir))
+
+    def test_checksum_mismatch(self):
+        self.service.checksum = 'bad'
+        self.assertRaises(exception.ImageUnacceptable, images.fetch,
+                          self.context, 1, self.path, None, None)
+        self.assertEqual([], os.listdir(self.dir))
+
+    def test_resumes_partial_download(self):
+        with open(self.path + '.download', 'w') as f:
+            f.write(IMAGE_DATA[:40])
+        images.fetch(self.context, 1, self.path, None, None)
+        self.assertEqual([40], self.service.offsets)
+        self.assertEqual(IMAGE_DATA, open(self.path).read())
+
+    def test_failed_resume_starts_over(self):
+        with open(self.path + '.download', 'w') as f:
+            f.write(IMAGE_DATA)
+        real_get = self.service.get
+
+        def get(context, image_id, data, offset=0):
+            if offset:
+                # glance answers 416 when nothing is left to send
+                self.service.offsets.append(offset)
+                raise Exception('416 Requested Range Not Satisfiable')
+            return real_get(context, image_id, data, offset)
+
+        self.stubs.Set(self.service, 'get', get)
+        images.fetch(self.context, 1, self.path, None, None)
+        self.assertEqual([len(IMAGE_DATA), 0], self.service.offsets)
+        self.assertEqual(IMAGE_DATA, open(self.path).read())
+
+    def test_corrupt_partial_download_starts_over(self):
+        with open(self.path + '.download', 'w') as f:
+            f.write('x' * 40)
+        images.fetch(self.context, 1, self.path, None, None)
+        self.assertEqual([40, 0], self.service.offsets)
+        self.assertEqual(IMAGE_DATA, open(self.path).read())
+
+    def test_concurrent_fetches_share_download(self):
+        threads = [eventlet.spawn(images.fetch, self.context, 1, self.path,
+                                  None, None) for i in xrange(3)]
+        for thread in threads:
+            self.assertEqual(1, thread.wait()['id'])
+        self.assertEqual([0], self.service.offsets)
@@ -19,6 +19,8 @@
 
 import os
 
+from eventlet import greenthread
+
 from nova import test
 from nova.network import linux_net
 
@@ -162,3 +164,74 @@ class IptablesManagerTestCase(test.TestCase):
             self.assertTrue('-A %s -j run_tests.py-%s' \
                             % (chain, chain) in new_lines,
                             "Built-in chain %s not wrapped" % (chain,))
+
+    def _fake_execute(self, *cmd, **kwargs):
+        self.executes.append((cmd, kwargs.get('process_input')))
+        return '\n'.join(self.sample_filter), ''
+
+    def _restores(self):
+        return [(cmd, process_input) for cmd, process_input in self.executes
+                if cmd[0].endswith('-restore')]
+
+    def test_incremental_apply(self):
+        # only count the iptables restores, not the ip6tables ones
+        self.flags(iptables_incremental_apply=True, use_ipv6=False)
+        self.executes = []
+        self.manager.execute = self._fake_execute
+        self.manager.apply()
+        # the first apply rewrites both tables
+        self.assertEqual(len(self._restores()), 2)
+
+        self.executes = []
+        self.manager.apply()
+        self.assertEqual(self.executes, [])
+
+        table = self.manager.ipv4['filter']
+        table.add_chain('inst-1')
+        table.add_rule('inst-1', '-j DROP')
+        table.add_rule('local', '-d 10.0.0.2 -j $inst-1')
+        self.manager.apply()
+        self.assertEqual(self._restores(),
+                         [(('iptables-restore', '--noflush'),
+                           '*filter\n'
+                           ':run_tests.py-inst-1 - [0:0]\n'
+                           ':run_tests.py-local - [0:0]\n'
+                           '-A run_tests.py-inst-1 -j DROP\n'
+                           '-A run_tests.py-local -d 10.0.0.2 '
+                           '-j run_tests.py-inst-1\n'
+                           'COMMIT\n')])
+
+        self.executes = []
+        table.remove_chain('inst-1')
+        self.manager.apply()
+        self.assertEqual(self._restores(),
+                         [(('iptables-restore', '--noflush'),
+                           '*filter\n'
+                           ':run_tests.py-local - [0:0]\n'
+                           ':run_tests.py-inst-1 - [0:0]\n'
+                           '-X run_tests.py-inst-1\n'
+                           'COMMIT\n')])
+
+    def test_incremental_apply_unwrapped_change(self):
+        self.flags(iptables_incremental_apply=True)
+        self.executes = []
+        self.manager.execute = self._fake_execute
+        self.manager.apply()
+
+        self.executes = []
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-j DROP',
+                                             wrap=False)
+        self.manager.apply()
+        self.assertEqual(self.executes[0][0],
+                         ('iptables-save', '-t', 'filter'))
+        self.assertEqual(self._restores(),
+                         [(('iptables-restore',), self.executes[1][1])])
+
+    def test_apply_coalesces_waiting_calls(self):
+        self.flags(iptables_apply_delay=0.01, use_ipv6=False)
+        self.executes = []
+        self.manager.execute = self._fake_execute
+        threads = [greenthread.spawn(self.manager.apply) for i in xrange(3)]
+        for thread in threads:
+            thread.wait()
+        self.assertEqual(len(self._restores()), 2)
@@ -35,9 +35,11 @@ from nova import utils
 from nova.api.ec2 import cloud
 from nova.compute import power_state
 from nova.compute import vm_states
+from nova.network import linux_net
 from nova.virt import driver
 from nova.virt.libvirt import connection
 from nova.virt.libvirt import firewall
+from nova.virt.libvirt import imagecache
 from nova.tests import fake_network
 
 libvirt = None
@@ -90,20 +92,36 @@ class FakeVirtDomain(object):
 class CacheConcurrencyTestCase(test.TestCase):
     def setUp(self):
         super(CacheConcurrencyTestCase, self).setUp()
-        self.flags(instances_path='nova.compute.manager')
+        # NOTE: lockfile checks the absolute path of its lock files, so
+        # lock_path has to be normalized for them to be let through below
+        self.lock_path = os.path.abspath(tempfile.mkdtemp())
+        self.flags(instances_path='nova.compute.manager',
+                   lock_path=self.lock_path)
+        real_exists = os.path.exists
 
         def fake_exists(fname):
             basedir = os.path.join(FLAGS.instances_path, '_base')
             if fname == basedir:
                 return True
+            if fname.startswith(self.lock_path):
+                return real_exists(fname)
             return False
 
         def fake_execute(*args, **kwargs):
             pass
 
+        def fake_noop(*args, **kwargs):
+            pass
+
         self.stubs.Set(os.path, 'exists', fake_exists)
+        self.stubs.Set(os, 'rename', fake_noop)
+        self.stubs.Set(os, 'utime', fake_noop)
         self.stubs.Set(utils, 'execute', fake_execute)
 
+    def tearDown(self):
+        super(CacheConcurrencyTestCase, self).tearDown()
+        shutil.rmtree(self.lock_path)
+
     def test_same_fname_concurrency(self):
         """Ensures that the same fname cache runs at a sequentially"""
         conn = connection.LibvirtConnection
@@ -145,6 +163,97 @@ class CacheConcurrencyTestCase(test.TestCase):
             eventlet.sleep(0)
 
 
+class ImageCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(ImageCacheTestCase, self).setUp()
+        self.instances_path = tempfile.mkdtemp()
+        self.flags(instances_path=self.instances_path,
+                   lock_path=self.instances_path)
+        self.base_dir = os.path.join(self.instances_path, '_base')
+        self.executes = []
+
+        def fake_execute(*cmd, **kwargs):
+            self.executes.append(cmd)
+            if cmd[0] == 'mkdir':
+                os.makedirs(cmd[-1])
+            return '', ''
+
+        self.stubs.Set(utils, 'execute', fake_execute)
+
+    def tearDown(self):
+        shutil.rmtree(self.instances_path)
+        super(ImageCacheTestCase, self).tearDown()
+
+    def _write_base(self, fname, size, mtime):
+        path = os.path.join(self.base_dir, fname)
+        with open(path, 'w') as f:
+            f.write('x' * size)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_cache_fetches_base_once(self):
+        calls = []
+
+        def fake_fetch(target):
+            calls.append(target)
+            open(target, 'w').close()
+
+        for target in ('disk1', 'disk2'):
+            imagecache.cache(fake_fetch,
+                             os.path.join(self.instances_path, target),
+                             'fname')
+        base = os.path.join(self.base_dir, 'fname')
+        self.assertEqual([base + '.part'], calls)
+        self.assertTrue(os.path.exists(base))
+        self.assertEqual(2, len([cmd for cmd in self.executes
+                                 if cmd[0] == 'cp']))
+
+    def test_failed_fetch_leaves_no_base(self):
+        def fake_fetch(target):
+            open(target, 'w').close()
+            raise exception.ImageUnacceptable(image_id=1, reason='bad')
+
+        self.assertRaises(exception.ImageUnacceptable, imagecache.cache,
+                          fake_fetch, 'disk', 'fname')
+        self.assertEqual([], os.listdir(self.base_dir))
+
+    def test_evict_removes_least_recently_used(self):
+        self.flags(image_cache_max_size_gb=1)
+        os.makedirs(self.base_dir)
+        gb = 1024 * 1024 * 1024
+        self._write_base('oldest', 10, 100)
+        in_use = self._write_base('in_use', 10, 200)
+        self._write_base('newest', 10, 300)
+
+        real_stat = os.stat
+
+        class FakeStat(object):
+            def __init__(self, path):
+                self.st_mtime = real_stat(path).st_mtime
+                self.st_size = gb / 2
+
+        self.stubs.Set(imagecache.os, 'stat', FakeStat)
+        imagecache.evict(set([in_use]))
+        self.assertEqual(['in_use', 'newest'],
+                         sorted(os.listdir(self.base_dir)))
+
+    def test_manage_image_cache_keeps_bases_of_all_instances(self):
+        os.makedirs(self.base_dir)
+        for name in ('instance-running', 'instance-stopped'):
+            os.makedirs(os.path.join(self.instances_path, name))
+            open(os.path.join(self.instances_path, name, 'disk'), 'w').close()
+        self.stubs.Set(imagecache, 'backing_file',
+                       lambda path: path.split(os.sep)[-2] + '-base')
+        evicted = []
+        self.stubs.Set(imagecache, 'evict', evicted.append)
+        self.stubs.Set(connection.LibvirtConnection, 'list_instances',
+                       lambda self: ['instance-running'])
+
+        connection.LibvirtConnection(False).manage_image_cache(None)
+        self.assertEqual([set(['instance-running-base',
+                               'instance-stopped-base'])], evicted)
+
+
 class LibvirtConnTestCase(test.TestCase):
 
     def setUp(self):
@@ -596,6 +705,103 @@ class LibvirtConnTestCase(test.TestCase):
 
         db.service_destroy(self.context, service_ref['id'])
 
+    def test_domain_sweep_is_shared(self):
+        """Power state sync and resource accounting share one sweep."""
+        lookups = []
+
+        class Domain(object):
+            def __init__(self, domain_id):
+                self.domain_id = domain_id
+
+            def name(self):
+                return 'instance-%d' % self.domain_id
+
+            def info(self):
+                return [power_state.RUNNING, 512, 512, 2, 100]
+
+        def lookupByID(domain_id):
+            lookups.append(domain_id)
+            return Domain(domain_id)
+
+        self.create_fake_libvirt_mock(listDomainsID=lambda: [1, 2],
+                                      lookupByID=lookupByID)
+        self.mox.ReplayAll()
+        conn = connection.LibvirtConnection(False)
+
+        infos = conn.list_instances_detail()
+        self.assertEqual(['instance-1', 'instance-2'],
+                         sorted(info.name for info in infos))
+        self.assertEqual(4, conn.get_vcpu_used())
+        self.assertEqual([1, 2], lookups)
+
+        # list_instances must be exact, so it always sweeps again
+        self.assertEqual(2, len(conn.list_instances()))
+        self.assertEqual([1, 2, 1, 2], lookups)
+
+    def test_static_host_facts_are_looked_up_once(self):
+        self.flags(instances_path='.')
+        self.create_fake_libvirt_mock(getVersion=lambda: 12003,
+                                      getType=lambda: 'qemu',
+                                      listDomainsID=lambda: [])
+        self.mox.StubOutWithMock(connection.LibvirtConnection,
+                                 'get_cpu_info')
+        connection.LibvirtConnection.get_cpu_info().AndReturn('cpuinfo')
+
+        self.mox.ReplayAll()
+        conn = connection.LibvirtConnection(False)
+        conn.get_host_stats(refresh=True)
+        stats = conn.get_host_stats(refresh=True)
+        self.assertEqual('cpuinfo', stats['cpu_info'])
+        self.assertEqual(0, stats['running_instances'])
+        self.assertEqual(0, stats['vcpus_used'])
+
+    def test_templates_are_compiled_once(self):
+        compiled = []
+
+        class FakeTemplate(object):
+            @staticmethod
+            def compile(file):
+                compiled.append(file)
+                return lambda searchList: 'rendered'
+
+        self.stubs.Set(connection, 'Template', FakeTemplate)
+        self.stubs.Set(connection, '_templates', {})
+        for i in xrange(3):
+            template = connection._get_template(FLAGS.libvirt_xml_template)
+            self.assertEqual('rendered', template(searchList=[{}]))
+        self.assertEqual([FLAGS.libvirt_xml_template], compiled)
+
+    def test_image_steps_run_concurrently(self):
+        ran = []
+
+        def fetch_kernel():
+            eventlet.sleep(0)
+            ran.append('kernel')
+
+        def create_swap():
+            ran.append('disk.swap')
+
+        conn = connection.LibvirtConnection(False)
+        conn._run_image_steps('instance-1', [('kernel', fetch_kernel),
+                                             ('disk.swap', create_swap)])
+        self.assertEqual(['disk.swap', 'kernel'], ran)
+
+    def test_image_steps_are_all_waited_for_on_failure(self):
+        ran = []
+
+        def fetch_disk():
+            raise exception.ImageUnacceptable(image_id=1, reason='bad')
+
+        def create_swap():
+            eventlet.sleep(0)
+            ran.append('disk.swap')
+
+        conn = connection.LibvirtConnection(False)
+        self.assertRaises(exception.ImageUnacceptable, conn._run_image_steps,
+                          'instance-1', [('disk', fetch_disk),
+                                         ('disk.swap', create_swap)])
+        self.assertEqual(['disk.swap'], ran)
+
     def test_update_resource_info_no_compute_record_found(self):
         """Raise exception if no recorde found on services table."""
         self.flags(instances_path='.')
@@ -1092,8 +1298,13 @@ class IptablesFirewallTestCase(test.TestCase):
         from nova.network import linux_net
         linux_net.iptables_manager.execute = fake_iptables_execute
 
+        def get_member_addresses(context, security_group_ids):
+            return dict((security_group_id, get_fixed_ips())
+                        for security_group_id in security_group_ids)
+
         network_info = _fake_network_info(self.stubs, 1)
-        self.stubs.Set(db, 'instance_get_fixed_addresses', get_fixed_ips)
+        self.stubs.Set(db, 'security_group_get_member_addresses',
+                       get_member_addresses)
         self.fw.prepare_instance_filter(instance_ref, network_info)
         self.fw.apply_instance_filter(instance_ref, network_info)
 
@@ -1143,6 +1354,93 @@ class IptablesFirewallTestCase(test.TestCase):
                         "TCP port 80/81 acceptance rule wasn't added")
         db.instance_destroy(admin_ctxt, instance_ref['id'])
 
+    def _create_granted_instances(self, count):
+        """Create count instances in a group that grants tcp 80 access to
+        an instance with two fixed ips."""
+        admin_ctxt = context.get_admin_context()
+        secgroup = db.security_group_create(admin_ctxt,
+                                            {'user_id': 'fake',
+                                             'project_id': 'fake',
+                                             'name': 'testgroup',
+                                             'description': 'test group'})
+        src_secgroup = db.security_group_create(admin_ctxt,
+                                                {'user_id': 'fake',
+                                                 'project_id': 'fake',
+                                                 'name': 'testsourcegroup',
+                                                 'description': 'src group'})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': secgroup['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 80,
+                                       'to_port': 80,
+                                       'group_id': src_secgroup['id']})
+        src_instance_ref = self._create_instance_ref()
+        db.instance_add_security_group(admin_ctxt, src_instance_ref['id'],
+                                       src_secgroup['id'])
+        for address in ('10.11.12.13', '10.11.12.14'):
+            db.fixed_ip_create(admin_ctxt,
+                               {'address': address,
+                                'instance_id': src_instance_ref['id']})
+        instances = []
+        for i in xrange(count):
+            instance_ref = self._create_instance_ref()
+            db.instance_add_security_group(admin_ctxt, instance_ref['id'],
+                                           secgroup['id'])
+            instances.append(instance_ref)
+        return instances, src_secgroup
+
+    def test_refresh_loads_security_groups_once(self):
+        instances, _src_secgroup = self._create_granted_instances(3)
+        network_info = _fake_network_info(self.stubs, 1)
+        for instance_ref in instances:
+            self.fw.instances[instance_ref['id']] = instance_ref
+            self.fw.network_infos[instance_ref['id']] = network_info
+
+        calls = []
+        get_by_instances = db.security_group_get_by_instances
+
+        def fake_get_by_instances(context, instance_ids):
+            calls.append(sorted(instance_ids))
+            return get_by_instances(context, instance_ids)
+
+        self.stubs.Set(db, 'security_group_get_by_instances',
+                       fake_get_by_instances)
+        self.fw.do_refresh_security_group_rules('fake')
+        self.assertEqual(calls,
+                         [sorted(instance_ref['id']
+                                 for instance_ref in instances)])
+        self.assertEqual(self.fw.security_group_cache, None)
+
+        rules = [str(rule) for rule in self.fw.iptables.ipv4['filter'].rules]
+        for instance_ref in instances:
+            chain = self.fw._instance_chain_name(instance_ref)
+            for address in ('10.11.12.13', '10.11.12.14'):
+                rule = '-A %s-%s -j ACCEPT -p tcp --dport 80 -s %s' % (
+                        linux_net.binary_name, chain, address)
+                self.assertTrue(rule in rules, rule)
+
+    def test_instance_rules_with_ipset(self):
+        self.flags(iptables_use_ipset=True, iptables_ipset_min_members=2)
+        instances, src_secgroup = self._create_granted_instances(1)
+        executes = []
+
+        def fake_execute(*cmd, **kwargs):
+            executes.append((cmd, kwargs.get('process_input')))
+            return '', ''
+
+        self.fw.execute = fake_execute
+        network_info = _fake_network_info(self.stubs, 1)
+        ipv4_rules, _ipv6_rules = self.fw.instance_rules(instances[0],
+                                                         network_info)
+        ipset = 'nova-sg-%s' % (src_secgroup['id'],)
+        self.assertTrue('-j ACCEPT -p tcp --dport 80 -m set --match-set %s '
+                        'src' % ipset in ipv4_rules)
+        self.assertEqual(len(executes), 1)
+        cmd, process_input = executes[0]
+        self.assertEqual(cmd, ('ipset', 'restore'))
+        self.assertTrue('add %s-new 10.11.12.13' % ipset in process_input)
+        self.assertTrue('swap %s-new %s' % (ipset, ipset) in process_input)
+
     def test_filters_for_instance_with_ip_v6(self):
         self.flags(use_ipv6=True)
         network_info = _fake_network_info(self.stubs, 1)
@@ -1434,6 +1732,15 @@ class NWFilterTestCase(test.TestCase):
         self.teardown_security_group()
         db.instance_destroy(context.get_admin_context(), instance_ref['id'])
 
+    def test_unchanged_filter_is_not_redefined(self):
+        defined = []
+        self.fake_libvirt_connection.nwfilterDefineXML = defined.append
+        xml = "<filter name='nova-test' chain='root'></filter>"
+        self.fw._define_filter(xml)
+        self.fw._define_filter(xml)
+        self.fw._define_filter(xml.replace('root', 'ipv4'))
+        self.assertEqual(2, len(defined))
+
     def test_create_network_filters(self):
         instance_ref = self._create_instance()
         network_info = _fake_network_info(self.stubs, 3)
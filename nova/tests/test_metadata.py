@@ -24,6 +24,7 @@ import webob
 
 from nova import exception
 from nova import test
+from nova import utils
 from nova.api.ec2 import metadatarequesthandler
 from nova.db.sqlalchemy import api
 from nova.tests import fake_network
@@ -67,6 +68,7 @@ class MetadataTestCase(test.TestCase):
         self.stubs.Set(api, 'instance_get', instance_get)
         self.stubs.Set(api, 'instance_get_all_by_filters', instance_get_list)
         self.stubs.Set(api, 'instance_get_floating_address', floating_get)
+        metadatarequesthandler.get_cache().clear()
         self.app = metadatarequesthandler.MetadataRequestHandler()
         network_manager = fake_network.FakeNetworkManager()
         self.stubs.Set(self.app.cc.network_api,
@@ -122,3 +124,61 @@ class MetadataTestCase(test.TestCase):
         response = request.get_response(self.app)
         self.assertEqual(response.status_int, 200)
         self.assertEqual(response.body, USER_DATA_STRING)
+
+    def _count_lookups(self):
+        self.lookups = 0
+        real_get_metadata = self.app.cc.get_metadata
+
+        def get_metadata(address):
+            self.lookups += 1
+            return real_get_metadata(address)
+
+        self.stubs.Set(self.app.cc, 'get_metadata', get_metadata)
+
+    def test_repeated_requests_use_cache(self):
+        self._count_lookups()
+        self.request('/meta-data/hostname')
+        self.request('/meta-data/instance-id')
+        self.request('/user-data')
+        self.assertEqual(self.lookups, 1)
+
+    def test_cache_disabled(self):
+        self.flags(metadata_cache_expiration=0)
+        self._count_lookups()
+        self.request('/meta-data/hostname')
+        self.request('/meta-data/hostname')
+        self.assertEqual(self.lookups, 2)
+
+    def test_cache_expires(self):
+        self.flags(metadata_cache_expiration=15)
+        self._count_lookups()
+        utils.set_time_override()
+        try:
+            self.request('/meta-data/hostname')
+            utils.advance_time_seconds(16)
+            self.request('/meta-data/hostname')
+        finally:
+            utils.clear_time_override()
+        self.assertEqual(self.lookups, 2)
+
+    def test_invalidate_cache_by_instance(self):
+        self._count_lookups()
+        self.request('/meta-data/hostname')
+        self.app.cache.invalidate_metadata(None, instance_id=1)
+        self.instance['hostname'] = 'renamed'
+        self.assertEqual(self.request('/meta-data/hostname'), 'renamed')
+        self.assertEqual(self.lookups, 2)
+
+    def test_invalidate_cache_by_address(self):
+        self._count_lookups()
+        self.request('/meta-data/hostname')
+        self.app.cache.invalidate_metadata(None, address='127.0.0.1')
+        self.request('/meta-data/hostname')
+        self.assertEqual(self.lookups, 2)
+
+    def test_cache_size_is_bounded(self):
+        self.flags(metadata_cache_max_size=10)
+        for i in xrange(25):
+            self.app.cache.set('10.0.0.%d' % i, i, {})
+        self.assertTrue(len(self.app.cache) <= 10)
+        self.assertEqual(self.app.cache.get('10.0.0.24'), {})
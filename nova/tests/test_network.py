@@ -297,7 +297,7 @@ class VlanNetworkTestCase(test.TestCase):
 
         network = dict(networks[0])
         network['vpn_private_address'] = '192.168.0.2'
-        self.network.allocate_fixed_ip(None, 0, network, vpn=True)
+        self.network.allocate_fixed_ip(self.context, 0, network, vpn=True)
 
     def test_allocate_fixed_ip(self):
         self.mox.StubOutWithMock(db, 'fixed_ip_associate_pool')
@@ -743,3 +743,52 @@ class CommonNetworkTestCase(test.TestCase):
         self.assertTrue(res)
         self.assertEqual(len(res), 1)
         self.assertEqual(res[0]['instance_id'], _vifs[2]['instance_id'])
+
+    def test_get_instance_uuids_by_ip_prefix_uses_index(self):
+        manager = fake_network.FakeNetworkManager()
+        _vifs = manager.db.virtual_interface_get_all(None)
+
+        def scan(*args):
+            self.fail('prefix filters should not scan every vif')
+
+        self.stubs.Set(manager.db, 'virtual_interface_get_all', scan)
+
+        res = manager.get_instance_uuids_by_ip_filter(None,
+                                                      {'ip': '^172\.16\.'})
+        # Floating ips are skipped when their fixed ip already matched
+        self.assertEqual([r['ip'] for r in res],
+                         ['172.16.0.1', '172.16.0.2'])
+
+        # Exact match as built by compute.API for the fixed_ip option
+        res = manager.get_instance_uuids_by_ip_filter(None,
+                                            {'ip': '^172\.16\.0\.2$'})
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]['instance_id'], _vifs[1]['instance_id'])
+        self.assertEqual(res[0]['ip'], '172.16.0.2')
+
+        # Floating ip of instance 2
+        res = manager.get_instance_uuids_by_ip_filter(None,
+                                            {'ip': '^173\.16\.1\.'})
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]['instance_id'], _vifs[2]['instance_id'])
+        self.assertEqual(res[0]['ip'], '173.16.1.2')
+
+    def test_get_instance_uuids_by_ip_regex_scans(self):
+        manager = fake_network.FakeNetworkManager()
+        _vifs = manager.db.virtual_interface_get_all(None)
+        res = manager.get_instance_uuids_by_ip_filter(None,
+                                                    {'ip': '17[23].16.0.2'})
+        self.assertEqual(len(res), 2)
+        self.assertEqual(res[0]['instance_id'], _vifs[1]['instance_id'])
+        self.assertEqual(res[1]['instance_id'], _vifs[2]['instance_id'])
+
+    def test_ip_regex_to_like(self):
+        to_like = network_manager._ip_regex_to_like
+        self.assertEqual(to_like('^10\.0\.0\.1$'), '10.0.0.1')
+        self.assertEqual(to_like('^10\.0\.'), '10.0.%')
+        self.assertEqual(to_like('10.0.0.1'), '10_0_0_1%')
+        self.assertEqual(to_like('172.16.0.*'), '172_16_0%')
+        self.assertEqual(to_like('.*'), '%')
+        self.assertEqual(to_like('2001:db8::.*:2$'), '2001:db8::%:2')
+        self.assertEqual(to_like('10\.0\.0\.[12]'), None)
+        self.assertEqual(to_like('10|11'), None)
@@ -19,6 +19,9 @@
 Unit Tests for remote procedure calls using kombu
 """
 
+from eventlet import event
+import eventlet
+
 from nova import context
 from nova import log as logging
 from nova import test
@@ -82,6 +85,29 @@ class RpcKombuTestCase(test_rpc_common._BaseRpcTestCase):
 
         self.assertEqual(self.received_message, message)
 
+    def test_pack_context_compact(self):
+        self.flags(rpc_compact_envelope=True)
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        msg = {'method': 'echo'}
+        impl_kombu._pack_context(msg, ctxt)
+        self.assertEqual(['_context', 'method'], sorted(msg.keys()))
+
+        unpacked = impl_kombu._unpack_context(msg)
+        self.assertEqual({'method': 'echo'}, msg)
+        self.assertEqual('fake_user', unpacked.user_id)
+        self.assertEqual('fake_project', unpacked.project_id)
+
+    def test_unpack_context_legacy(self):
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        msg = {'method': 'echo'}
+        impl_kombu._pack_context(msg, ctxt)
+        self.assertTrue('_context_user_id' in msg)
+
+        unpacked = impl_kombu._unpack_context(msg)
+        self.assertEqual({'method': 'echo'}, msg)
+        self.assertEqual('fake_user', unpacked.user_id)
+        self.assertEqual('fake_project', unpacked.project_id)
+
     @test.skip_test("kombu memory transport seems buggy with fanout queues "
             "as this test passes when you use rabbit (fake_rabbit=False)")
     def test_fanout_send_receive(self):
@@ -108,3 +134,131 @@ class RpcKombuTestCase(test_rpc_common._BaseRpcTestCase):
         conn2.consume(limit=1)
         conn2.close()
         self.assertEqual(self.received_message, message)
+
+
+class BlockingProxy(object):
+    """Proxy whose calls are recorded and can be held up."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = event.Event()
+
+    def block(self, context):
+        self.calls.append('block')
+        self.release.wait()
+
+    def echo(self, context, value):
+        self.calls.append(value)
+
+    def refresh_security_group_rules(self, context, security_group_id):
+        self.calls.append(('refresh', security_group_id))
+
+
+class ProxyCallbackTestCase(test.TestCase):
+    def setUp(self):
+        super(ProxyCallbackTestCase, self).setUp()
+        self.context = context.RequestContext('fake_user', 'fake_project')
+        self.proxy = BlockingProxy()
+
+    def _cast(self, callback, method, **kwargs):
+        msg = {'method': method, 'args': kwargs}
+        impl_kombu._pack_context(msg, self.context)
+        callback(msg)
+
+    def test_method_concurrency_limit(self):
+        self.flags(rpc_method_concurrency=['block:1'])
+        callback = impl_kombu.ProxyCallback(self.proxy)
+        self._cast(callback, 'block')
+        self._cast(callback, 'block')
+        self._cast(callback, 'echo', value=1)
+        eventlet.sleep(0)
+
+        stats = callback.get_method_stats('block')
+        self.assertEqual(1, stats['running'])
+        self.assertEqual(1, stats['waiting'])
+        self.assertEqual(['block', 1], self.proxy.calls)
+
+        self.proxy.release.send()
+        eventlet.sleep(0)
+        self.assertEqual(['block', 1, 'block'], self.proxy.calls)
+        self.assertEqual(2, stats['processed'])
+        self.assertEqual(0, stats['waiting'])
+
+    def _consume(self, callback, *casts):
+        """Delivers (method, kwargs) casts from a consumer thread.
+
+        The consumer blocks while the callback's queue is full, so this
+        fails the test instead of hanging it if it does.
+
+        """
+        def consume():
+            for method, kwargs in casts:
+                self._cast(callback, method, **kwargs)
+
+        with eventlet.Timeout(1):
+            eventlet.spawn(consume).wait()
+
+    def test_priorities(self):
+        self.flags(rpc_thread_pool_size=2,
+                   rpc_method_priorities=['refresh_security_group_rules:1'])
+        callback = impl_kombu.ProxyCallback(self.proxy)
+        self._consume(callback, ('block', {}), ('block', {}))
+        eventlet.sleep(0)
+        self._consume(callback, ('echo', {'value': 1}),
+                      ('refresh_security_group_rules',
+                       {'security_group_id': 1}))
+
+        self.proxy.release.send()
+        eventlet.sleep(0)
+        self.assertEqual(['block', 'block', ('refresh', 1), 1],
+                         self.proxy.calls)
+
+    def test_limited_method_flood_does_not_block_others(self):
+        self.flags(rpc_thread_pool_size=2, rpc_method_concurrency=['block:1'])
+        callback = impl_kombu.ProxyCallback(self.proxy)
+        self._consume(callback, *([('block', {})] * 4 +
+                                  [('echo', {'value': 1})]))
+        eventlet.sleep(0)
+        self.assertEqual(['block', 1], self.proxy.calls)
+        self.assertEqual(3, callback.get_method_stats('block')['waiting'])
+
+        self.proxy.release.send()
+        eventlet.sleep(0)
+        self.assertEqual(['block', 1, 'block', 'block', 'block'],
+                         self.proxy.calls)
+
+    def test_coalesce_waiting_casts(self):
+        self.flags(rpc_thread_pool_size=2)
+        callback = impl_kombu.ProxyCallback(self.proxy)
+        self._consume(callback, ('block', {}), ('block', {}))
+        eventlet.sleep(0)
+        # The queue is full after the first two, so the duplicate is only
+        # delivered if it is dropped without waiting for room.
+        self._consume(callback, *[('refresh_security_group_rules',
+                                   {'security_group_id': group_id})
+                                  for group_id in (1, 2, 1)])
+
+        stats = callback.get_method_stats('refresh_security_group_rules')
+        self.assertEqual(2, stats['waiting'])
+        self.assertEqual(1, stats['coalesced'])
+
+        self.proxy.release.send()
+        eventlet.sleep(0)
+        self.assertEqual(['block', 'block', ('refresh', 1), ('refresh', 2)],
+                         self.proxy.calls)
+
+    def test_consumers_of_a_proxy_share_a_dispatcher(self):
+        conn = impl_kombu.Connection()
+        callbacks = []
+        self.stubs.Set(conn, 'declare_topic_consumer',
+                       lambda topic, callback: callbacks.append(callback))
+        self.stubs.Set(conn, 'declare_fanout_consumer',
+                       lambda topic, callback: callbacks.append(callback))
+        conn.create_consumer('compute', self.proxy)
+        conn.create_consumer('compute.host', self.proxy)
+        conn.create_consumer('compute', self.proxy, fanout=True)
+        conn.create_consumer('network', BlockingProxy())
+        conn.close()
+
+        self.assertEqual(3, callbacks.count(callbacks[0]))
+        self.assertNotEqual(callbacks[0], callbacks[3])
@@ -16,6 +16,7 @@
 
 import datetime
 import os
+import sys
 import tempfile
 
 import nova
@@ -99,6 +100,47 @@ grep foo
             os.unlink(tmpfilename2)
 
 
+class RootwrapDaemonTestCase(test.TestCase):
+    def setUp(self):
+        super(RootwrapDaemonTestCase, self).setUp()
+        daemon = os.path.join(os.path.dirname(nova.__file__), '..', 'bin',
+                              'nova-rootwrap-daemon')
+        self.flags(use_rootwrap_daemon=True,
+                   root_helper='',
+                   rootwrap_daemon_command='%s %s' % (sys.executable,
+                                                      daemon))
+        utils._ROOTWRAP_DAEMON = None
+
+    def tearDown(self):
+        if utils._ROOTWRAP_DAEMON and utils._ROOTWRAP_DAEMON.process:
+            utils._ROOTWRAP_DAEMON.process.stdin.close()
+            utils._ROOTWRAP_DAEMON.process.wait()
+        utils._ROOTWRAP_DAEMON = None
+        super(RootwrapDaemonTestCase, self).tearDown()
+
+    def test_runs_commands_in_one_daemon(self):
+        self.assertEqual(('foo', ''),
+                         utils.execute('cat', process_input='foo',
+                                       run_as_root=True))
+        process = utils._ROOTWRAP_DAEMON.process
+        self.assertEqual(('bar\n', ''),
+                         utils.execute('echo', 'bar', run_as_root=True))
+        self.assertTrue(process is utils._ROOTWRAP_DAEMON.process)
+
+    def test_check_exit_code(self):
+        self.assertRaises(exception.ProcessExecutionError,
+                          utils.execute, 'false', run_as_root=True)
+        utils.execute('false', run_as_root=True, check_exit_code=1)
+
+    def test_missing_command(self):
+        self.assertRaises(OSError, utils.execute,
+                          '/no/such/command', run_as_root=True)
+
+    def test_not_used_without_run_as_root(self):
+        utils.execute('true')
+        self.assertEqual(None, utils._ROOTWRAP_DAEMON)
+
+
 class GetFromPathTestCase(test.TestCase):
     def test_tolerates_nones(self):
         f = utils.get_from_path
@@ -396,6 +438,26 @@ class ToPrimitiveTestCase(test.TestCase):
         self.assertTrue(ret[1].startswith(u'<function foo at 0x'))
         self.assertEquals(ret[2], u'<built-in function dir>')
 
+    def test_nested_primitives(self):
+        x = datetime.datetime(1, 2, 3, 4, 5, 6, 7)
+        value = {'a': [1, 2L, 3.0, None, True, (u'b', 'c')], 'd': {'e': x}}
+        self.assertEquals(utils.to_primitive(value),
+                          {'a': [1, 2L, 3.0, None, True, [u'b', 'c']],
+                           'd': {'e': "0001-02-03 04:05:06.000007"}})
+
+
+class DumpsTestCase(test.TestCase):
+    def test_converts_only_objects(self):
+        x = datetime.datetime(1, 2, 3, 4, 5, 6, 7)
+        self.assertEquals(utils.loads(utils.dumps({'a': [1, x]})),
+                          {'a': [1, "0001-02-03 04:05:06.000007"]})
+
+    def test_unserializable(self):
+        class MysteryClass(object):
+            pass
+
+        self.assertRaises(TypeError, utils.dumps, [MysteryClass()])
+
 
 class MonkeyPatchTestCase(test.TestCase):
     """Unit test for utils.monkey_patch()."""
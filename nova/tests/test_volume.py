@@ -31,6 +31,8 @@ from nova import rpc
 from nova import test
 from nova import utils
 from nova import volume
+from nova.volume import driver
+from nova.volume import san
 
 FLAGS = flags.FLAGS
 LOG = logging.getLogger('nova.tests.volume')
@@ -449,3 +451,70 @@ class ISCSITestCase(DriverTestCase):
         self.mox.UnsetStubs()
 
         self._detach_volume(volume_id_list)
+
+
+class VolumeWipeTestCase(test.TestCase):
+    """Test Case for wiping deleted volumes"""
+
+    def setUp(self):
+        super(VolumeWipeTestCase, self).setUp()
+        self.commands = []
+        self.lvs = ['  volume-00000001  1024.00']
+
+        def fake_execute(*cmd, **kwargs):
+            self.commands.append(cmd)
+            if cmd[0] == 'lvs':
+                return '\n'.join(self.lvs), ''
+            if cmd[0] == 'vgs':
+                return '  100.00  40.00', ''
+            if cmd[0] == 'lvrename':
+                self.lvs = ['  %s  1024.00' % cmd[3]]
+            elif cmd[0] == 'lvremove':
+                self.lvs = []
+            return '', ''
+
+        self.driver = driver.VolumeDriver(execute=fake_execute)
+        self.volume = {'name': 'volume-00000001', 'size': 1}
+
+    def test_delete_renames_and_wipes_later(self):
+        self.driver._delete_volume(self.volume, 1)
+        self.assertEqual(('lvrename', FLAGS.volume_group, 'volume-00000001',
+                          'wipe-volume-00000001'), self.commands[0])
+        self.assertEqual(1, len(self.commands))
+
+        self.driver._wiper.wait()
+        dds = [cmd for cmd in self.commands if 'dd' in cmd]
+        self.assertEqual(4, len(dds))
+        self.assertEqual(('ionice', '-c3'), dds[0][:2])
+        self.assertTrue('seek=768' in dds[-1])
+        self.assertEqual(('lvremove', '-f',
+                          '%s/wipe-volume-00000001' % FLAGS.volume_group),
+                         self.commands[-2])
+        self.assertEqual(None, self.driver._wiper)
+
+    def test_discard(self):
+        self.flags(volume_wipe_method='discard')
+        self.driver._delete_volume(self.volume, 1)
+        self.driver._wiper.wait()
+        self.assertFalse([cmd for cmd in self.commands if 'dd' in cmd])
+        self.assertTrue(('blkdiscard',
+                         self.driver._lv_path('wipe-volume-00000001'))
+                        in self.commands)
+
+    def test_stats_include_pending_reclaim(self):
+        self.lvs.append('  wipe-volume-00000002  512.00')
+        self.flags(volume_wipe_method='none')
+        stats = self.driver.get_volume_stats(refresh=True)
+        self.assertEqual(40.0, stats['free_gb'])
+        self.assertEqual(0.5, stats['reclaim_pending_gb'])
+        self.assertEqual(1, stats['reclaim_pending_count'])
+        self.driver._wiper.wait()
+        self.assertEqual([], self.lvs)
+
+    def test_san_drivers_do_not_run_vgs(self):
+        for driver_class in (san.SanISCSIDriver, san.SolarisISCSIDriver,
+                             san.HpSanISCSIDriver):
+            volume_driver = driver_class(execute=self.driver._execute)
+            self.assertEqual(None,
+                             volume_driver.get_volume_stats(refresh=True))
+        self.assertEqual([], self.commands)
@@ -20,6 +20,7 @@ import functools
 import json
 import os
 import re
+import socket
 import stubout
 import ast
 
@@ -994,6 +995,159 @@ class CompareVersionTestCase(test.TestCase):
         self.assertTrue(vmops.cmp_version('1.2.3', '1.2.3.4') < 0)
 
 
+class XenAPIEventCacheTestCase(test.TestCase):
+    """Unit tests for tracking VMs and tasks with XenAPI events."""
+    def setUp(self):
+        super(XenAPIEventCacheTestCase, self).setUp()
+        self.stubs = stubout.StubOutForTesting()
+        xenapi_fake.reset()
+        stubs.stubout_session(self.stubs, xenapi_fake.SessionBase)
+        self.session = xenapi_conn.XenAPISession('test_url', 'root',
+                                                 'test_pass')
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(XenAPIEventCacheTestCase, self).tearDown()
+
+    def _names(self):
+        return sorted(rec['name_label'] for rec
+                      in self.session.get_all_vm_records().itervalues())
+
+    def test_vm_records_follow_events(self):
+        vm_ref = xenapi_fake.create_vm('one', 'Running')
+        self.assertEqual(['fake', 'one'], self._names())
+
+        xenapi_fake.get_record('VM', vm_ref)['name_label'] = 'two'
+        self.assertEqual(['fake', 'two'], self._names())
+
+        del xenapi_fake._db_content['VM'][vm_ref]
+        self.assertEqual(['fake'], self._names())
+
+    def test_records_are_not_fetched_one_by_one(self):
+        xenapi_fake.create_vm('one', 'Running')
+
+        def fail(*args):
+            self.fail('VM.get_record should not be called')
+
+        self.stubs.Set(xenapi_fake, 'get_record', fail)
+        self.assertEqual(['fake', 'one'], self._names())
+
+    def test_wait_for_task(self):
+        task = xenapi_fake.create_task('Async.VM.start')
+        task_rec = xenapi_fake.get_record('task', task)
+        task_rec['status'] = 'success'
+        task_rec['result'] = '<value>done</value>'
+        self.assertEqual('done', self.session.wait_for_task(task))
+
+    def test_wait_for_failed_task(self):
+        task = xenapi_fake.create_task('Async.VM.start')
+        task_rec = xenapi_fake.get_record('task', task)
+        task_rec['status'] = 'failure'
+        task_rec['error_info'] = ['VM_BAD_POWER_STATE']
+        self.assertRaises(xenapi_fake.Failure, self.session.wait_for_task,
+                          task)
+
+    def test_falls_back_without_event_from(self):
+        def event_from(*args):
+            raise xenapi_fake.Failure(['MESSAGE_METHOD_UNKNOWN',
+                                       'event.from'])
+
+        self.stubs.Set(xenapi_fake.SessionBase, 'event_from', event_from)
+        self.assertEqual(['fake'], self._names())
+        self.assertFalse(self.session._event_cache.supported)
+
+    def test_falls_back_and_reconnects_after_errors(self):
+        cache = self.session._event_cache
+        self.assertEqual(['fake'], self._names())
+        real_event_from = xenapi_fake.SessionBase.event_from
+
+        def event_from(*args):
+            raise socket.error('connection reset')
+
+        self.stubs.Set(xenapi_fake.SessionBase, 'event_from', event_from)
+        xenapi_fake.create_vm('one', 'Running')
+        self.assertEqual(['fake', 'one'], self._names())
+        self.assertEqual(None, cache._event_session)
+        self.assertTrue(cache.supported)
+
+        self.stubs.Set(xenapi_fake.SessionBase, 'event_from', real_event_from)
+        self.assertEqual(['fake', 'one'], self._names())
+        self.assertNotEqual(None, cache._event_session)
+
+
+class XenAPISessionTestCase(test.TestCase):
+    """Unit tests for the pool of sessions behind XenAPISession."""
+    def setUp(self):
+        super(XenAPISessionTestCase, self).setUp()
+        self.stubs = stubout.StubOutForTesting()
+        self.flags(xenapi_connection_concurrent=2)
+        xenapi_fake.reset()
+        stubs.stubout_session(self.stubs, stubs.FakeSessionForVMTests)
+        self.session = xenapi_conn.XenAPISession('test_url', 'root',
+                                                 'test_pass')
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(XenAPISessionTestCase, self).tearDown()
+
+    def test_calls_check_out_sessions_of_their_own(self):
+        with self.session._get_session() as first:
+            with self.session._get_session() as second:
+                handles = set([self.session._session.handle, first.handle,
+                               second.handle])
+                self.assertEqual(3, len(handles))
+        self.assertEqual(xenapi_fake.get_all('VM'),
+                         self.session.call_xenapi('VM.get_all'))
+
+    def test_host_ref_is_cached(self):
+        host_ref = self.session.get_xenapi_host()
+        session_rec = xenapi_fake.get_record('session',
+                                             self.session._session.handle)
+        session_rec['this_host'] = 'other'
+        self.assertEqual(host_ref, self.session.get_xenapi_host())
+
+    def test_remove_from_xenstore_is_one_plugin_call(self):
+        ops = vmops.VMOps(self.session)
+        plugin_calls = []
+
+        def fake_make_plugin_call(plugin, method, vm, path, addl_args=None,
+                                  vm_ref=None):
+            plugin_calls.append((plugin, method, addl_args))
+            return json.dumps([None, None])
+
+        self.stubs.Set(ops, '_make_plugin_call', fake_make_plugin_call)
+        self.stubs.Set(ops, 'list_from_xenstore',
+                       lambda vm, path: {'a': 1, 'a/b': 2})
+        ops.remove_from_xenstore('vm', 'data', ['a', 'a/b'])
+
+        self.assertEqual(1, len(plugin_calls))
+        plugin, method, args = plugin_calls[0]
+        self.assertEqual(('xenstore.py', 'batch'), (plugin, method))
+        self.assertEqual([{'method': 'delete_record', 'path': 'data/a/b'},
+                          {'method': 'delete_record', 'path': 'data/a'}],
+                         json.loads(args['calls']))
+
+    def test_xenstore_batch_falls_back_to_single_calls(self):
+        ops = vmops.VMOps(self.session)
+        plugin_calls = []
+
+        def fake_make_plugin_call(plugin, method, vm, path, addl_args=None,
+                                  vm_ref=None):
+            plugin_calls.append((method, path, addl_args))
+            if method == 'batch':
+                return {'returncode': 'error',
+                        'message': 'UNKNOWN_XENAPI_PLUGIN_FUNCTION'}
+            return None
+
+        self.stubs.Set(ops, '_make_plugin_call', fake_make_plugin_call)
+        ops._make_xenstore_batch_call('vm',
+                [{'method': 'write_record', 'path': 'a', 'value': '1'},
+                 {'method': 'delete_record', 'path': 'b'}])
+
+        self.assertEqual([('write_record', 'a', {'value': '1'}),
+                          ('delete_record', 'b', {})], plugin_calls[1:])
+
+
 class FakeXenApi(object):
     """Fake XenApi for testing HostState."""
 
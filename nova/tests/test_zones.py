@@ -198,6 +198,39 @@ class ZoneManagerTestCase(test.TestCase):
         self.assertFalse(zone_state.is_active)
         self.assertEquals(zone_state.name, None)
 
+    def test_claim_host_capacity(self):
+        zm = zone_manager.ZoneManager()
+        zm.update_service_capabilities("compute", "host1",
+                dict(host_memory_free=1024 * 1024 * 1024,
+                     disk_available=20 * 1024 * 1024 * 1024,
+                     vcpus_used=0))
+        instance_type = dict(memory_mb=512, local_gb=10, vcpus=2)
+
+        self.assertTrue(zm.claim_host_capacity("host1", instance_type))
+        self.assertTrue(zm.claim_host_capacity("host1", instance_type))
+        caps = zm.service_states["host1"]["compute"]
+        self.assertEquals(caps["host_memory_free"], 0)
+        self.assertEquals(caps["disk_available"], 0)
+        self.assertEquals(caps["vcpus_used"], 4)
+
+        # The host is full, so nothing more is claimed
+        self.assertFalse(zm.claim_host_capacity("host1", instance_type))
+        self.assertEquals(caps["vcpus_used"], 4)
+
+        # Unknown hosts are left for the compute node to sort out
+        self.assertTrue(zm.claim_host_capacity("host2", instance_type))
+
+    def test_claim_host_capacity_expires_on_report(self):
+        zm = zone_manager.ZoneManager()
+        zm.update_service_capabilities("compute", "host1",
+                dict(host_memory_free=1024 * 1024 * 1024))
+        self.assertTrue(zm.claim_host_capacity("host1", dict(memory_mb=1024)))
+        self.assertFalse(zm.claim_host_capacity("host1", dict(memory_mb=1)))
+
+        zm.update_service_capabilities("compute", "host1",
+                dict(host_memory_free=1024 * 1024 * 1024))
+        self.assertTrue(zm.claim_host_capacity("host1", dict(memory_mb=1)))
+
     def test_host_service_caps_stale_no_stale_service(self):
         zm = zone_manager.ZoneManager()
 
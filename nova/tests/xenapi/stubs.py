@@ -157,10 +157,13 @@ class FakeSessionForVMTests(fake.SessionBase):
     def __init__(self, uri):
         super(FakeSessionForVMTests, self).__init__(uri)
 
-    def host_call_plugin(self, _1, _2, plugin, method, _5):
+    def host_call_plugin(self, _1, _2, plugin, method, args):
         # If the call is for 'copy_kernel_vdi' return None.
         if method == 'copy_kernel_vdi':
             return
+        if plugin == 'xenstore.py' and method == 'batch':
+            results = [None] * len(json.loads(args['calls']))
+            return '<string>%s</string>' % json.dumps(results)
         sr_ref = fake.get_all('SR')[0]
         vdi_ref = fake.create_vdi('', False, sr_ref, False)
         vdi_rec = fake.get_record('VDI', vdi_ref)
@@ -171,7 +174,10 @@ class FakeSessionForVMTests(fake.SessionBase):
             ret_str = vdi_rec['uuid']
         return '<string>%s</string>' % ret_str
 
-    def host_call_plugin_swap(self, _1, _2, plugin, method, _5):
+    def host_call_plugin_swap(self, _1, _2, plugin, method, args):
+        if plugin == 'xenstore.py' and method == 'batch':
+            results = [None] * len(json.loads(args['calls']))
+            return '<string>%s</string>' % json.dumps(results)
         sr_ref = fake.get_all('SR')[0]
         vdi_ref = fake.create_vdi('', False, sr_ref, False)
         vdi_rec = fake.get_record('VDI', vdi_ref)
@@ -46,6 +46,7 @@ from eventlet.green import subprocess
 from nova import exception
 from nova import flags
 from nova import log as logging
+from nova import rootwrap
 from nova import version
 
 
@@ -127,6 +128,78 @@ def fetchfile(url, target):
     execute('curl', '--fail', url, '-o', target)
 
 
+class RootwrapDaemonClient(object):
+    """Runs commands through a nova-rootwrap-daemon started on first use.
+
+    Any number of green threads can have commands running at once; their
+    responses are matched up by request id.
+    """
+
+    def __init__(self, daemon_cmd):
+        self.daemon_cmd = daemon_cmd
+        self.process = None
+        self._lock = semaphore.Semaphore()
+        self._waiters = {}
+        self._next_id = 0
+
+    def _start(self):
+        LOG.debug(_('Starting root helper daemon: %s'),
+                  ' '.join(self.daemon_cmd))
+        _PIPE = subprocess.PIPE  # pylint: disable=E1101
+        self.process = subprocess.Popen(self.daemon_cmd,
+                                        stdin=_PIPE,
+                                        stdout=_PIPE,
+                                        close_fds=True)
+        greenthread.spawn_n(self._read_responses, self.process)
+
+    def _read_responses(self, process):
+        for line in iter(process.stdout.readline, ''):
+            request_id, result = rootwrap.decode_response(line)
+            waiter = self._waiters.pop(request_id, None)
+            if waiter is not None:
+                waiter.send(result)
+        LOG.warn(_('Root helper daemon exited'))
+        if self.process is process:
+            self.process = None
+        waiters = self._waiters
+        self._waiters = {}
+        for waiter in waiters.itervalues():
+            waiter.send(exception.Error(_('Root helper daemon exited')))
+
+    def execute(self, cmd, process_input=None):
+        """Runs cmd as root and returns (returncode, stdout, stderr)."""
+        waiter = event.Event()
+        with self._lock:
+            if self.process is None:
+                self._start()
+            self._next_id += 1
+            request_id = self._next_id
+            self._waiters[request_id] = waiter
+            try:
+                self.process.stdin.write(rootwrap.encode_request(
+                        request_id, cmd, process_input))
+                self.process.stdin.flush()
+            except IOError:
+                self._waiters.pop(request_id, None)
+                raise
+        result = waiter.wait()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+_ROOTWRAP_DAEMON = None
+
+
+def _get_rootwrap_daemon():
+    global _ROOTWRAP_DAEMON
+    if _ROOTWRAP_DAEMON is None:
+        daemon_cmd = (shlex.split(FLAGS.root_helper) +
+                      shlex.split(FLAGS.rootwrap_daemon_command))
+        _ROOTWRAP_DAEMON = RootwrapDaemonClient(daemon_cmd)
+    return _ROOTWRAP_DAEMON
+
+
 def execute(*cmd, **kwargs):
     """
     Helper method to execute command with optional retry.
@@ -155,27 +228,35 @@ def execute(*cmd, **kwargs):
         raise exception.Error(_('Got unknown keyword args '
                                 'to utils.execute: %r') % kwargs)
 
-    if run_as_root:
+    use_daemon = run_as_root and FLAGS.use_rootwrap_daemon
+    if run_as_root and not use_daemon:
         cmd = shlex.split(FLAGS.root_helper) + list(cmd)
     cmd = map(str, cmd)
 
     while attempts > 0:
         attempts -= 1
         try:
-            LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
-            _PIPE = subprocess.PIPE  # pylint: disable=E1101
-            obj = subprocess.Popen(cmd,
-                                   stdin=_PIPE,
-                                   stdout=_PIPE,
-                                   stderr=_PIPE,
-                                   close_fds=True)
-            result = None
-            if process_input is not None:
-                result = obj.communicate(process_input)
+            if use_daemon:
+                LOG.debug(_('Running cmd (root helper daemon): %s'),
+                          ' '.join(cmd))
+                _returncode, stdout, stderr = \
+                        _get_rootwrap_daemon().execute(cmd, process_input)
+                result = (stdout, stderr)
             else:
-                result = obj.communicate()
-            obj.stdin.close()  # pylint: disable=E1101
-            _returncode = obj.returncode  # pylint: disable=E1101
+                LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
+                _PIPE = subprocess.PIPE  # pylint: disable=E1101
+                obj = subprocess.Popen(cmd,
+                                       stdin=_PIPE,
+                                       stdout=_PIPE,
+                                       stderr=_PIPE,
+                                       close_fds=True)
+                result = None
+                if process_input is not None:
+                    result = obj.communicate(process_input)
+                else:
+                    result = obj.communicate()
+                obj.stdin.close()  # pylint: disable=E1101
+                _returncode = obj.returncode  # pylint: disable=E1101
             if _returncode:
                 LOG.debug(_('Result was %s') % _returncode)
                 if type(check_exit_code) == types.IntType \
@@ -534,6 +615,9 @@ def utf8(value):
     return value
 
 
+_PRIMITIVE_TYPES = (type(None), int, long, float, bool, str, unicode)
+
+
 def to_primitive(value, convert_instances=False, level=0):
     """Convert a complex object into primitives.
 
@@ -548,6 +632,13 @@ def to_primitive(value, convert_instances=False, level=0):
     Therefore, convert_instances=True is lossy ... be aware.
 
     """
+    # Most of what we are handed is plain values in dicts and lists, which
+    # none of the inspect checks below can match, so skip them.
+    if type(value) in _PRIMITIVE_TYPES:
+        return value
+    if type(value) is datetime.datetime:
+        return str(value)
+
     nasty = [inspect.ismodule, inspect.isclass, inspect.ismethod,
              inspect.isfunction, inspect.isgeneratorfunction,
              inspect.isgenerator, inspect.istraceback, inspect.isframe,
@@ -597,12 +688,16 @@ def to_primitive(value, convert_instances=False, level=0):
         return unicode(value)
 
 
+def _json_default(value):
+    """Converts the objects json cannot serialize itself."""
+    primitive = to_primitive(value)
+    if primitive is value:
+        raise TypeError(_('%r is not JSON serializable') % value)
+    return primitive
+
+
 def dumps(value):
-    try:
-        return json.dumps(value)
-    except TypeError:
-        pass
-    return json.dumps(to_primitive(value))
+    return json.dumps(value, default=_json_default)
 
 
 def loads(s):
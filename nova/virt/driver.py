@@ -474,6 +474,17 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def prefetch_image(self, context, image_id):
+        """Download an image ahead of the instances that will use it.
+
+        Drivers without a local image cache ignore this.
+        """
+        pass
+
+    def manage_image_cache(self, context):
+        """Remove unused images from the local image cache, if any."""
+        pass
+
     def host_power_action(self, host, action):
         """Reboots, shuts down or powers up the host."""
         raise NotImplementedError()
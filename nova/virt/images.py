@@ -21,6 +21,13 @@
 Handling of VM disk images.
 """
 
+import hashlib
+import os
+import time
+
+from eventlet import greenthread
+
+from nova import exception
 from nova import flags
 from nova.image import glance as glance_image_service
 import nova.image
@@ -31,14 +38,129 @@ from nova import utils
 FLAGS = flags.FLAGS
 LOG = logging.getLogger('nova.virt.images')
 
+# Downloads in progress in this process, by target path
+_downloads = {}
+
+
+class _ImageWriter(object):
+    """Writes to a file while keeping the MD5 and size of what it holds."""
+
+    def __init__(self, path):
+        self.md5 = hashlib.md5()
+        self.size = 0
+        self.file = open(path, 'a+b')
+        self.file.seek(0)
+        for chunk in iter(lambda: self.file.read(1024 * 1024), ''):
+            self.md5.update(chunk)
+            self.size += len(chunk)
+        self.file.seek(0, os.SEEK_END)
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.md5.update(chunk)
+        self.size += len(chunk)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.file.seek(offset, whence)
+
+    def truncate(self, size=0):
+        """Throws away everything written from size on."""
+        self.file.truncate(size)
+        self.file.seek(0)
+        self.md5 = hashlib.md5()
+        self.size = 0
+        for chunk in iter(lambda: self.file.read(1024 * 1024), ''):
+            self.md5.update(chunk)
+            self.size += len(chunk)
+
+    def close(self):
+        self.file.close()
+
 
 def fetch(context, image_href, path, _user_id, _project_id):
+    """Downloads image_href to path and returns its metadata.
+
+    The image is written to path.download and only renamed to path once
+    it is complete and matches the checksum glance has for it.  A
+    path.download left by an earlier, failed attempt is resumed.  Callers
+    asking for a path that is already being downloaded in this process
+    wait for that download instead of starting another one.
+
+    """
+    if path in _downloads:
+        LOG.debug(_('Waiting for the download of %s already in progress'),
+                  path)
+        return _downloads[path].wait()
+
+    download = greenthread.spawn(_fetch, context, image_href, path)
+    _downloads[path] = download
+    try:
+        return download.wait()
+    finally:
+        del _downloads[path]
+
+
+def _fetch(context, image_href, path):
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
     #             checked before we got here.
     (image_service, image_id) = nova.image.get_image_service(context,
                                                              image_href)
-    with open(path, "wb") as image_file:
-        metadata = image_service.get(context, image_id, image_file)
+    partial = path + '.download'
+    writer = _ImageWriter(partial)
+    offset = writer.size
+    started_at = time.time()
+    try:
+        try:
+            metadata = _get_image(context, image_service, image_id, writer)
+        except Exception:
+            if not offset:
+                raise
+            # e.g. glance answers 416 if the partial file is complete
+            LOG.exception(_('Resuming the download of image %(image_id)s '
+                            'at byte %(offset)d failed, starting over'),
+                          locals())
+            metadata = None
+        if offset and (metadata is None or
+                       not _checksum_matches(writer, metadata)):
+            writer.truncate()
+            offset = 0
+            metadata = _get_image(context, image_service, image_id, writer)
+    finally:
+        writer.close()
+
+    if not _checksum_matches(writer, metadata):
+        os.unlink(partial)
+        raise exception.ImageUnacceptable(image_id=image_id,
+                reason=_('checksum %(actual)s does not match %(checksum)s') %
+                       {'actual': writer.md5.hexdigest(),
+                        'checksum': metadata['checksum']})
+    os.rename(partial, path)
+
+    elapsed = max(time.time() - started_at, 0.001)
+    fetched = writer.size - offset
+    rate = fetched / elapsed / (1024 * 1024)
+    LOG.info(_('Fetched %(fetched)d bytes of image %(image_id)s in '
+               '%(elapsed).1f seconds (%(rate).1f MB/s)'), locals())
     return metadata
+
+
+def _get_image(context, image_service, image_id, writer):
+    """Writes the image to writer, only getting what writer does not hold
+    yet if the image service can do that."""
+    if isinstance(image_service, glance_image_service.GlanceImageService):
+        offset = writer.size
+        if offset:
+            LOG.info(_('Resuming download of image %(image_id)s at '
+                       'byte %(offset)d'), locals())
+        return image_service.get(context, image_id, writer, offset=offset)
+    writer.truncate()
+    return image_service.get(context, image_id, writer)
+
+
+def _checksum_matches(writer, metadata):
+    """Whether what writer holds matches the checksum in metadata, if
+    there is one."""
+    checksum = metadata.get('checksum')
+    return not checksum or writer.md5.hexdigest() == checksum
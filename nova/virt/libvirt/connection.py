@@ -70,6 +70,7 @@ from nova.compute import power_state
 from nova.virt import disk
 from nova.virt import driver
 from nova.virt import images
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt import netutils
 
 
@@ -138,6 +139,10 @@ flags.DEFINE_string('default_local_format',
                     None,
                     'The default format a local_volume will be formatted with '
                     'on creation.')
+flags.DEFINE_integer('libvirt_domain_info_ttl', 10,
+                     'Seconds a sweep of the info of all running domains is '
+                     'reused for power state sync, resource accounting and '
+                     'host stats')
 flags.DEFINE_bool('libvirt_use_virtio_for_bridges',
                   False,
                   'Use virtio for bridge interfaces')
@@ -166,6 +171,23 @@ def _late_load_cheetah():
         Template = t.Template
 
 
+# Compiled Cheetah templates by path
+_templates = {}
+
+
+def _get_template(path):
+    """Returns the Cheetah template at path compiled into a class.
+
+    Parsing a template and generating python for it is most of the cost
+    of rendering it, so it is only done once per path.
+
+    """
+    if path not in _templates:
+        _late_load_cheetah()
+        _templates[path] = Template.compile(file=path)
+    return _templates[path]
+
+
 def _get_eph_disk(ephemeral):
     return 'disk.eph' + str(ephemeral['num'])
 
@@ -176,14 +198,21 @@ class LibvirtConnection(driver.ComputeDriver):
         super(LibvirtConnection, self).__init__()
         self.libvirt_uri = self.get_uri()
 
-        self.libvirt_xml = open(FLAGS.libvirt_xml_template).read()
-        self.cpuinfo_xml = open(FLAGS.cpuinfo_xml_template).read()
+        self.libvirt_xml = _get_template(FLAGS.libvirt_xml_template)
+        self.cpuinfo_xml = _get_template(FLAGS.cpuinfo_xml_template)
         self._wrapped_conn = None
         self.read_only = read_only
 
         fw_class = utils.import_class(FLAGS.firewall_driver)
         self.firewall_driver = fw_class(get_connection=self._get_connection)
         self.vif_driver = utils.import_object(FLAGS.libvirt_vif_driver)
+        self._host_state = None
+
+    @property
+    def host_state(self):
+        if not self._host_state:
+            self._host_state = HostState(self)
+        return self._host_state
 
     def init_host(self, host):
         # NOTE(nsokolov): moved instance restarting to ComputeManager
@@ -230,11 +259,14 @@ class LibvirtConnection(driver.ComputeDriver):
             return libvirt.openAuth(uri, auth, 0)
 
     def list_instances(self):
-        return [self._conn.lookupByID(x).name()
-                for x in self._conn.listDomainsID()]
+        return self.host_state.get_domains(refresh=True).keys()
+
+    def list_instances_detail(self):
+        return [driver.InstanceInfo(name, info['state'])
+                for name, info in self.host_state.get_domains().iteritems()]
 
-    def _map_to_instance_info(self, domain):
-        """Gets info from a virsh domain object into an InstanceInfo"""
+    def _sweep_domains(self):
+        """Returns the info of every running domain by name."""
 
         # domain.info() returns a list of:
         #    state:       one of the state values (virDomainState)
@@ -243,18 +275,21 @@ class LibvirtConnection(driver.ComputeDriver):
         #    nbVirtCPU:   the number of virtual CPU
         #    puTime:      the time used by the domain in nanoseconds
 
-        (state, _max_mem, _mem, _num_cpu, _cpu_time) = domain.info()
-        name = domain.name()
-
-        return driver.InstanceInfo(name, state)
-
-    def list_instances_detail(self):
-        infos = []
+        domains = {}
         for domain_id in self._conn.listDomainsID():
-            domain = self._conn.lookupByID(domain_id)
-            info = self._map_to_instance_info(domain)
-            infos.append(info)
-        return infos
+            try:
+                domain = self._conn.lookupByID(domain_id)
+                name = domain.name()
+                (state, max_mem, mem, num_cpu, cpu_time) = domain.info()
+            except libvirt.libvirtError:
+                # NOTE: the domain went away since listDomainsID
+                continue
+            domains[name] = {'state': state,
+                             'max_mem': max_mem,
+                             'mem': mem,
+                             'num_cpu': num_cpu,
+                             'cpu_time': cpu_time}
+        return domains
 
     def plug_vifs(self, instance, network_info):
         """Plugin VIFs into networks."""
@@ -749,26 +784,7 @@ class LibvirtConnection(driver.ComputeDriver):
 
         If cow is True, it will make a CoW image instead of a copy.
         """
-
-        if not os.path.exists(target):
-            base_dir = os.path.join(FLAGS.instances_path, '_base')
-            if not os.path.exists(base_dir):
-                os.mkdir(base_dir)
-            base = os.path.join(base_dir, fname)
-
-            @utils.synchronized(fname)
-            def call_if_not_exists(base, fn, *args, **kwargs):
-                if not os.path.exists(base):
-                    fn(target=base, *args, **kwargs)
-
-            call_if_not_exists(base, fn, *args, **kwargs)
-
-            if cow:
-                utils.execute('qemu-img', 'create', '-f', 'qcow2', '-o',
-                              'cluster_size=2M,backing_file=%s' % base,
-                              target)
-            else:
-                utils.execute('cp', base, target)
+        imagecache.cache(fn, target, fname, cow, *args, **kwargs)
 
     def _fetch_image(self, context, target, image_id, user_id, project_id,
                      size=None):
@@ -777,6 +793,46 @@ class LibvirtConnection(driver.ComputeDriver):
         if size:
             disk.extend(target, size)
 
+    def prefetch_image(self, context, image_id):
+        """Download image_id into the base image cache."""
+        LOG.info(_('Prefetching image %s'), image_id)
+        self._cache_image(fn=self._fetch_image,
+                          context=context,
+                          target=None,
+                          fname=hashlib.sha1(image_id).hexdigest(),
+                          image_id=image_id,
+                          user_id=context.user_id,
+                          project_id=context.project_id,
+                          size=FLAGS.minimum_root_size)
+
+    def manage_image_cache(self, context):
+        """Evict base images that no instance disk is backed by.
+
+        Every instance directory under instances_path is looked at, not
+        just those of running domains, so the bases of stopped instances
+        and of instances of other hosts sharing instances_path are kept.
+
+        """
+        if not os.path.isdir(FLAGS.instances_path):
+            return
+        in_use = set()
+        for name in os.listdir(FLAGS.instances_path):
+            instance_dir = os.path.join(FLAGS.instances_path, name)
+            if (instance_dir == imagecache.base_dir() or
+                not os.path.isdir(instance_dir)):
+                continue
+            for fname in os.listdir(instance_dir):
+                if not fname.startswith('disk'):
+                    continue
+                try:
+                    backing = imagecache.backing_file(
+                            os.path.join(instance_dir, fname))
+                except exception.ProcessExecutionError:
+                    continue
+                if backing:
+                    in_use.add(backing)
+        imagecache.evict(in_use)
+
     def _create_local(self, target, local_size, unit='G', fs_format=None):
         """Create a blank image of specified size"""
 
@@ -796,6 +852,33 @@ class LibvirtConnection(driver.ComputeDriver):
         self._create_local(target, swap_mb, unit='M')
         utils.execute('mkswap', target)
 
+    def _run_image_steps(self, instance_name, steps):
+        """Runs the (name, fn) image creation steps concurrently.
+
+        Every step is waited for even if another one fails, so nothing is
+        still writing to the instance directory once this returns.  Each
+        failure is logged and the first one is raised again.
+
+        """
+        threads = [(name, greenthread.spawn(fn)) for name, fn in steps]
+        failures = []
+        for name, thread in threads:
+            try:
+                thread.wait()
+            except Exception:
+                failures.append(sys.exc_info())
+                LOG.exception(_('instance %(instance_name)s: failed to '
+                                'create %(name)s') % locals())
+        if failures:
+            if len(failures) > 1:
+                LOG.error(_('instance %(instance_name)s: %(count)d of '
+                            '%(total)d images failed to be created') %
+                          {'instance_name': instance_name,
+                           'count': len(failures),
+                           'total': len(steps)})
+            exc_info = failures[0]
+            raise exc_info[0], exc_info[1], exc_info[2]
+
     def _create_image(self, context, inst, libvirt_xml, suffix='',
                       disk_images=None, network_info=None,
                       block_device_info=None):
@@ -831,24 +914,35 @@ class LibvirtConnection(driver.ComputeDriver):
                            'kernel_id': inst['kernel_id'],
                            'ramdisk_id': inst['ramdisk_id']}
 
+        # The disks and kernel of an instance do not depend on each other,
+        # so they are all made at the same time and waited for before
+        # anything is injected into them.
+        steps = []
+
+        def cache_image(name, **kwargs):
+            steps.append((name,
+                          functools.partial(self._cache_image, **kwargs)))
+
         if disk_images['kernel_id']:
             fname = '%08x' % int(disk_images['kernel_id'])
-            self._cache_image(fn=self._fetch_image,
-                              context=context,
-                              target=basepath('kernel'),
-                              fname=fname,
-                              image_id=disk_images['kernel_id'],
-                              user_id=inst['user_id'],
-                              project_id=inst['project_id'])
+            cache_image('kernel',
+                        fn=self._fetch_image,
+                        context=context,
+                        target=basepath('kernel'),
+                        fname=fname,
+                        image_id=disk_images['kernel_id'],
+                        user_id=inst['user_id'],
+                        project_id=inst['project_id'])
             if disk_images['ramdisk_id']:
                 fname = '%08x' % int(disk_images['ramdisk_id'])
-                self._cache_image(fn=self._fetch_image,
-                                  context=context,
-                                  target=basepath('ramdisk'),
-                                  fname=fname,
-                                  image_id=disk_images['ramdisk_id'],
-                                  user_id=inst['user_id'],
-                                  project_id=inst['project_id'])
+                cache_image('ramdisk',
+                            fn=self._fetch_image,
+                            context=context,
+                            target=basepath('ramdisk'),
+                            fname=fname,
+                            image_id=disk_images['ramdisk_id'],
+                            user_id=inst['user_id'],
+                            project_id=inst['project_id'])
 
         root_fname = hashlib.sha1(disk_images['image_id']).hexdigest()
         size = FLAGS.minimum_root_size
@@ -861,35 +955,41 @@ class LibvirtConnection(driver.ComputeDriver):
 
         if not self._volume_in_mapping(self.default_root_device,
                                        block_device_info):
-            self._cache_image(fn=self._fetch_image,
-                              context=context,
-                              target=basepath('disk'),
-                              fname=root_fname,
-                              cow=FLAGS.use_cow_images,
-                              image_id=disk_images['image_id'],
-                              user_id=inst['user_id'],
-                              project_id=inst['project_id'],
-                              size=size)
+            cache_image('disk',
+                        fn=self._fetch_image,
+                        context=context,
+                        target=basepath('disk'),
+                        fname=root_fname,
+                        cow=FLAGS.use_cow_images,
+                        image_id=disk_images['image_id'],
+                        user_id=inst['user_id'],
+                        project_id=inst['project_id'],
+                        size=size)
 
         local_gb = inst['local_gb']
         if local_gb and not self._volume_in_mapping(
             self.default_local_device, block_device_info):
-            self._cache_image(fn=self._create_local,
-                              target=basepath('disk.local'),
-                              fname="local_%s" % local_gb,
-                              cow=FLAGS.use_cow_images,
-                              local_size=local_gb)
+            # NOTE: the format is part of the name so that changing
+            # default_local_format does not hand out stale bases
+            fs_format = FLAGS.default_local_format or 'raw'
+            cache_image('disk.local',
+                        fn=self._create_local,
+                        target=basepath('disk.local'),
+                        fname="local_%s_%s" % (local_gb, fs_format),
+                        cow=FLAGS.use_cow_images,
+                        local_size=local_gb)
 
         for eph in driver.block_device_info_get_ephemerals(block_device_info):
             fn = functools.partial(self._create_ephemeral,
                                    fs_label='ephemeral%d' % eph['num'],
                                    os_type=inst.os_type)
-            self._cache_image(fn=fn,
-                              target=basepath(_get_eph_disk(eph)),
-                              fname="ephemeral_%s_%s_%s" %
-                              (eph['num'], eph['size'], inst.os_type),
-                              cow=FLAGS.use_cow_images,
-                              local_size=eph['size'])
+            cache_image(_get_eph_disk(eph),
+                        fn=fn,
+                        target=basepath(_get_eph_disk(eph)),
+                        fname="ephemeral_%s_%s_%s" %
+                        (eph['num'], eph['size'], inst.os_type),
+                        cow=FLAGS.use_cow_images,
+                        local_size=eph['size'])
 
         swap_mb = 0
 
@@ -902,11 +1002,12 @@ class LibvirtConnection(driver.ComputeDriver):
             swap_mb = inst_type['swap']
 
         if swap_mb > 0:
-            self._cache_image(fn=self._create_swap,
-                              target=basepath('disk.swap'),
-                              fname="swap_%s" % swap_mb,
-                              cow=FLAGS.use_cow_images,
-                              swap_mb=swap_mb)
+            cache_image('disk.swap',
+                        fn=self._create_swap,
+                        target=basepath('disk.swap'),
+                        fname="swap_%s" % swap_mb,
+                        cow=FLAGS.use_cow_images,
+                        swap_mb=swap_mb)
 
         # For now, we assume that if we're not using a kernel, we're using a
         # partitioned disk image where the target partition is the first
@@ -923,15 +1024,25 @@ class LibvirtConnection(driver.ComputeDriver):
 
         if config_drive_id:
             fname = '%08x' % int(config_drive_id)
-            self._cache_image(fn=self._fetch_image,
-                              target=basepath('disk.config'),
-                              fname=fname,
-                              image_id=config_drive_id,
-                              user_id=inst['user_id'],
-                              project_id=inst['project_id'],)
+            cache_image('disk.config',
+                        fn=self._fetch_image,
+                        target=basepath('disk.config'),
+                        fname=fname,
+                        image_id=config_drive_id,
+                        user_id=inst['user_id'],
+                        project_id=inst['project_id'])
         elif config_drive:
-            self._create_local(basepath('disk.config'), 64, unit='M',
-                               fs_format='msdos')  # 64MB
+            # NOTE: the config drive is raw, so it is a copy of its base
+            # rather than a CoW image of it
+            cache_image('disk.config',
+                        fn=self._create_local,
+                        target=basepath('disk.config'),
+                        fname="local_64M_msdos",
+                        local_size=64,
+                        unit='M',
+                        fs_format='msdos')
+
+        self._run_image_steps(inst['name'], steps)
 
         if inst['key_data']:
             key = str(inst['key_data'])
@@ -940,7 +1051,6 @@ class LibvirtConnection(driver.ComputeDriver):
         net = None
 
         nets = []
-        ifc_template = open(FLAGS.injected_network_template).read()
         ifc_num = -1
         have_injected_networks = False
         admin_context = nova_context.get_admin_context()
@@ -972,9 +1082,9 @@ class LibvirtConnection(driver.ComputeDriver):
             nets.append(net_info)
 
         if have_injected_networks:
-            net = str(Template(ifc_template,
-                               searchList=[{'interfaces': nets,
-                                            'use_ipv6': FLAGS.use_ipv6}]))
+            ifc_template = _get_template(FLAGS.injected_network_template)
+            net = str(ifc_template(searchList=[{'interfaces': nets,
+                                                'use_ipv6': FLAGS.use_ipv6}]))
 
         metadata = inst.get('metadata')
         if any((key, net, metadata)):
@@ -1158,11 +1268,10 @@ class LibvirtConnection(driver.ComputeDriver):
 
     def to_xml(self, instance, network_info, rescue=False,
                block_device_info=None):
-        # TODO(termie): cache?
         LOG.debug(_('instance %s: starting toXML method'), instance['name'])
         xml_info = self._prepare_xml_info(instance, network_info, rescue,
                                           block_device_info)
-        xml = str(Template(self.libvirt_xml, searchList=[xml_info]))
+        xml = str(self.libvirt_xml(searchList=[xml_info]))
         LOG.debug(_('instance %s: finished toXML method'), instance['name'])
         return xml
 
@@ -1355,11 +1464,8 @@ class LibvirtConnection(driver.ComputeDriver):
 
         """
 
-        total = 0
-        for dom_id in self._conn.listDomainsID():
-            dom = self._conn.lookupByID(dom_id)
-            total += len(dom.vcpus()[1])
-        return total
+        return sum(info['num_cpu']
+                   for info in self.host_state.get_domains().itervalues())
 
     def get_memory_mb_used(self):
         """Get the free memory size(MB) of physical computer.
@@ -1526,15 +1632,7 @@ class LibvirtConnection(driver.ComputeDriver):
             raise exception.ComputeServiceUnavailable(host=host)
 
         # Updating host information
-        dic = {'vcpus': self.get_vcpu_total(),
-               'memory_mb': self.get_memory_mb_total(),
-               'local_gb': self.get_local_gb_total(),
-               'vcpus_used': self.get_vcpu_used(),
-               'memory_mb_used': self.get_memory_mb_used(),
-               'local_gb_used': self.get_local_gb_used(),
-               'hypervisor_type': self.get_hypervisor_type(),
-               'hypervisor_version': self.get_hypervisor_version(),
-               'cpu_info': self.get_cpu_info()}
+        dic = self.host_state.get_resources()
 
         compute_node_ref = service_ref['compute_node']
         if not compute_node_ref:
@@ -1562,7 +1660,7 @@ class LibvirtConnection(driver.ComputeDriver):
 
         LOG.info(_('Instance launched has CPU info:\n%s') % cpu_info)
         dic = utils.loads(cpu_info)
-        xml = str(Template(self.cpuinfo_xml, searchList=dic))
+        xml = str(self.cpuinfo_xml(searchList=dic))
         LOG.info(_('to xml...\n:%s ' % xml))
 
         u = "http://libvirt.org/html/libvirt-libvirt.html#virCPUCompareResult"
@@ -1847,11 +1945,11 @@ class LibvirtConnection(driver.ComputeDriver):
 
     def update_host_status(self):
         """See xenapi_conn.py implementation."""
-        pass
+        return self.host_state.update_status()
 
     def get_host_stats(self, refresh=False):
         """See xenapi_conn.py implementation."""
-        pass
+        return self.host_state.get_host_stats(refresh=refresh)
 
     def host_power_action(self, host, action):
         """Reboots, shuts down or powers up the host."""
@@ -1860,3 +1958,75 @@ class LibvirtConnection(driver.ComputeDriver):
     def set_host_enabled(self, host, enabled):
         """Sets the specified host's ability to accept new instances."""
         pass
+
+
+class HostState(object):
+    """Manages information about the host this compute node runs on.
+
+    Facts that do not change while nova-compute runs, such as the totals,
+    the hypervisor version and the cpu info parsed from the capabilities
+    XML, are looked up once.  The info of all running domains is gathered
+    in one sweep that is reused for libvirt_domain_info_ttl seconds.
+
+    """
+
+    def __init__(self, connection):
+        super(HostState, self).__init__()
+        self.connection = connection
+        self._static = None
+        self._domains = None
+        self._swept_at = 0
+        self._stats = {}
+
+    def get_static(self):
+        """Returns the facts about the host that do not change."""
+        if self._static is None:
+            conn = self.connection
+            self._static = {'vcpus': conn.get_vcpu_total(),
+                            'memory_mb': conn.get_memory_mb_total(),
+                            'local_gb': conn.get_local_gb_total(),
+                            'hypervisor_type': conn.get_hypervisor_type(),
+                            'hypervisor_version':
+                                conn.get_hypervisor_version(),
+                            'cpu_info': conn.get_cpu_info()}
+        return self._static
+
+    def get_domains(self, refresh=False):
+        """Returns the info of every running domain by name, sweeping the
+        domains again if refresh is True or the last sweep is too old."""
+        if (refresh or self._domains is None or
+            time.time() - self._swept_at > FLAGS.libvirt_domain_info_ttl):
+            self._domains = self.connection._sweep_domains()
+            self._swept_at = time.time()
+        return self._domains
+
+    def get_resources(self):
+        """Returns the totals and usage of the host the way the
+        compute_nodes table holds them."""
+        resources = dict(self.get_static())
+        resources['vcpus_used'] = self.connection.get_vcpu_used()
+        resources['memory_mb_used'] = self.connection.get_memory_mb_used()
+        resources['local_gb_used'] = self.connection.get_local_gb_used()
+        return resources
+
+    def get_host_stats(self, refresh=False):
+        """Return the current state of the host. If 'refresh' is
+        True, run the update first.
+        """
+        if refresh or not self._stats:
+            self.update_status()
+        return self._stats
+
+    def update_status(self):
+        """Gathers the stats reported to the schedulers."""
+        LOG.debug(_("Updating host stats"))
+        domains = self.get_domains(refresh=True)
+        data = self.get_resources()
+        data['running_instances'] = len(domains)
+        data['host_memory_total'] = data['memory_mb'] * 1024 * 1024
+        data['host_memory_free'] = ((data['memory_mb'] -
+                                     data['memory_mb_used']) * 1024 * 1024)
+        data['disk_total'] = data['local_gb'] * 1024 * 1024 * 1024
+        data['disk_used'] = data['local_gb_used'] * 1024 * 1024 * 1024
+        data['disk_available'] = data['disk_total'] - data['disk_used']
+        self._stats = data
@@ -17,6 +17,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import re
 
 from eventlet import tpool
 
@@ -30,6 +31,14 @@ from nova.virt.libvirt import netutils
 
 LOG = logging.getLogger("nova.virt.libvirt.firewall")
 FLAGS = flags.FLAGS
+flags.DEFINE_bool('iptables_use_ipset', False,
+                  'Match the members of large grantee security groups with'
+                  ' an ipset instead of one iptables rule per address')
+flags.DEFINE_integer('iptables_ipset_min_members', 10,
+                     'Grantee groups with at least this many addresses are'
+                     ' matched with an ipset if iptables_use_ipset is set')
+
+_FILTER_NAME_RE = re.compile(r"<filter name='([^']+)'")
 
 
 try:
@@ -147,6 +156,8 @@ class NWFilterFirewall(FirewallDriver):
         self._libvirt_get_connection = get_connection
         self.static_filters_configured = False
         self.handle_security_groups = False
+        # The XML each filter was last defined with, by filter name
+        self._defined_filters = {}
 
     def apply_instance_filter(self, instance, network_info):
         """No-op. Everything is done in prepare_instance_filter"""
@@ -292,8 +303,16 @@ class NWFilterFirewall(FirewallDriver):
     def _define_filter(self, xml):
         if callable(xml):
             xml = xml()
+        # Redefining a filter makes libvirt rebuild the rules of every
+        # instance referencing it, so skip it when nothing changed.
+        match = _FILTER_NAME_RE.search(xml)
+        name = match and match.group(1)
+        if name and self._defined_filters.get(name) == xml:
+            return
         # execute in a native thread and block current greenthread until done
         tpool.execute(self._conn.nwfilterDefineXML, xml)
+        if name:
+            self._defined_filters[name] = xml
 
     def unfilter_instance(self, instance, network_info):
         """Clear out the nwfilter rules."""
@@ -302,6 +321,7 @@ class NWFilterFirewall(FirewallDriver):
             nic_id = mapping['mac'].replace(':', '')
             instance_filter_name = self._instance_filter_name(instance, nic_id)
 
+            self._defined_filters.pop(instance_filter_name, None)
             try:
                 self._conn.nwfilterLookupByName(instance_filter_name).\
                                                     undefine()
@@ -312,6 +332,7 @@ class NWFilterFirewall(FirewallDriver):
         instance_secgroup_filter_name =\
             '%s-secgroup' % (self._instance_filter_name(instance))
 
+        self._defined_filters.pop(instance_secgroup_filter_name, None)
         try:
             self._conn.nwfilterLookupByName(instance_secgroup_filter_name)\
                                             .undefine()
@@ -503,6 +524,29 @@ class NWFilterFirewall(FirewallDriver):
         return True
 
 
+class SecurityGroupCache(object):
+    """Security groups of a set of instances.
+
+    The groups, their rules and the addresses of the groups they grant
+    access to are loaded with a few queries up front, so building the
+    rules of many instances doesn't hit the database for each of them.
+
+    """
+
+    def __init__(self, ctxt, instance_ids):
+        self.security_groups = db.security_group_get_by_instances(
+                ctxt, instance_ids)
+        grantee_ids = set()
+        for security_groups in self.security_groups.itervalues():
+            for security_group in security_groups:
+                for rule in security_group['rules']:
+                    if not rule['cidr'] and rule['grantee_group']:
+                        grantee_ids.add(rule['group_id'])
+        self.member_addresses = db.security_group_get_member_addresses(
+                ctxt, list(grantee_ids))
+        self.ipsets = set()
+
+
 class IptablesFirewallDriver(FirewallDriver):
     def __init__(self, execute=None, **kwargs):
         from nova.network import linux_net
@@ -511,6 +555,12 @@ class IptablesFirewallDriver(FirewallDriver):
         self.network_infos = {}
         self.nwfilter = NWFilterFirewall(kwargs['get_connection'])
         self.basicly_filtered = False
+        if execute:
+            self.execute = execute
+        else:
+            self.execute = utils.execute
+        # Set while all instance rules are rebuilt
+        self.security_group_cache = None
 
         self.iptables.ipv4['filter'].add_chain('sg-fallback')
         self.iptables.ipv4['filter'].add_rule('sg-fallback', '-j DROP')
@@ -638,15 +688,13 @@ class IptablesFirewallDriver(FirewallDriver):
                 for cidrv6 in cidrv6s:
                     ipv6_rules.append('-s %s -j ACCEPT' % (cidrv6,))
 
-        security_groups = db.security_group_get_by_instance(ctxt,
-                                                            instance['id'])
+        cache = self.security_group_cache
+        if cache is None or instance['id'] not in cache.security_groups:
+            cache = SecurityGroupCache(ctxt, [instance['id']])
 
         # then, security group chains and rules
-        for security_group in security_groups:
-            rules = db.security_group_rule_get_by_security_group(ctxt,
-                                                          security_group['id'])
-
-            for rule in rules:
+        for security_group in cache.security_groups[instance['id']]:
+            for rule in security_group['rules']:
                 LOG.debug(_('Adding security group rule: %r'), rule)
 
                 if not rule.cidr:
@@ -699,11 +747,16 @@ class IptablesFirewallDriver(FirewallDriver):
                     fw_rules += [' '.join(args)]
                 else:
                     if rule['grantee_group']:
-                        for instance in rule['grantee_group']['instances']:
-                            LOG.info('instance: %r', instance)
-                            ips = db.instance_get_fixed_addresses(ctxt,
-                                                                instance['id'])
-                            LOG.info('ips: %r', ips)
+                        ips = cache.member_addresses[rule['group_id']]
+                        LOG.info('ips: %r', ips)
+                        if (FLAGS.iptables_use_ipset and
+                            len(ips) >= FLAGS.iptables_ipset_min_members):
+                            ipset = self._sync_ipset(cache, rule['group_id'],
+                                                     ips)
+                            subrule = args + ['-m set --match-set %s src' %
+                                              ipset]
+                            fw_rules += [' '.join(subrule)]
+                        else:
                             for ip in ips:
                                 subrule = args + ['-s %s' % ip]
                                 fw_rules += [' '.join(subrule)]
@@ -714,6 +767,23 @@ class IptablesFirewallDriver(FirewallDriver):
 
         return ipv4_rules, ipv6_rules
 
+    def _sync_ipset(self, cache, security_group_id, ips):
+        """Make the ipset of a security group hold ips, once per cache."""
+        name = 'nova-sg-%s' % (security_group_id,)
+        if name not in cache.ipsets:
+            new_name = '%s-new' % (name,)
+            lines = ['create %s hash:ip -exist' % (name,),
+                     'create %s hash:ip -exist' % (new_name,),
+                     'flush %s' % (new_name,)]
+            lines += ['add %s %s' % (new_name, ip) for ip in ips]
+            lines += ['swap %s %s' % (new_name, name),
+                      'destroy %s' % (new_name,),
+                      '']
+            self.execute('ipset', 'restore', run_as_root=True,
+                         process_input='\n'.join(lines))
+            cache.ipsets.add(name)
+        return name
+
     def instance_filter_exists(self, instance, network_info):
         """Check nova-instance-instance-xxx exists"""
         return self.nwfilter.instance_filter_exists(instance, network_info)
@@ -728,9 +798,14 @@ class IptablesFirewallDriver(FirewallDriver):
 
     @utils.synchronized('iptables', external=True)
     def do_refresh_security_group_rules(self, security_group):
-        for instance in self.instances.values():
-            self.remove_filters_for_instance(instance)
-            self.add_filters_for_instance(instance)
+        self.security_group_cache = SecurityGroupCache(
+                context.get_admin_context(), self.instances.keys())
+        try:
+            for instance in self.instances.values():
+                self.remove_filters_for_instance(instance)
+                self.add_filters_for_instance(instance)
+        finally:
+            self.security_group_cache = None
 
     def refresh_provider_fw_rules(self):
         """See class:FirewallDriver: docs."""
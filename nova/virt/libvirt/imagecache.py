@@ -0,0 +1,157 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Management of the base images kept in instances_path/_base.
+
+Base images are shared by all nova-compute processes using the same
+instances_path, so every change to one of them happens under an external
+lock named after the base image.  The modification time of a base image
+is bumped whenever an instance disk is made from it, which is what the
+least recently used eviction in :func:`evict` goes by.
+
+"""
+
+import os
+
+from nova import flags
+from nova import log as logging
+from nova import utils
+
+
+LOG = logging.getLogger('nova.virt.libvirt.imagecache')
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('image_cache_max_size_gb', 0,
+                     'Base images that are not in use by an instance are '
+                     'removed, least recently used first, while _base is '
+                     'larger than this. 0 means no limit.')
+
+
+def base_dir():
+    """Returns the directory base images are kept in."""
+    return os.path.join(FLAGS.instances_path, '_base')
+
+
+def cache(fn, target, fname, cow=False, *args, **kwargs):
+    """Makes target from the base image fname, creating it with fn first.
+
+    fn is called with a target kwarg naming the file it should write, and
+    the remaining args.  The file is only moved into place once fn returns,
+    so a failed fn never leaves a partial base image behind.  If target is
+    None only the base image is made.
+
+    If cow is True target is a qcow2 image backed by the base image,
+    otherwise it is a copy.
+
+    """
+    if target is not None and os.path.exists(target):
+        return
+    directory = base_dir()
+    if not os.path.exists(directory):
+        utils.execute('mkdir', '-p', directory)
+    base = os.path.join(directory, fname)
+
+    @utils.synchronized(fname, external=True)
+    def make_from_base():
+        if not os.path.exists(base):
+            partial = base + '.part'
+            try:
+                fn(target=partial, *args, **kwargs)
+                os.rename(partial, base)
+            except Exception:
+                if os.path.exists(partial):
+                    os.unlink(partial)
+                raise
+
+        os.utime(base, None)
+        if target is None:
+            return
+        if cow:
+            utils.execute('qemu-img', 'create', '-f', 'qcow2', '-o',
+                          'cluster_size=2M,backing_file=%s' % base,
+                          target)
+        else:
+            utils.execute('cp', '--reflink=auto', '--sparse=always',
+                          base, target)
+
+    make_from_base()
+
+
+def backing_file(path):
+    """Returns the backing file of the image at path, or None."""
+    out, err = utils.execute('qemu-img', 'info', path)
+    for line in out.splitlines():
+        if line.startswith('backing file:'):
+            return line.split(':', 1)[1].split()[0]
+    return None
+
+
+def evict(in_use):
+    """Removes base images until _base fits in image_cache_max_size_gb.
+
+    Base images whose paths are in in_use are never removed.  Of the
+    others, those least recently used go first.
+
+    """
+    if not FLAGS.image_cache_max_size_gb:
+        return
+    directory = base_dir()
+    if not os.path.exists(directory):
+        return
+
+    limit = FLAGS.image_cache_max_size_gb * 1024 * 1024 * 1024
+    total = 0
+    candidates = []
+    for fname in os.listdir(directory):
+        path = os.path.join(directory, fname)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        total += stat.st_size
+        if path in in_use or fname.endswith(('.part', '.download')):
+            continue
+        candidates.append((stat.st_mtime, fname, stat.st_size))
+
+    candidates.sort()
+    for mtime, fname, size in candidates:
+        if total <= limit:
+            break
+        if _remove_unused(fname, mtime):
+            total -= size
+
+    if total > limit:
+        LOG.warn(_('Base images use %(total)d bytes, more than the '
+                   '%(limit)d allowed, but the rest are in use'), locals())
+
+
+def _remove_unused(fname, mtime):
+    """Removes base image fname unless it was used after mtime."""
+    path = os.path.join(base_dir(), fname)
+
+    @utils.synchronized(fname, external=True)
+    def remove():
+        try:
+            if os.stat(path).st_mtime != mtime:
+                return False
+            LOG.info(_('Removing unused base image %s'), path)
+            os.unlink(path)
+        except OSError:
+            return False
+        return True
+
+    return remove()
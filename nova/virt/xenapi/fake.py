@@ -51,6 +51,8 @@ A fake XenAPI SDK.
 """
 
 
+import copy
+import itertools
 import random
 import uuid
 
@@ -66,6 +68,10 @@ _CLASSES = ['host', 'network', 'session', 'SR', 'VBD',
 
 _db_content = {}
 
+# Copies of the tables taken when each event.from token was handed out
+_event_snapshots = {}
+_event_tokens = itertools.count(1)
+
 LOG = logging.getLogger("nova.virt.xenapi.fake")
 
 
@@ -78,6 +84,7 @@ def log_db_contents(msg=None):
 def reset():
     for c in _CLASSES:
         _db_content[c] = {}
+    _event_snapshots.clear()
     create_host('fake')
     create_vm('fake',
               'Running',
@@ -381,6 +388,39 @@ class SessionBase(object):
     def network_get_all_records_where(self, _1, filter):
         return self.xenapi.network.get_all_records()
 
+    def event_from(self, _1, classes, token, timeout):
+        """Returns the changes to classes since token was handed out.
+
+        Records are compared with copies taken when token was handed out,
+        so changes made to _db_content directly show up as events too.
+        The fake never waits for events to happen.
+
+        """
+        classes = [cls.lower() for cls in classes]
+        tables = [table for table in _CLASSES if table.lower() in classes]
+        before = _event_snapshots.pop(token, {})
+        now = dict((table, copy.deepcopy(_db_content[table]))
+                   for table in tables)
+        events = []
+        for table in tables:
+            old_recs = before.get(table, {})
+            for ref, rec in now[table].iteritems():
+                if ref not in old_recs:
+                    operation = 'add'
+                elif old_recs[ref] != rec:
+                    operation = 'mod'
+                else:
+                    continue
+                events.append({'class': table.lower(), 'ref': ref,
+                               'operation': operation, 'snapshot': rec})
+            for ref, rec in old_recs.iteritems():
+                if ref not in now[table]:
+                    events.append({'class': table.lower(), 'ref': ref,
+                                   'operation': 'del', 'snapshot': rec})
+        token = str(_event_tokens.next())
+        _event_snapshots[token] = now
+        return {'events': events, 'valid_ref_counts': {}, 'token': token}
+
     def xenapi_request(self, methodname, params):
         if methodname.startswith('login'):
             self._login(methodname, params)
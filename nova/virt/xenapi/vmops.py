@@ -86,11 +86,8 @@ class VMOps(object):
 
     def list_instances(self):
         """List VM instances."""
-        # TODO(justinsb): Should we just always use the details method?
-        #  Seems to be the same number of API calls..
         vm_refs = []
-        for vm_ref in self._session.get_xenapi().VM.get_all():
-            vm_rec = self._session.get_xenapi().VM.get_record(vm_ref)
+        for vm_rec in self._session.get_all_vm_records().itervalues():
             if not vm_rec["is_a_template"] and not vm_rec["is_control_domain"]:
                 vm_refs.append(vm_rec["name_label"])
         return vm_refs
@@ -98,8 +95,7 @@ class VMOps(object):
     def list_instances_detail(self):
         """List VM instances, returning InstanceInfo objects."""
         instance_infos = []
-        for vm_ref in self._session.get_xenapi().VM.get_all():
-            vm_rec = self._session.get_xenapi().VM.get_record(vm_ref)
+        for vm_rec in self._session.get_all_vm_records().itervalues():
             if not vm_rec["is_a_template"] and not vm_rec["is_control_domain"]:
                 name = vm_rec["name_label"]
 
@@ -1135,18 +1131,19 @@ class VMOps(object):
             vm_ref = VMHelper.lookup(self._session, instance.name)
         logging.debug(_("injecting network info to xs for vm: |%s|"), vm_ref)
 
+        calls = []
         for (network, info) in network_info:
             location = 'vm-data/networking/%s' % info['mac'].replace(':', '')
             self.write_to_param_xenstore(vm_ref, {location: info})
-            try:
-                # TODO(tr3buchet): fix function call after refactor
-                #self.write_to_xenstore(vm_ref, location, info)
-                self._make_plugin_call('xenstore.py', 'write_record', instance,
-                                       location, {'value': json.dumps(info)},
-                                       vm_ref)
-            except KeyError:
-                # catch KeyError for domid if instance isn't running
-                pass
+            calls.append({'method': 'write_record', 'path': location,
+                          'value': json.dumps(info)})
+        if not calls:
+            return
+        try:
+            self._make_xenstore_batch_call(instance, calls, vm_ref)
+        except KeyError:
+            # catch KeyError for domid if instance isn't running
+            pass
 
     def create_vifs(self, vm_ref, instance, network_info):
         """Creates vifs for an instance."""
@@ -1239,6 +1236,31 @@ class VMOps(object):
         return self._make_plugin_call('xenstore.py', method=method, vm=vm,
                 path=path, addl_args=addl_args)
 
+    def _make_xenstore_batch_call(self, vm, calls, vm_ref=None):
+        """Makes several calls to the xenstore xenapi plugin in one plugin
+        invocation. Each call is a dict with the name of the plugin method
+        as 'method', a 'path' and any other args of that method. Returns
+        the list of results.
+
+        If the batch fails, for instance because dom0 still has a plugin
+        without batch, the calls are made one at a time instead.
+        """
+        ret = self._make_plugin_call('xenstore.py', 'batch', vm, '',
+                {'calls': json.dumps(calls)}, vm_ref)
+        if not isinstance(ret, dict):
+            return json.loads(ret)
+
+        LOG.warn(_('The xenstore batch call failed, making its %d calls '
+                   'one at a time'), len(calls))
+        results = []
+        for call in calls:
+            args = dict(call)
+            method = args.pop('method')
+            path = args.pop('path')
+            results.append(self._make_plugin_call('xenstore.py', method, vm,
+                                                  path, args, vm_ref))
+        return results
+
     def _make_agent_call(self, method, vm, path, addl_args=None):
         """Abstracts out the interaction with the agent xenapi plugin."""
         ret = self._make_plugin_call('agent', method=method, vm=vm,
@@ -1315,12 +1337,15 @@ class VMOps(object):
         else:
             keys = key_or_keys
         keys.sort(lambda x, y: cmp(y.count('/'), x.count('/')))
+        calls = []
         for key in keys:
             if path:
                 keypath = "%s/%s" % (path, key)
             else:
                 keypath = key
-            self._make_xenstore_call('delete_record', vm, keypath)
+            calls.append({'method': 'delete_record', 'path': keypath})
+        if calls:
+            self._make_xenstore_batch_call(vm, calls)
 
     ########################################################################
     ###### The following methods interact with the xenstore parameter
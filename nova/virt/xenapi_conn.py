@@ -22,12 +22,19 @@ The concurrency model for this class is as follows:
 
 All XenAPI calls are on a green thread (using eventlet's "tpool"
 thread pool). They are remote calls, and so may hang for the usual
-reasons.
+reasons.  Calls made through XenAPISession.call_xenapi and friends each
+check out a session of their own from a pool, so a slow call does not
+hold up unrelated ones.
 
 All long-running XenAPI calls (VM.start, VM.reboot, etc) are called async
 (using XenAPI.VM.async_start etc). These return a task, which can then be
 polled for completion.
 
+When xenapi_use_events is set, the records of VMs and tasks are kept in an
+EventCache that is brought up to date with event.from. Listing instances
+is then answered from the cache and task waiters wake on the event that
+finishes their task, instead of every caller polling XenAPI itself.
+
 This combination of techniques means that we don't block the main thread at
 all, and at the same time we don't hold lots of threads waiting for
 long-running operations.
@@ -45,6 +52,10 @@ reactor thread if the VM.get_by_name_label or VM.get_record calls block.
 :xenapi_task_poll_interval:  The interval (seconds) used for polling of
                              remote tasks (Async.VM.start, etc)
                              (default: 0.5).
+:xenapi_connection_concurrent:  The most XenAPI sessions used for calls
+                             in parallel (default: 5).
+:xenapi_use_events:          Track VMs and tasks with XenAPI events instead
+                             of polling (default: True).
 :target_host:                the iSCSI Target Host IP address, i.e. the IP
                              address for the nova-volume host
 :target_port:                iSCSI Target Port, 3260 Default
@@ -57,6 +68,7 @@ reactor thread if the VM.get_by_name_label or VM.get_record calls block.
 - suffix "_rec" for record objects
 """
 
+import contextlib
 import json
 import random
 import sys
@@ -64,6 +76,7 @@ import urlparse
 import xmlrpclib
 
 from eventlet import event
+from eventlet import pools
 from eventlet import tpool
 from eventlet import timeout
 
@@ -138,6 +151,22 @@ flags.DEFINE_string('xenapi_remap_vbd_dev_prefix', 'sd',
 flags.DEFINE_integer('xenapi_login_timeout',
                      10,
                      'Timeout in seconds for XenAPI login.')
+flags.DEFINE_integer('xenapi_connection_concurrent',
+                     5,
+                     'Maximum number of logged in XenAPI sessions used for '
+                     'calls in parallel. Used only if '
+                     'connection_type=xenapi.')
+flags.DEFINE_bool('xenapi_use_events',
+                  True,
+                  'Keep VM and task records up to date from XenAPI events '
+                  '(event.from) instead of fetching every VM record on each '
+                  'listing and polling tasks. Falls back to polling on hosts '
+                  'without event.from. Used only if connection_type=xenapi.')
+flags.DEFINE_float('xenapi_event_timeout',
+                   30.0,
+                   'The longest a call to event.from waits for an event '
+                   'while a task is outstanding. Used only if '
+                   'connection_type=xenapi.')
 
 
 def get_connection(_):
@@ -359,11 +388,38 @@ class XenAPISession(object):
 
     def __init__(self, url, user, pw):
         self.XenAPI = self.get_imported_xenapi()
+        self._url = url
+        self._user = user
+        self._pw = pw
         self._session = self._create_session(url)
+        self._login(self._session)
+        self._pool = _SessionPool(self)
+        self._host_ref = None
+        self._event_cache = None
+        if FLAGS.xenapi_use_events:
+            self._event_cache = EventCache(self)
+
+    def _login(self, session):
         exception = self.XenAPI.Failure(_("Unable to log in to XenAPI "
                             "(is the Dom0 disk full?)"))
         with timeout.Timeout(FLAGS.xenapi_login_timeout, exception):
-            self._session.login_with_password(user, pw)
+            session.login_with_password(self._user, self._pw)
+
+    def create_logged_in_session(self):
+        """Returns a new, logged in session of its own, for callers that
+        must not wait on or hold up the shared one."""
+        session = self._create_session(self._url)
+        self._login(session)
+        return session
+
+    @contextlib.contextmanager
+    def _get_session(self):
+        """Checks out a session from the pool for the duration of a call."""
+        session = self._pool.get()
+        try:
+            yield session
+        finally:
+            self._pool.put(session)
 
     def get_imported_xenapi(self):
         """Stubout point. This can be replaced with a mock xenapi module."""
@@ -375,33 +431,57 @@ class XenAPISession(object):
 
     def get_xenapi_host(self):
         """Return the xenapi host"""
-        return self._session.xenapi.session.get_this_host(self._session.handle)
+        if self._host_ref is None:
+            self._host_ref = self._session.xenapi.session.get_this_host(
+                    self._session.handle)
+        return self._host_ref
 
     def call_xenapi(self, method, *args):
         """Call the specified XenAPI method on a background thread."""
-        f = self._session.xenapi
-        for m in method.split('.'):
-            f = f.__getattr__(m)
-        return tpool.execute(f, *args)
+        with self._get_session() as session:
+            f = session.xenapi
+            for m in method.split('.'):
+                f = f.__getattr__(m)
+            return tpool.execute(f, *args)
 
     def call_xenapi_request(self, method, *args):
         """Some interactions with dom0, such as interacting with xenstore's
         param record, require using the xenapi_request method of the session
         object. This wraps that call on a background thread.
         """
-        f = self._session.xenapi_request
-        return tpool.execute(f, method, *args)
+        with self._get_session() as session:
+            return tpool.execute(session.xenapi_request, method, *args)
 
     def async_call_plugin(self, plugin, fn, args):
         """Call Async.host.call_plugin on a background thread."""
-        return tpool.execute(self._unwrap_plugin_exceptions,
-                             self._session.xenapi.Async.host.call_plugin,
-                             self.get_xenapi_host(), plugin, fn, args)
+        host_ref = self.get_xenapi_host()
+        with self._get_session() as session:
+            return tpool.execute(self._unwrap_plugin_exceptions,
+                                 session.xenapi.Async.host.call_plugin,
+                                 host_ref, plugin, fn, args)
+
+    def get_all_vm_records(self):
+        """Returns the records of all VMs by ref, from the event cache if
+        it is in use."""
+        if self._event_cache is not None:
+            vm_recs = self._event_cache.get_records('vm')
+            if vm_recs is not None:
+                return vm_recs
+        return self.call_xenapi('VM.get_all_records')
 
     def wait_for_task(self, task, id=None):
         """Return the result of the given task. The task is polled
-        until it completes."""
+        until it completes, unless the event cache can tell when it
+        completes."""
         done = event.Event()
+        if self._event_cache is not None:
+            task_rec = self._event_cache.wait_for_task(task)
+            if task_rec is not None:
+                self._task_done(done, task, id, task_rec['name_label'],
+                                task_rec['status'], task_rec.get('result'),
+                                task_rec.get('error_info'))
+                return done.wait()
+
         loop = utils.LoopingCall(f=None)
 
         def _poll_task():
@@ -411,27 +491,15 @@ class XenAPISession(object):
             try:
                 name = self._session.xenapi.task.get_name_label(task)
                 status = self._session.xenapi.task.get_status(task)
-                # Ensure action is never > 255
-                action = dict(action=name[:255], error=None)
-                if id:
-                    action["instance_id"] = int(id)
                 if status == "pending":
                     return
-                elif status == "success":
+                result = error_info = None
+                if status == "success":
                     result = self._session.xenapi.task.get_result(task)
-                    LOG.info(_("Task [%(name)s] %(task)s status:"
-                            " success    %(result)s") % locals())
-                    done.send(_parse_xmlrpc_value(result))
                 else:
                     error_info = self._session.xenapi.task.get_error_info(task)
-                    action["error"] = str(error_info)
-                    LOG.warn(_("Task [%(name)s] %(task)s status:"
-                            " %(status)s    %(error_info)s") % locals())
-                    done.send_exception(self.XenAPI.Failure(error_info))
-
-                if id:
-                    db.instance_action_create(context.get_admin_context(),
-                            action)
+                self._task_done(done, task, id, name, status, result,
+                                error_info)
             except self.XenAPI.Failure, exc:
                 LOG.warn(exc)
                 done.send_exception(*sys.exc_info())
@@ -441,6 +509,25 @@ class XenAPISession(object):
         loop.start(FLAGS.xenapi_task_poll_interval, now=True)
         return done.wait()
 
+    def _task_done(self, done, task, id, name, status, result, error_info):
+        """Sends the outcome of a finished task to done."""
+        # Ensure action is never > 255
+        action = dict(action=name[:255], error=None)
+        if id:
+            action["instance_id"] = int(id)
+        if status == "success":
+            LOG.info(_("Task [%(name)s] %(task)s status:"
+                    " success    %(result)s") % locals())
+            done.send(_parse_xmlrpc_value(result))
+        else:
+            action["error"] = str(error_info)
+            LOG.warn(_("Task [%(name)s] %(task)s status:"
+                    " %(status)s    %(error_info)s") % locals())
+            done.send_exception(self.XenAPI.Failure(error_info))
+
+        if id:
+            db.instance_action_create(context.get_admin_context(), action)
+
     def _create_session(self, url):
         """Stubout point. This can be replaced with a mock session."""
         return self.XenAPI.Session(url)
@@ -467,6 +554,118 @@ class XenAPISession(object):
             raise
 
 
+class _SessionPool(pools.Pool):
+    """Pool of logged in sessions for one XenAPISession."""
+
+    def __init__(self, xenapi_session):
+        self._xenapi_session = xenapi_session
+        super(_SessionPool, self).__init__(
+                max_size=max(1, FLAGS.xenapi_connection_concurrent))
+
+    def create(self):
+        return self._xenapi_session.create_logged_in_session()
+
+
+class EventCache(object):
+    """Records of VMs and tasks kept up to date from XenAPI events.
+
+    The cache is brought up to date by calling event.from with the token
+    the previous call returned, which answers with what changed since.
+    Only one call is made at a time.  While one is waiting for events
+    nothing has changed yet, so other readers use the cache as it is.
+
+    """
+
+    CLASSES = ['vm', 'task']
+
+    def __init__(self, session):
+        self._session = session
+        self._event_session = None
+        self._token = ''
+        self._records = dict((cls, {}) for cls in self.CLASSES)
+        self._in_flight = None
+        self.supported = True
+
+    def _event_from(self, timeout):
+        if self._event_session is None:
+            self._event_session = self._session.create_logged_in_session()
+        event_from = getattr(self._event_session.xenapi.event, 'from')
+        return tpool.execute(event_from, self.CLASSES, self._token, timeout)
+
+    def refresh(self, timeout=0.0):
+        """Applies the events since the last refresh, waiting up to timeout
+        seconds for one if there are none.
+
+        Returns False if the cache can't be used, because the host does not
+        support event.from or the call failed.
+
+        """
+        if not self.supported:
+            return False
+        if self._in_flight is not None:
+            # NOTE: the cache is only current once a first call returned
+            if timeout or not self._token:
+                self._in_flight.wait()
+            return self.supported and bool(self._token)
+
+        self._in_flight = event.Event()
+        try:
+            result = self._event_from(timeout)
+        except self._session.XenAPI.Failure, exc:
+            if exc.details and exc.details[0] == 'MESSAGE_METHOD_UNKNOWN':
+                LOG.warn(_("XenAPI does not support event.from, "
+                           "polling instead"))
+                self.supported = False
+                return False
+            LOG.warn(_("event.from failed, polling instead: %s"), exc)
+            self._reset()
+            return False
+        except Exception:
+            LOG.exception(_("event.from failed, polling instead"))
+            self._reset()
+            return False
+        finally:
+            in_flight, self._in_flight = self._in_flight, None
+            in_flight.send()
+
+        for ev in result['events']:
+            records = self._records.get(ev['class'].lower())
+            if records is None:
+                continue
+            if ev['operation'] == 'del':
+                records.pop(ev['ref'], None)
+            else:
+                records[ev['ref']] = ev['snapshot']
+        self._token = result['token']
+        return True
+
+    def _reset(self):
+        """Starts over with a new session and no records, as events may
+        have been missed.  The session is made on the next refresh."""
+        self._event_session = None
+        self._token = ''
+        self._records = dict((cls, {}) for cls in self.CLASSES)
+
+    def get_records(self, cls):
+        """Returns the current records of cls by ref, or None if events
+        are not supported."""
+        if not self.refresh():
+            return None
+        return dict(self._records[cls])
+
+    def wait_for_task(self, task):
+        """Returns the record of task once it is no longer pending, or None
+        if events are not supported."""
+        timeout = 0.0
+        while self.refresh(timeout):
+            task_rec = self._records['task'].get(task)
+            if task_rec is not None and task_rec['status'] != 'pending':
+                # NOTE: nova never destroys its tasks, so stop tracking it
+                return self._records['task'].pop(task)
+            timeout = FLAGS.xenapi_event_timeout
+        return None
+
+
 class HostState(object):
     """Manages information about the XenServer host this compute
     node is running on.
@@ -24,6 +24,8 @@ import time
 import os
 from xml.etree import ElementTree
 
+from eventlet import greenthread
+
 from nova import exception
 from nova import flags
 from nova import log as logging
@@ -56,6 +58,24 @@ flags.DEFINE_string('iscsi_ip_prefix', '$my_ip',
                     'discover volumes on the ip that starts with this prefix')
 flags.DEFINE_string('rbd_pool', 'rbd',
                     'the rbd pool in which volumes are stored')
+flags.DEFINE_boolean('volume_wipe_lazy', True,
+                     'Rename deleted volumes out of the way and wipe them in '
+                     'the background instead of before delete returns')
+flags.DEFINE_string('volume_wipe_method', 'zero',
+                    'How deleted volumes are wiped: zero overwrites them '
+                    'with zeroes, discard uses blkdiscard and falls back to '
+                    'zero where it is not supported, none skips the wipe')
+flags.DEFINE_integer('volume_wipe_rate_mb', 0,
+                     'Limit in MB per second for zeroing deleted volumes, '
+                     '0 means no limit')
+flags.DEFINE_string('volume_wipe_ionice', '-c3',
+                    'ionice options the zeroing dd runs with, empty to run '
+                    'it at normal priority')
+
+# Deleted volumes waiting to be wiped are renamed to start with this
+WIPE_PREFIX = 'wipe-'
+# Volumes are zeroed this many MB at a time
+WIPE_CHUNK_MB = 256
 
 
 class VolumeDriver(object):
@@ -66,6 +86,7 @@ class VolumeDriver(object):
         self.db = None
         self._execute = execute
         self._sync_exec = sync_exec
+        self._wiper = None
 
     def _try_execute(self, *command, **kwargs):
         # NOTE(vish): Volume commands can partially fail due to timing, but
@@ -92,6 +113,8 @@ class VolumeDriver(object):
         if not FLAGS.volume_group in volume_groups:
             raise exception.Error(_("volume group %s doesn't exist")
                                   % FLAGS.volume_group)
+        # pick up volumes deleted before a restart
+        self._start_wiper()
 
     def _create_volume(self, volume_name, sizestr):
         self._try_execute('lvcreate', '-L', sizestr, '-n',
@@ -114,12 +137,90 @@ class VolumeDriver(object):
     def _delete_volume(self, volume, size_in_g):
         """Deletes a logical volume."""
         # zero out old volumes to prevent data leaking between users
-        # TODO(ja): reclaiming space should be done lazy and low priority
-        self._copy_volume('/dev/zero', self.local_path(volume), size_in_g)
+        lv_name = self._escape_snapshot(volume['name'])
+        if FLAGS.volume_wipe_lazy:
+            # NOTE(ja): the renamed volume is the queue entry, so volumes
+            #           deleted before a restart are still wiped after it
+            self._try_execute('lvrename', FLAGS.volume_group, lv_name,
+                              WIPE_PREFIX + lv_name, run_as_root=True)
+            self._start_wiper()
+            return
+        self._wipe_volume(self._lv_path(lv_name), int(size_in_g) * 1024)
         self._try_execute('lvremove', '-f', "%s/%s" %
-                          (FLAGS.volume_group,
-                           self._escape_snapshot(volume['name'])),
+                          (FLAGS.volume_group, lv_name),
+                          run_as_root=True)
+
+    def _wipe_volume(self, path, size_in_m):
+        """Clears the data of the volume at path."""
+        if FLAGS.volume_wipe_method == 'none':
+            return
+        if FLAGS.volume_wipe_method == 'discard':
+            try:
+                self._execute('blkdiscard', path, run_as_root=True)
+                return
+            except exception.ProcessExecutionError:
+                LOG.warn(_("Could not discard %s, zeroing it instead"), path)
+
+        ionice = []
+        if FLAGS.volume_wipe_ionice:
+            ionice = ['ionice'] + FLAGS.volume_wipe_ionice.split()
+        for offset in xrange(0, size_in_m, WIPE_CHUNK_MB):
+            count = min(WIPE_CHUNK_MB, size_in_m - offset)
+            started_at = time.time()
+            self._execute(*(ionice + ['dd', 'if=/dev/zero', 'of=%s' % path,
+                                      'bs=1M', 'count=%d' % count,
+                                      'seek=%d' % offset, 'oflag=direct']),
                           run_as_root=True)
+            if FLAGS.volume_wipe_rate_mb:
+                wait = (float(count) / FLAGS.volume_wipe_rate_mb -
+                        (time.time() - started_at))
+                if wait > 0:
+                    greenthread.sleep(wait)
+
+    def _get_pending_wipes(self):
+        """Returns (name, size in MB) of each volume waiting to be wiped."""
+        out, err = self._execute('lvs', '--noheadings', '--nosuffix',
+                                 '--units', 'm', '-o', 'lv_name,lv_size',
+                                 FLAGS.volume_group, run_as_root=True)
+        pending = []
+        for line in (out or '').splitlines():
+            fields = line.split()
+            if len(fields) != 2 or not fields[0].startswith(WIPE_PREFIX):
+                continue
+            try:
+                pending.append((fields[0], int(float(fields[1]))))
+            except ValueError:
+                continue
+        return pending
+
+    def _start_wiper(self):
+        """Starts wiping deleted volumes unless that is already going on."""
+        if self._wiper is None:
+            self._wiper = greenthread.spawn(self._wipe_pending_volumes)
+
+    def _wipe_pending_volumes(self):
+        """Wipes and removes deleted volumes until there are none left.
+
+        A volume that fails to wipe stops the run; it is picked up again
+        the next time the worker is started.
+
+        """
+        try:
+            while True:
+                pending = self._get_pending_wipes()
+                if not pending:
+                    return
+                lv_name, size_in_m = pending[0]
+                LOG.info(_("Wiping deleted volume %(lv_name)s, "
+                           "%(size_in_m)d MB"), locals())
+                self._wipe_volume(self._lv_path(lv_name), size_in_m)
+                self._try_execute('lvremove', '-f', "%s/%s" %
+                                  (FLAGS.volume_group, lv_name),
+                                  run_as_root=True)
+        except Exception:
+            LOG.exception(_("Error wiping deleted volumes"))
+        finally:
+            self._wiper = None
 
     def _sizestr(self, size_in_g):
         if int(size_in_g) == 0:
@@ -184,9 +285,12 @@ class VolumeDriver(object):
         self._delete_volume(snapshot, snapshot['volume_size'])
 
     def local_path(self, volume):
+        return self._lv_path(self._escape_snapshot(volume['name']))
+
+    def _lv_path(self, lv_name):
         # NOTE(vish): stops deprecation warning
         escaped_group = FLAGS.volume_group.replace('-', '--')
-        escaped_name = self._escape_snapshot(volume['name']).replace('-', '--')
+        escaped_name = lv_name.replace('-', '--')
         return "/dev/mapper/%s-%s" % (escaped_group, escaped_name)
 
     def ensure_export(self, context, volume):
@@ -216,8 +320,27 @@ class VolumeDriver(object):
 
     def get_volume_stats(self, refresh=False):
         """Return the current state of the volume service. If 'refresh' is
-           True, run the update first."""
-        return None
+           True, run the update first.
+
+        Space held by deleted volumes that are still being wiped is not
+        free yet, so it is reported separately as reclaim_pending_gb.
+
+        """
+        out, err = self._execute('vgs', '--noheadings', '--nosuffix',
+                                 '--units', 'g', '-o', 'vg_size,vg_free',
+                                 FLAGS.volume_group, run_as_root=True)
+        fields = (out or '').split()
+        if len(fields) != 2:
+            return None
+        pending = self._get_pending_wipes()
+        if pending:
+            self._start_wiper()
+        return {'volume_group': FLAGS.volume_group,
+                'total_gb': float(fields[0]),
+                'free_gb': float(fields[1]),
+                'reclaim_pending_gb': sum(size for name, size in pending) /
+                                      1024.0,
+                'reclaim_pending_count': len(pending)}
 
 
 class AOEDriver(VolumeDriver):
@@ -683,6 +806,10 @@ class RBDDriver(VolumeDriver):
         """Undiscover volume on a remote host"""
         pass
 
+    def get_volume_stats(self, refresh=False):
+        """RBD volumes are not kept in an LVM volume group."""
+        return None
+
 
 class SheepdogDriver(VolumeDriver):
     """Executes commands relating to Sheepdog Volumes"""
@@ -746,6 +873,10 @@ class SheepdogDriver(VolumeDriver):
         """Undiscover volume on a remote host"""
         pass
 
+    def get_volume_stats(self, refresh=False):
+        """Sheepdog volumes are not kept in an LVM volume group."""
+        return None
+
 
 class LoggingVolumeDriver(VolumeDriver):
     """Logs and records calls, for unit tests."""
@@ -781,6 +912,9 @@ class LoggingVolumeDriver(VolumeDriver):
     def check_for_export(self, context, volume_id):
         self.log_action('check_for_export', volume_id)
 
+    def get_volume_stats(self, refresh=False):
+        return None
+
     _LOGS = []
 
     @staticmethod
@@ -50,6 +50,7 @@ from nova import log as logging
 from nova import manager
 from nova import rpc
 from nova import utils
+from nova.scheduler import api as scheduler_api
 from nova.volume import volume_types
 
 
@@ -187,6 +188,8 @@ class VolumeManager(manager.SchedulerDependentManager):
             raise
 
         self.db.volume_destroy(context, volume_id)
+        scheduler_api.release_resources(context, 'volume', self.host,
+                                        volume_ref['size'])
         LOG.debug(_("volume %s: deleted successfully"), volume_ref['name'])
         return True
 
@@ -116,6 +116,10 @@ class SanISCSIDriver(ISCSIDriver):
         if not (FLAGS.san_ip):
             raise exception.Error(_("san_ip must be set"))
 
+    def get_volume_stats(self, refresh=False):
+        """SAN volumes are not kept in a local LVM volume group."""
+        return None
+
 
 def _collect_lines(data):
     """ Split lines from data into an array, trimming them """
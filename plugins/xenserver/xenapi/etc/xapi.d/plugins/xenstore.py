@@ -135,6 +135,25 @@ def delete_record(self, arg_dict):
     return result
 
 
+def batch(self, arg_dict):
+    """Runs several of the calls above for the given dom_id in one plugin
+    invocation. arg_dict must have a 'calls' key whose value is a json list
+    of dicts, each with the name of the call as 'method' and that call's
+    arguments other than dom_id. The results are returned in order as a
+    json list.
+    """
+    methods = {"read_record": read_record,
+               "write_record": write_record,
+               "list_records": list_records,
+               "delete_record": delete_record}
+    results = []
+    for call in json.loads(arg_dict["calls"]):
+        method = methods[call.pop("method")]
+        call["dom_id"] = arg_dict["dom_id"]
+        results.append(json.loads(method(self, call)))
+    return json.dumps(results)
+
+
 def _paths_from_ls(recs):
     """The xenstore-ls command returns a listing that isn't terribly
     useful. This method cleans that up into a dict with each path
@@ -188,4 +207,5 @@ if __name__ == "__main__":
         {"read_record": read_record,
         "write_record": write_record,
         "list_records": list_records,
-        "delete_record": delete_record})
+        "delete_record": delete_record,
+        "batch": batch})
@@ -127,6 +127,7 @@ setup(name='nova',
                'bin/nova-manage',
                'bin/nova-network',
                'bin/nova-objectstore',
+               'bin/nova-rootwrap-daemon',
                'bin/nova-scheduler',
                'bin/nova-spoolsentry',
                'bin/stack',
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compare running commands as root with one root_helper per command against
+running them through nova-rootwrap-daemon.
+
+    tools/execute_benchmark.py --count=500 --root_helper=sudo
+"""
+
+import gettext
+import os
+import sys
+import time
+
+import eventlet
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova import flags
+from nova import utils
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('count', 200, 'Number of commands to run per test')
+flags.DEFINE_integer('concurrency', 1,
+                     'Number of green threads running commands at once')
+flags.DEFINE_string('command', 'true', 'Command to run')
+
+
+def run(use_daemon):
+    FLAGS.use_rootwrap_daemon = use_daemon
+    pool = eventlet.GreenPool(FLAGS.concurrency)
+    start = time.time()
+    for _ in pool.imap(lambda i: utils.execute(FLAGS.command,
+                                               run_as_root=True),
+                       xrange(FLAGS.count)):
+        pass
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    FLAGS(sys.argv)
+    if FLAGS.rootwrap_daemon_command == 'nova-rootwrap-daemon':
+        FLAGS.rootwrap_daemon_command = '%s %s' % (
+                sys.executable,
+                os.path.join(possible_topdir, 'bin', 'nova-rootwrap-daemon'))
+    # Start the daemon before timing anything.
+    FLAGS.use_rootwrap_daemon = True
+    utils.execute('true', run_as_root=True)
+
+    for name, use_daemon in (('root_helper per command', False),
+                             ('root helper daemon', True)):
+        elapsed = run(use_daemon)
+        print '%-24s %8.3fs %8.2fms/command' % (
+                name, elapsed, elapsed * 1000 / FLAGS.count)
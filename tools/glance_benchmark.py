@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure how many GlanceImageService.show and detail calls per second nova
+makes against a local stub glance server, with a new client per request,
+with pooled keep-alive clients, and with the show cache on top.
+
+    tools/glance_benchmark.py --count=2000
+"""
+
+import gettext
+import json
+import os
+import sys
+import time
+
+import eventlet
+eventlet.monkey_patch()
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from eventlet import wsgi
+
+from nova import context
+from nova import flags
+from nova.image import glance
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('count', 1000, 'Number of requests to make per test')
+flags.DEFINE_integer('images', 20, 'Number of images the stub server has')
+
+
+class NullLog(object):
+    def write(self, *args):
+        pass
+
+
+def stub_glance(environ, start_response):
+    """Answers image metadata and detail requests like glance does."""
+    path = environ['PATH_INFO']
+    if path.startswith('/v1'):
+        path = path[3:]
+    if path.startswith('/images/detail'):
+        images = [{'id': i, 'name': 'image%d' % i, 'is_public': True,
+                   'properties': {}, 'status': 'active'}
+                  for i in xrange(1, FLAGS.images + 1)]
+        if 'marker' in environ.get('QUERY_STRING', ''):
+            images = []
+        body = json.dumps({'images': images})
+        start_response('200 OK', [('Content-Type', 'application/json'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+    image_id = path.rsplit('/', 1)[-1]
+    start_response('200 OK', [('x-image-meta-id', image_id),
+                              ('x-image-meta-name', 'image%s' % image_id),
+                              ('x-image-meta-is_public', 'True'),
+                              ('x-image-meta-status', 'active'),
+                              ('Content-Length', '0')])
+    return ['']
+
+
+def run(method, pool_size, cache_ttl):
+    FLAGS.glance_client_pool_size = pool_size
+    FLAGS.glance_show_cache_ttl = cache_ttl
+    glance._client_pools.clear()
+    glance._show_cache.clear()
+    ctxt = context.get_admin_context()
+    service = glance.GlanceImageService()
+    start = time.time()
+    for i in xrange(FLAGS.count):
+        if method == 'show':
+            service.show(ctxt, i % FLAGS.images + 1)
+        else:
+            service.detail(ctxt)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    FLAGS(sys.argv)
+    sock = eventlet.listen(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    eventlet.spawn_n(wsgi.server, sock, stub_glance, log=NullLog())
+    FLAGS.glance_api_servers = ['127.0.0.1:%d' % port]
+
+    for method in ('show', 'detail'):
+        for name, pool_size, cache_ttl in (('new client', 0, 0),
+                                           ('pooled', 8, 0),
+                                           ('pooled+cache', 8, 60)):
+            if method == 'detail' and cache_ttl:
+                continue
+            elapsed = run(method, pool_size, cache_ttl)
+            print '%-7s %-13s %8.3fs %10.1f calls/sec' % (
+                    method, name, elapsed, FLAGS.count / elapsed)
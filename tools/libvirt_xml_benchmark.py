@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure how many libvirt domain XML documents per second nova renders,
+parsing the Cheetah template for every instance as it used to and with
+the template compiled once.
+
+    tools/libvirt_xml_benchmark.py --count=2000 --nics=4
+"""
+
+import gettext
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova import flags
+from nova.virt.libvirt import connection
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('count', 1000, 'Number of documents to render per test')
+flags.DEFINE_integer('nics', 2, 'Number of nics each instance has')
+
+
+def xml_info():
+    """Returns a search list like the one _prepare_xml_info builds."""
+    basepath = os.path.join(FLAGS.instances_path, 'instance-00000001')
+    nics = [{'id': 'fa163e00000%d' % i,
+             'bridge_name': 'br100',
+             'mac_address': 'fa:16:3e:00:00:0%d' % i,
+             'ip_address': '10.0.0.%d' % (i + 2),
+             'dhcp_server': '10.0.0.1',
+             'extra_params': '\n'}
+            for i in xrange(FLAGS.nics)]
+    return {'type': 'kvm',
+            'name': 'instance-00000001',
+            'basepath': basepath,
+            'memory_kb': 2048 * 1024,
+            'vcpus': 1,
+            'rescue': False,
+            'disk_prefix': 'vd',
+            'driver_type': 'qcow2',
+            'vif_type': 'ethernet',
+            'nics': nics,
+            'ebs_root': False,
+            'local_device': 'vdb',
+            'volumes': [],
+            'use_virtio_for_bridges': True,
+            'ephemerals': [],
+            'root_device': 'vda',
+            'disk': basepath + '/disk',
+            'kernel': basepath + '/kernel',
+            'ramdisk': basepath + '/ramdisk'}
+
+
+def run(compiled):
+    connection._late_load_cheetah()
+    source = open(FLAGS.libvirt_xml_template).read()
+    search_list = [xml_info()]
+    start = time.time()
+    for i in xrange(FLAGS.count):
+        if compiled:
+            template = connection._get_template(FLAGS.libvirt_xml_template)
+            str(template(searchList=search_list))
+        else:
+            str(connection.Template(source, searchList=search_list))
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    FLAGS(sys.argv)
+    for name, compiled in (('parsed', False), ('compiled', True)):
+        elapsed = run(compiled)
+        print '%-9s %8.3fs %10.1f documents/sec' % (
+                name, elapsed, FLAGS.count / elapsed)
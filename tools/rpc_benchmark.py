@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure how many rpc casts per second nova.rpc.impl_kombu can pack, send,
+receive and unpack through the kombu memory transport, with the compact
+and legacy envelopes and each available serializer.
+
+    tools/rpc_benchmark.py --count=5000
+"""
+
+import datetime
+import gettext
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import flags
+from nova.rpc import impl_kombu
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('count', 2000, 'Number of messages to send per test')
+
+
+def run(compact, serializer):
+    FLAGS.rpc_compact_envelope = compact
+    FLAGS.rpc_serializer = serializer
+    ctxt = context.get_admin_context()
+    msg = {'method': 'update_service_capabilities',
+           'args': {'service_name': 'compute',
+                    'host': 'host1',
+                    'capabilities': {'host_memory_free': 1024 * 1024 * 1024,
+                                     'disk_available': 1024 * 1024 * 1024,
+                                     'vcpus_used': 4,
+                                     'timestamp': datetime.datetime.now()}}}
+    received = []
+
+    def callback(message_data):
+        impl_kombu._unpack_context(message_data)
+        received.append(message_data)
+
+    conn = impl_kombu.create_connection()
+    conn.declare_topic_consumer('rpc_benchmark', callback)
+    sender = impl_kombu.create_connection()
+    start = time.time()
+    for i in xrange(FLAGS.count):
+        body = msg.copy()
+        impl_kombu._pack_context(body, ctxt)
+        sender.topic_send('rpc_benchmark', body)
+    conn.consume(limit=FLAGS.count)
+    elapsed = time.time() - start
+    sender.close()
+    conn.close()
+    return elapsed
+
+
+if __name__ == '__main__':
+    FLAGS(sys.argv)
+    FLAGS.fake_rabbit = True
+    serializers = ['json']
+    try:
+        import msgpack
+        serializers.append('msgpack')
+    except ImportError:
+        pass
+
+    for serializer in serializers:
+        for compact in (False, True):
+            elapsed = run(compact, serializer)
+            name = '%s %s' % (serializer,
+                              compact and 'compact' or 'legacy')
+            print '%-16s %8.3fs %10.1f msgs/sec' % (
+                    name, elapsed, FLAGS.count / elapsed)